@@ -5,25 +5,34 @@ try:
 except Exception:
     pass
 
-import io
+import fcntl
+import hmac
 import json
 import logging
+import mimetypes
 import os
+import queue
 import re
+import socket
+import tempfile
 import uuid
 import zipfile
+from urllib.parse import unquote
 from datetime import datetime, timedelta
 from pathlib import Path
 from typing import Optional
-from threading import Semaphore, Thread
+from collections import deque
+from contextlib import contextmanager
+from threading import Lock, Semaphore, Thread
 import time
 import shutil
 
-import numpy as np
 from flask import (
     Flask,
+    Response,
     abort,
     flash,
+    has_request_context,
     jsonify,
     redirect,
     render_template,
@@ -32,163 +41,103 @@ from flask import (
     send_from_directory,
     url_for,
     session,
+    stream_with_context,
 )
+from flask.sessions import SecureCookieSessionInterface
 from flask_cors import CORS
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
-from PIL import Image, ImageFilter
 from werkzeug.datastructures import FileStorage
+from werkzeug.security import safe_join
 from werkzeug.utils import secure_filename
 
-from proglog import ProgressBarLogger
-
-from moviepy.editor import CompositeVideoClip, VideoFileClip
-from moviepy.video.VideoClip import ColorClip
+from moviepy.editor import VideoFileClip
+from moviepy.video.io.ffmpeg_reader import ffmpeg_parse_infos
+
+from render_engine import (
+    ASPECT_OPTIONS,
+    DATE_FORMAT,
+    DEFAULT_MAX_BITRATE_KBPS,
+    HOST_MEMORY_BUDGET_MB,
+    JOB_MEMORY,
+    JOB_PROGRESS,
+    JOB_RENDERING_OUTPUT,
+    STYLE_LABELS,
+    STYLE_SHORT_LABELS,
+    JobCancelled,
+    MemoryBudgetExceeded,
+    mp4_layout,
+    receiving_marker,
+    append_summary,
+    build_encode_settings,
+    build_naming_config,
+    clear_job_progress,
+    discard_outputs,
+    encoder_status,
+    ensure_unique_name,
+    estimate_upload_memory,
+    is_cancelled,
+    job_context,
+    kill_job_processes,
+    load_summary,
+    memory_in_use_mb,
+    parse_base_overrides,
+    parse_bool,
+    prepare_base_info,
+    release_memory,
+    render_variants,
+    rendering_marker,
+    request_cancel,
+    reserve_memory,
+    sample_job_memory,
+    serialize_config,
+    start_memory_monitor,
+    update_job_progress,
+)
+from render_broker import RenderBroker
+from output_storage import create_output_storage, stored_names
 
-if not hasattr(Image, "ANTIALIAS"):
-    resample_filter = None
-    try:
-        resample_filter = Image.Resampling.LANCZOS  # Pillow >= 9.1
-    except AttributeError:
-        pass
-    if resample_filter is None:
-        resample_filter = getattr(Image, "LANCZOS", None)
-    if resample_filter is None:
-        resample_filter = getattr(Image, "BICUBIC", None)
-    if resample_filter is not None:
-        Image.ANTIALIAS = resample_filter
-        if hasattr(Image, "Resampling") and not hasattr(Image.Resampling, "ANTIALIAS"):
-            setattr(Image.Resampling, "ANTIALIAS", resample_filter)
 
 MAX_FILES_PER_BATCH = int(os.environ.get("MAX_FILES_PER_BATCH", "10"))
 MAX_UPLOAD_SIZE_BYTES = int(os.environ.get("MAX_UPLOAD_SIZE_BYTES", str(120 * 1024 * 1024)))
 
 ALLOWED_EXTENSIONS = {"mp4", "mov", "m4v", "mkv"}
-STYLE_LABELS = {
-    "blur": "Blurred background letterbox",
-    "fill": "Fill & crop",
-    "black": "Black background letterbox",
-}
-STYLE_SHORT_LABELS = {
-    "blur": "blur",
-    "fill": "fill",
-    "black": "black",
-}
-ASPECT_OPTIONS = {
-    "portrait": {
-        "label": "9:16 Portrait",
-        "short": "9x16",
-        "description": "Vertical stories / shorts",
-        "size": (1080, 1920),
-        "suffix": "1080x1920",
-    },
-    "four_five": {
-        "label": "4:5 Portrait",
-        "short": "4x5",
-        "description": "Feeds & portrait posts",
-        "size": (1080, 1350),
-        "suffix": "1080x1350",
-    },
-    "square": {
-        "label": "1:1 Square",
-        "short": "1x1",
-        "description": "Feeds & carousels",
-        "size": (1080, 1080),
-        "suffix": "1080x1080",
-    },
-    "landscape": {
-        "label": "16:9 Landscape",
-        "short": "16x9",
-        "description": "YouTube & players",
-        "size": (1920, 1080),
-        "suffix": "1920x1080",
-    },
-}
-SUMMARY_FILENAME = "batch_summary.json"
-PATTERN_PRESETS = {
-    "base_ratio": "{base_clean}_{ratio}",
-    "base_ratio_style": "{base_clean}__{ratio}__{style}",
-    "base_dash_ratio": "{base_clean}-{ratio}",
-    "base_style": "{base_clean}__{style}",
-}
-DEFAULT_PATTERN_KEY = "base_ratio"
-VIDEO_EXTENSIONS = {".mp4", ".mov", ".m4v", ".mkv"}
-DATE_FORMAT = "%Y-%m-%d"
-JOB_PROGRESS: dict[str, dict] = {}
-
-def update_job_progress(job_id: str, value: float, status: str = "processing") -> None:
-    JOB_PROGRESS[job_id] = {
-        "progress": max(0.0, min(1.0, value)),
-        "status": status,
-    }
+PARTIAL_POLL_SECONDS = 0.5
+PARTIAL_STALL_SECONDS = 300
+MAX_CLIP_SECONDS = 180
+# Raw-body uploads are written straight into UPLOAD_DIR in chunks of this size.
+STREAM_CHUNK_BYTES = 1024 * 1024
+# Non-MP4 containers are probed once this much has arrived (MKV keeps its duration up front).
+STREAM_PROBE_BYTES = 4 * 1024 * 1024
 
 
-def clear_job_progress(job_id: str) -> None:
-    JOB_PROGRESS.pop(job_id, None)
+class ClipTooLongError(Exception):
+    """Raised when the uploaded clip exceeds the permitted duration."""
 
 
-class JobProgressLogger(ProgressBarLogger):
-    def __init__(self, job_id: str, ratio_index: int, ratio_total: int):
-        super().__init__()
-        self.job_id = job_id
-        self.ratio_index = ratio_index
-        self.ratio_total = max(1, ratio_total)
+app = Flask(__name__)
 
-    def bars_callback(self, bar, attr, value, old_value=None):
-        bar_data = self.bars.get(bar)
-        if not bar_data:
-            return
-        total = bar_data.get("total") or 0
-        if total <= 0:
-            return
-        # attr == "index" gives frame count processed
-        if attr == "index":
-            fraction = min(1.0, value / total)
-            overall = (self.ratio_index + fraction) / self.ratio_total
-            update_job_progress(self.job_id, overall, "processing")
+# Hot polling, static and probe routes take a lean path: no session is loaded or written,
+# no usage bookkeeping runs and the rate limiter does not count them.
+LEAN_ROUTES = os.environ.get("LEAN_ROUTES", "1").lower() in {"1", "true", "yes", "on"}
+LEAN_PATH_PREFIXES = ("/progress/", "/static/", "/assets/")
+LEAN_PATHS = {"/health", "/ready"}
 
-    def callback(self, **changes):  # pragma: no cover - proglog internal usage
-        pass
 
-class ClipTooLongError(Exception):
-    """Raised when the uploaded clip exceeds the permitted duration."""
+def is_lean_path(path: str) -> bool:
+    return LEAN_ROUTES and (path in LEAN_PATHS or path.startswith(LEAN_PATH_PREFIXES))
 
-RESOLUTION_PATTERN = re.compile(
-    r"""
-    (?<!\w)                            # no word char before
-    [\(\[\{<_-]*\s*                    # optional wrappers
-    (?P<num1>\d{3,4})\s*
-    (?:x|×|\*|/|:|-|_|\.|\s+by\s+)\s*  # separators
-    (?P<num2>\d{3,4})\s*
-    (?:px)?\s*
-    [\)\]\}>_-]*                       # optional wrappers
-    (?!\w)                             # no word char after
-    """,
-    re.IGNORECASE | re.VERBOSE,
-)
-ASPECT_RATIO_PATTERN = re.compile(
-    r"""
-    (?<!\w)
-    [\(\[\{<_-]*\s*
-    (?:
-        (?:\d(?:\.\d+)?)\s*(?:x|×|:|/|\s+by\s+)\s*(?:\d(?:\.\d+)?)
-    )
-    \s*[\)\]\}>_-]*
-    (?!\w)
-    """,
-    re.IGNORECASE | re.VERBOSE,
-)
-ASPECT_WORD_PATTERN = re.compile(
-    r"(?<!\w)[\(\[\{<_-]*(portrait|vertical|landscape|square)[\)\]\}>_-]*(?!\w)",
-    re.IGNORECASE,
-)
 
+class LeanSessionInterface(SecureCookieSessionInterface):
+    """Cookie sessions, except that lean routes get a read-only empty session."""
 
-class SafeFormatDict(dict):
-    def __missing__(self, key):
-        return ""
+    def open_session(self, app, request):
+        if is_lean_path(request.path):
+            return None  # Flask substitutes a null session and never writes it back
+        return super().open_session(app, request)
 
-app = Flask(__name__)
+
+app.session_interface = LeanSessionInterface()
 
 # Load deployment-specific configuration
 try:
@@ -205,7 +154,7 @@ CORS(app, resources={
     r"/*": {
         "origins": app.config.get('CORS_ORIGINS', ['*']),
         "methods": ["GET", "POST", "OPTIONS"],
-        "allow_headers": ["Content-Type"]
+        "allow_headers": ["Content-Type", "X-Filename"]
     }
 })
 
@@ -241,6 +190,12 @@ limiter = Limiter(
     headers_enabled=True,
 )
 
+
+@limiter.request_filter
+def lean_request_exempt() -> bool:
+    return is_lean_path(request.path)
+
+
 # Session management - CRITICAL: Must set SECRET_KEY
 SECRET_KEY = os.environ.get("SECRET_KEY")
 if not SECRET_KEY:
@@ -267,6 +222,8 @@ from auth import init_session, reset_daily_counter, check_tier_usage, increment_
 @app.before_request
 def before_request():
     """Initialize session and reset daily counters"""
+    if is_lean_path(request.path):
+        return
     init_session()
     reset_daily_counter()
 
@@ -280,11 +237,195 @@ for directory in (UPLOAD_DIR, OUTPUT_DIR):
 
 app.config["UPLOAD_FOLDER"] = UPLOAD_DIR
 app.config["OUTPUT_FOLDER"] = OUTPUT_DIR
+# Where finished outputs are kept: the job folders themselves, or an S3-compatible bucket
+# (OUTPUT_STORAGE=s3). Job records, summaries and progress always stay in OUTPUT_DIR.
+OUTPUT_STORE = create_output_storage()
 
 # Concurrency control for video processing (MVP: max 2 concurrent jobs)
 MAX_CONCURRENT_JOBS = 2
 processing_semaphore = Semaphore(MAX_CONCURRENT_JOBS)
 
+# Render load tracking (feeds /capacity so the client can route browser vs server)
+RENDER_STATS_WINDOW = int(os.environ.get("RENDER_STATS_WINDOW", "50"))
+# Output-seconds rendered per wall-clock second, used until real samples exist
+DEFAULT_RENDER_SPEED = {"blur": 0.35, "fill": 0.8, "black": 0.9}
+ACTIVE_RENDERS: dict[str, dict] = {}
+QUEUED_RENDERS: dict[str, dict] = {}
+RENDER_HISTORY: deque = deque(maxlen=RENDER_STATS_WINDOW)
+_render_state_lock = Lock()
+
+
+def record_render_start(job_id: str, style: str, duration: Optional[float], ratio_count: int) -> None:
+    with _render_state_lock:
+        ACTIVE_RENDERS[job_id] = {
+            "style": style,
+            "duration": float(duration or 0.0),
+            "ratio_count": max(1, ratio_count),
+            "started_at": time.monotonic(),
+        }
+
+
+def record_render_finish(job_id: str, success: bool = True) -> None:
+    with _render_state_lock:
+        entry = ACTIVE_RENDERS.pop(job_id, None)
+        if not entry or not success or entry["duration"] <= 0:
+            return
+        elapsed = time.monotonic() - entry["started_at"]
+        if elapsed <= 0:
+            return
+        RENDER_HISTORY.append({
+            "style": entry["style"],
+            "output_seconds": entry["duration"] * entry["ratio_count"],
+            "elapsed": elapsed,
+        })
+
+
+def render_speed(style: str, history: Optional[list] = None) -> tuple[float, int]:
+    """Return (output-seconds per wall second, sample count) for a style."""
+    history = list(RENDER_HISTORY) if history is None else history
+    samples = [item for item in history if item["style"] == style]
+    total_elapsed = sum(item["elapsed"] for item in samples)
+    if not samples or total_elapsed <= 0:
+        return DEFAULT_RENDER_SPEED.get(style, DEFAULT_RENDER_SPEED["blur"]), 0
+    return sum(item["output_seconds"] for item in samples) / total_elapsed, len(samples)
+
+
+def estimate_render_seconds(style: str, duration: float, ratio_count: int, history: Optional[list] = None) -> float:
+    speed, _ = render_speed(style, history)
+    return max(0.0, duration) * max(1, ratio_count) / max(speed, 1e-3)
+
+
+def local_render_state() -> dict:
+    """This process's render load, in the same shape the render service publishes."""
+    now = time.monotonic()
+    with _render_state_lock:
+        active = [
+            {**{key: entry[key] for key in ("style", "duration", "ratio_count")}, "elapsed": now - entry["started_at"]}
+            for entry in ACTIVE_RENDERS.values()
+        ]
+        queued = [
+            {key: entry[key] for key in ("style", "duration", "ratio_count")}
+            for entry in QUEUED_RENDERS.values()
+        ]
+        history = list(RENDER_HISTORY)
+    return {
+        "slots": MAX_CONCURRENT_JOBS,
+        "active": active,
+        "queued": queued,
+        "history": history,
+        "memory": {"budget_mb": HOST_MEMORY_BUDGET_MB, "in_use_mb": memory_in_use_mb()},
+    }
+
+
+def current_render_state() -> dict:
+    if RENDER_MODE == "farm":
+        return render_farm_state()
+    if RENDER_MODE == "external":
+        return render_service_state()
+    return local_render_state()
+
+
+def get_capacity_snapshot(style: str, duration: float, ratio_count: int, state: Optional[dict] = None) -> dict:
+    state = state or current_render_state()
+    active, queued, history = state["active"], state["queued"], state["history"]
+
+    # Simulate the render slots: each slot frees up once its current job finishes,
+    # then queued jobs are assigned to the earliest free slot in FIFO order.
+    slot_free_at = []
+    for entry in active:
+        expected = estimate_render_seconds(entry["style"], entry["duration"], entry["ratio_count"], history)
+        slot_free_at.append(max(0.0, expected - entry["elapsed"]))
+    slot_free_at.extend([0.0] * max(0, state["slots"] - len(slot_free_at)))
+    slot_free_at.sort()
+    for entry in queued:
+        if not slot_free_at:
+            break
+        expected = estimate_render_seconds(entry["style"], entry["duration"], entry["ratio_count"], history)
+        slot_free_at[0] += expected
+        slot_free_at.sort()
+
+    predicted_wait = slot_free_at[0] if slot_free_at else 0.0
+    predicted_render = estimate_render_seconds(style, duration, ratio_count, history)
+    throughput = {}
+    for style_key in STYLE_LABELS:
+        speed, samples = render_speed(style_key, history)
+        throughput[style_key] = {"speed": round(speed, 3), "samples": samples}
+
+    return {
+        "slots": state["slots"],
+        "active_renders": len(active),
+        "queue_depth": len(queued),
+        "saturated": len(active) + len(queued) >= state["slots"],
+        "throughput": throughput,
+        "predicted_wait_seconds": round(predicted_wait, 1),
+        "predicted_render_seconds": round(predicted_render, 1),
+        "predicted_total_seconds": round(predicted_wait + predicted_render, 1),
+        "memory": {
+            "budget_mb": round(state["memory"]["budget_mb"]),
+            "in_use_mb": round(state["memory"]["in_use_mb"]),
+        },
+    }
+
+
+# Readiness (/ready) and load shedding: new server work is refused before its upload
+# starts once renders are queued this deep behind busy slots, or the host cannot render.
+READY_MAX_QUEUE = int(os.environ.get("READY_MAX_QUEUE", str(MAX_CONCURRENT_JOBS)))
+READY_MIN_FREE_MB = float(os.environ.get("READY_MIN_FREE_MB", "2048"))
+
+
+def readiness_report() -> dict:
+    """Saturation, queue depth, disk headroom and encoder availability of this instance."""
+    state = current_render_state()
+    snapshot = get_capacity_snapshot("blur", 0.0, 1, state)
+    busy = snapshot["active_renders"] + snapshot["queue_depth"]
+    disk = {}
+    for name, directory in (("uploads", UPLOAD_DIR), ("outputs", OUTPUT_DIR)):
+        disk[name] = round(shutil.disk_usage(directory).free / (1024 * 1024))
+    memory = snapshot["memory"]
+    checks = {
+        "render": {
+            "ok": state["slots"] > 0 and busy < state["slots"] + READY_MAX_QUEUE,
+            "slots": state["slots"],
+            "active": snapshot["active_renders"],
+            "queued": snapshot["queue_depth"],
+            "max_queue": READY_MAX_QUEUE,
+        },
+        "memory": {"ok": memory["in_use_mb"] < memory["budget_mb"], **memory},
+        "disk": {"ok": min(disk.values()) >= READY_MIN_FREE_MB, "free_mb": disk, "min_free_mb": READY_MIN_FREE_MB},
+        "encoder": encoder_status(),
+    }
+    if not (checks["disk"]["ok"] and checks["encoder"]["ok"]):
+        status = "unavailable"
+    elif not (checks["render"]["ok"] and checks["memory"]["ok"]):
+        status = "busy"
+    else:
+        status = "ready"
+    return {
+        "status": status,
+        "saturated": snapshot["saturated"],
+        "queue_depth": snapshot["queue_depth"],
+        "retry_after_seconds": max(5, round(snapshot["predicted_wait_seconds"])),
+        "checks": checks,
+    }
+
+
+def shed_load():
+    """503 for new server work when this instance is not ready, answered before the upload is read."""
+    report = readiness_report()
+    if report["status"] == "ready":
+        return None
+    if report["status"] == "busy":
+        message = "Server is busy. Please try again shortly."
+    else:
+        message = "Server cannot render right now. Please try again later."
+    response = jsonify({"error": message, "readiness": report})
+    response.status_code = 503
+    response.headers["Retry-After"] = str(report["retry_after_seconds"])
+    return response
+
+
+start_memory_monitor()
+
 # Cleanup worker configuration
 CLEANUP_INTERVAL_HOURS = 1  # Run cleanup every hour
 CLEANUP_MAX_AGE_HOURS = int(os.environ.get("AUTO_CLEANUP_HOURS", 1))  # Delete files older than 1 hour
@@ -339,6 +480,14 @@ def cleanup_old_files():
                     except Exception as e:
                         logger.warning(f"Failed to delete output directory {job_dir}: {e}")
 
+            # Outputs kept in an object store expire on the same schedule
+            try:
+                swept, swept_bytes = OUTPUT_STORE.sweep(cutoff_time.timestamp())
+                deleted_files += swept
+                freed_bytes += swept_bytes
+            except Exception as e:
+                logger.warning(f"Failed to sweep stored outputs: {e}")
+
             if deleted_files > 0:
                 freed_mb = freed_bytes / (1024 * 1024)
                 logger.info(f"Cleanup completed: {deleted_files} items deleted, {freed_mb:.1f} MB freed")
@@ -388,387 +537,732 @@ def stop_cleanup_worker():
 start_cleanup_worker()
 
 
-@app.context_processor
-def inject_config():
-    """Inject configuration variables into templates"""
-    return {
-        "ADS_CLIENT": os.environ.get("ADS_CLIENT"),
-        "ADS_SLOT_TOP": os.environ.get("ADS_SLOT_TOP"),
-        "ADS_SLOT_BOTTOM": os.environ.get("ADS_SLOT_BOTTOM"),
-        "ADS_SLOT_HERO": os.environ.get("ADS_SLOT_HERO"),
-        "ADS_SLOT_INLINE": os.environ.get("ADS_SLOT_INLINE"),
-        "ADS_REWARDED_SLOT": os.environ.get("ADS_REWARDED_SLOT"),
-        "HOSTINGER_API_URL": app.config.get("BACKEND_API_URL", ""),
-        "CLIENT_DURATION_LIMIT": app.config.get("CLIENT_DURATION_LIMIT_SECONDS", 75),
-    }
+# Background render workers. Tasks for the same job run one after another (they
+# share the job's summary and sequence numbers); different jobs run in parallel
+# up to MAX_CONCURRENT_JOBS, sharing processing_semaphore with /api/process.
+_render_queue: "queue.Queue[str]" = queue.Queue()
+_job_tasks: dict[str, deque] = {}
+_render_threads: list[Thread] = []
 
 
-def allowed_file(filename: str) -> bool:
-    return "." in filename and filename.rsplit(".", 1)[1].lower() in ALLOWED_EXTENSIONS
+def submit_render(
+    job_id: str,
+    task,
+    *,
+    style: str,
+    duration: Optional[float],
+    ratio_count: int,
+    memory_mb: float,
+) -> str:
+    task_id = uuid.uuid4().hex
+    with _render_state_lock:
+        QUEUED_RENDERS[task_id] = {
+            "job_id": job_id,
+            "style": style,
+            "duration": float(duration or 0.0),
+            "ratio_count": max(1, ratio_count),
+            "memory_mb": memory_mb,
+            "queued_at": time.monotonic(),
+        }
+        pending = _job_tasks.get(job_id)
+        if pending is not None:
+            pending.append((task_id, task))
+            return task_id
+        _job_tasks[job_id] = deque([(task_id, task)])
+    _render_queue.put(job_id)
+    return task_id
 
 
-def strip_known_extensions(name: str) -> str:
-    base = name
+def render_worker():
+    logger = logging.getLogger(__name__)
     while True:
-        stem, suffix = os.path.splitext(base)
-        if suffix.lower() in VIDEO_EXTENSIONS and stem:
-            base = stem
+        job_id = _render_queue.get()
+        while True:
+            with _render_state_lock:
+                pending = _job_tasks.get(job_id)
+                if not pending:
+                    _job_tasks.pop(job_id, None)
+                    break
+                task_id, task = pending.popleft()
+            with processing_semaphore:
+                with _render_state_lock:
+                    memory_mb = QUEUED_RENDERS.get(task_id, {}).get("memory_mb", 0.0)
+                # Holding a slot, wait until the host also has memory for this render; /capacity
+                # keeps counting it as queued until then, as it is not rendering yet.
+                reserve_memory(job_id, memory_mb)
+                with _render_state_lock:
+                    QUEUED_RENDERS.pop(task_id, None)
+                try:
+                    task()
+                except Exception:
+                    logger.exception("Background render failed for job %s", job_id)
+                finally:
+                    release_memory(job_id)
+        _render_queue.task_done()
+
+
+def start_render_workers():
+    """Start the background render threads"""
+    if _render_threads:
+        return
+
+    for index in range(MAX_CONCURRENT_JOBS):
+        thread = Thread(target=render_worker, daemon=True, name=f"RenderWorker-{index + 1}")
+        thread.start()
+        _render_threads.append(thread)
+    logging.info("Started %d render worker threads", MAX_CONCURRENT_JOBS)
+
+
+# Where renders run. "inline" uses the render threads above inside each web worker.
+# "external" keeps web workers pure I/O (run them with an async worker class such as
+# gevent) and hands renders to `flask --app app render-service` through a spool
+# directory; progress and load come back as small JSON files next to the outputs.
+RENDER_MODE = os.environ.get("RENDER_MODE", "inline")
+RENDER_QUEUE_DIR = Path(os.environ.get("RENDER_QUEUE_DIR", "render_queue"))
+RENDER_SERVICE_POLL_SECONDS = float(os.environ.get("RENDER_SERVICE_POLL_SECONDS", "0.5"))
+RENDER_SERVICE_STALE_SECONDS = 30
+SERVICE_HEARTBEAT_SECONDS = 5.0
+# Sync /process and /api/process calls stop waiting on the render service or farm after the
+# queue allowance plus RENDER_WAIT_FACTOR times the estimated render of the file.
+RENDER_WAIT_QUEUE_SECONDS = float(os.environ.get("RENDER_WAIT_QUEUE_SECONDS", "600"))
+RENDER_WAIT_FACTOR = 4.0
+PROGRESS_FILENAME = "progress.json"
+SERVICE_ID = f"{socket.gethostname()}-{os.getpid()}"
+# "farm" scales renders out to any number of hosts: `python render_node.py` processes lease
+# tasks from a SQLite broker owned by the web node and move inputs/outputs over HTTP.
+RENDER_FARM_DB = Path(os.environ.get("RENDER_FARM_DB", str(RENDER_QUEUE_DIR / "farm.sqlite3")))
+RENDER_FARM_TOKEN = os.environ.get("RENDER_FARM_TOKEN", "")
+RENDER_FARM_LEASE_SECONDS = float(os.environ.get("RENDER_FARM_LEASE_SECONDS", "60"))
+farm_broker = RenderBroker(RENDER_FARM_DB, RENDER_FARM_LEASE_SECONDS) if RENDER_MODE == "farm" else None
+
+
+def write_json_atomic(path: Path, data, indent: Optional[int] = None) -> None:
+    # Write-then-rename so readers in other processes never see a torn file
+    tmp_path = path.with_name(f".{path.name}.{uuid.uuid4().hex}")
+    tmp_path.write_text(json.dumps(data, indent=indent))
+    os.replace(tmp_path, path)
+
+
+def enqueue_job_file(
+    job_id: str,
+    index: int,
+    upload_target: Path,
+    duration: Optional[float],
+    style: str,
+    ratios: list[str],
+) -> None:
+    """Queue the render of one stored upload, here, on the render service or on the farm."""
+    memory_mb = estimate_upload_memory(upload_target, ratios, style)
+    if RENDER_MODE == "farm":
+        update_job_file(job_id, index, upload=str(upload_target.resolve()))
+        farm_broker.enqueue(job_id, index, {
+            "upload_target": str(upload_target.resolve()),
+            "duration": duration,
+            "style": style,
+            "ratio_count": max(1, len(ratios)),
+            "memory_mb": memory_mb,
+        })
+        return
+    if RENDER_MODE != "external":
+        # Remember who renders it, so another worker can resume it if this one dies.
+        update_job_file(job_id, index, upload=str(upload_target.resolve()), worker=SERVICE_ID)
+        submit_render(
+            job_id,
+            lambda: run_job_file(job_id, index, upload_target, duration),
+            style=style,
+            duration=duration,
+            ratio_count=len(ratios),
+            memory_mb=memory_mb,
+        )
+        return
+    pending_dir = RENDER_QUEUE_DIR / "pending"
+    pending_dir.mkdir(parents=True, exist_ok=True)
+    task = {
+        "job_id": job_id,
+        "index": index,
+        "upload_target": str(upload_target.resolve()),
+        "duration": duration,
+        "style": style,
+        "ratio_count": max(1, len(ratios)),
+        "memory_mb": memory_mb,
+    }
+    # Nanosecond prefix keeps the spool FIFO when the service lists it.
+    write_json_atomic(pending_dir / f"{time.time_ns()}_{job_id}_{index}.json", task)
+
+
+def claim_render_task() -> Optional[tuple[Path, dict]]:
+    """Move the oldest pending task into claimed/; the rename is atomic, so one service wins it."""
+    claimed_dir = RENDER_QUEUE_DIR / "claimed"
+    claimed_dir.mkdir(parents=True, exist_ok=True)
+    for path in sorted((RENDER_QUEUE_DIR / "pending").glob("*.json")):
+        job_id = path.stem.split("_", 1)[1].rsplit("_", 1)[0]
+        # Files of one job must render in order, so leave it to whichever service already has one.
+        if any(not claim.name.startswith(f"{SERVICE_ID}__") for claim in claimed_dir.glob(f"*_{job_id}_*.json")):
+            continue
+        target = claimed_dir / f"{SERVICE_ID}__{path.name}"
+        try:
+            os.rename(path, target)
+            os.utime(target)  # the claim's mtime starts its owner's heartbeat grace
+        except FileNotFoundError:
+            continue
+        try:
+            return target, json.loads(target.read_text())
+        except (OSError, json.JSONDecodeError):
+            logging.warning("Dropping unreadable render task %s", path.name)
+            target.unlink(missing_ok=True)
+    return None
+
+
+def service_heartbeat_fresh(service_id: str, since: float = 0.0) -> bool:
+    """Whether a render service published services/<id>.json recently; ``since`` (when work was handed
+    to it) gives a new owner the same grace before its first heartbeat."""
+    try:
+        updated_at = json.loads((RENDER_QUEUE_DIR / "services" / f"{service_id}.json").read_text())["updated_at"]
+    except (OSError, KeyError, TypeError, json.JSONDecodeError):
+        updated_at = 0.0
+    return time.time() - max(updated_at, since) <= RENDER_SERVICE_STALE_SECONDS
+
+
+def requeue_orphaned_tasks(own: bool = False) -> None:
+    """Return claimed tasks to the spool when their render service stopped publishing its heartbeat.
+
+    With ``own`` (at service startup) this SERVICE_ID's claims go back too: a restarted
+    container keeps its hostname and PID, so they belong to the previous run.
+    """
+    for claim in (RENDER_QUEUE_DIR / "claimed").glob("*__*.json"):
+        owner, name = claim.name.split("__", 1)
+        if owner == SERVICE_ID:
+            if not own:
+                continue
         else:
-            break
-    return base
-
-
-def remove_naming_tokens(text: str) -> str:
-    cleaned = text
-    prev = None
-    while prev != cleaned:
-        prev = cleaned
-        cleaned = RESOLUTION_PATTERN.sub(" ", cleaned)
-    prev = None
-    while prev != cleaned:
-        prev = cleaned
-        cleaned = ASPECT_RATIO_PATTERN.sub(" ", cleaned)
-    prev = None
-    while prev != cleaned:
-        prev = cleaned
-        cleaned = ASPECT_WORD_PATTERN.sub(" ", cleaned)
-    cleaned = re.sub(r"[._\-]{2,}", " ", cleaned)
-    cleaned = re.sub(r"\s+", " ", cleaned)
-    return cleaned.strip()
-
-
-def sanitize_component(text: str) -> str:
-    sanitized = re.sub(r"[^A-Za-z0-9._-]+", "_", text)
-    sanitized = re.sub(r"_+", "_", sanitized)
-    sanitized = sanitized.strip("_-. ")
-    return sanitized
-
-
-def clean_stub(original_name: str, *, keep_tokens: bool = False) -> str:
-    base = strip_known_extensions(original_name)
-    base = base.strip()
-    if not keep_tokens:
-        base = remove_naming_tokens(base)
-    base = sanitize_component(base)
-    return base or "clip"
-
-
-def sanitize_filename(candidate: str, *, ext: str) -> str:
-    name, current_ext = os.path.splitext(candidate)
-    if not name:
-        name = "clip"
-    name = re.sub(r"[^A-Za-z0-9._-]+", "_", name)
-    name = re.sub(r"_{2,}", "__", name)
-    name = re.sub(r"-{2,}", "--", name)
-    name = re.sub(r"\s+", "_", name)
-    name = name.strip("_-.")
-    if not name:
-        name = "clip"
-    full_ext = f".{ext.lstrip('.')}" if ext else current_ext
-    full_name = f"{name}{full_ext}"
-    if len(full_name) > 120:
-        max_name_len = 120 - len(full_ext)
-        name = name[: max(1, max_name_len)]
-        full_name = f"{name}{full_ext}"
-    return full_name
-
-
-def ensure_unique_name(directory: Path, filename: str) -> str:
-    base, ext = os.path.splitext(filename)
-    counter = 1
-    candidate = filename
-    while (directory / candidate).exists():
-        candidate = f"{base}__{counter:03d}{ext}"
-        counter += 1
-    return candidate
-
-
-def parse_bool(value, default: bool = False) -> bool:
-    if value is None:
-        return default
-    return str(value).strip().lower() in {"1", "true", "yes", "y", "on"}
-
-
-def parse_base_overrides(raw_value: Optional[str]) -> dict[str, str]:
-    if not raw_value:
-        return {}
+            try:
+                claimed_at = claim.stat().st_mtime
+            except FileNotFoundError:
+                continue
+            if service_heartbeat_fresh(owner, claimed_at):
+                continue
+        try:
+            os.replace(claim, RENDER_QUEUE_DIR / "pending" / name)
+        except FileNotFoundError:
+            continue  # another render service requeued it first
+        logging.info("Requeued render task %s from stopped render service %s", name, owner)
+
+
+def run_claimed_task(claim_path: Path, task: dict) -> None:
     try:
-        data = json.loads(raw_value)
-    except json.JSONDecodeError:
-        logging.warning("Failed to parse base overrides payload")
-        return {}
-    if not isinstance(data, dict):
-        return {}
-    cleaned: dict[str, str] = {}
-    for key, value in data.items():
-        if not isinstance(key, str) or value is None:
+        run_job_file(task["job_id"], task["index"], Path(task["upload_target"]), task.get("duration"))
+    finally:
+        claim_path.unlink(missing_ok=True)
+
+
+def publish_render_state(published: dict[str, dict]) -> dict[str, dict]:
+    """Write per-job progress and this service's load where the web workers can read them."""
+    current = {
+        job_id: {**entry, "rendering": JOB_RENDERING_OUTPUT.get(job_id)}
+        for job_id, entry in list(JOB_PROGRESS.items())
+    }
+    for job_id, entry in current.items():
+        job_dir = OUTPUT_DIR / job_id
+        if published.get(job_id) != entry and job_dir.is_dir():
+            write_json_atomic(job_dir / PROGRESS_FILENAME, entry)
+    for job_id in published.keys() - current.keys():
+        (OUTPUT_DIR / job_id / PROGRESS_FILENAME).unlink(missing_ok=True)
+
+    publish_service_heartbeat()
+    return current
+
+
+def publish_service_heartbeat() -> None:
+    """Write this process's load and a fresh ``updated_at`` to services/<SERVICE_ID>.json."""
+    services_dir = RENDER_QUEUE_DIR / "services"
+    services_dir.mkdir(parents=True, exist_ok=True)
+    write_json_atomic(services_dir / f"{SERVICE_ID}.json", {**local_render_state(), "updated_at": time.time()})
+
+
+def combine_render_states(services: list[dict], pending: list[dict]) -> dict:
+    """Sum the published load of render services/nodes and add tasks nobody has picked up yet."""
+    state = {
+        "slots": 0,
+        "active": [],
+        "queued": [],
+        "history": [],
+        "memory": {"budget_mb": 0.0, "in_use_mb": 0.0},
+    }
+    for service in services:
+        state["slots"] += service["slots"]
+        state["active"] += service["active"]
+        state["queued"] += service["queued"]
+        state["history"] += service["history"]
+        state["memory"]["budget_mb"] += service["memory"]["budget_mb"]
+        state["memory"]["in_use_mb"] += service["memory"]["in_use_mb"]
+    for task in pending:
+        state["queued"].append({key: task[key] for key in ("style", "duration", "ratio_count")})
+    for entry in state["queued"]:
+        entry["duration"] = float(entry["duration"] or 0.0)
+    return state
+
+
+def render_service_state() -> dict:
+    """Combined load of every live render service plus tasks still waiting in the spool."""
+    services = []
+    for path in (RENDER_QUEUE_DIR / "services").glob("*.json"):
+        try:
+            service = json.loads(path.read_text())
+        except (OSError, json.JSONDecodeError):
+            continue
+        if time.time() - service.get("updated_at", 0) <= RENDER_SERVICE_STALE_SECONDS:
+            services.append(service)
+    pending = []
+    for path in sorted((RENDER_QUEUE_DIR / "pending").glob("*.json")):
+        try:
+            pending.append(json.loads(path.read_text()))
+        except (OSError, json.JSONDecodeError):
             continue
-        cleaned[str(key)] = str(value)
-    return cleaned
+    return combine_render_states(services, pending)
 
 
-def build_naming_config(job_id: str, form) -> dict:
-    summary = load_summary(job_id)
-    summary_config = summary.get("config") or {}
+def render_farm_state() -> dict:
+    """Combined load reported by live render nodes plus tasks waiting in the broker."""
+    return combine_render_states(farm_broker.nodes(RENDER_SERVICE_STALE_SECONDS), farm_broker.pending())
 
-    mode_value = (form.get("naming_mode") if form else None) or summary_config.get("mode", "auto")
-    mode_value = "custom" if mode_value == "custom" else "auto"
 
-    date_stamp = summary_config.get("date_stamp") or datetime.utcnow().strftime(DATE_FORMAT)
+def run_render_service() -> None:
+    """Render loop for RENDER_MODE=external: pull spooled tasks into the local render workers."""
+    (RENDER_QUEUE_DIR / "pending").mkdir(parents=True, exist_ok=True)
+    (RENDER_QUEUE_DIR / "claimed").mkdir(parents=True, exist_ok=True)
+    requeue_orphaned_tasks(own=True)
+    published = publish_render_state({})
+    start_render_workers()
+    start_abandoned_job_watchdog()
+    logging.info("Render service %s polling %s", SERVICE_ID, RENDER_QUEUE_DIR)
+    orphans_checked = time.monotonic()
+    while True:
+        if time.monotonic() - orphans_checked >= RENDER_SERVICE_STALE_SECONDS:
+            requeue_orphaned_tasks()
+            orphans_checked = time.monotonic()
+        with _render_state_lock:
+            backlog = len(QUEUED_RENDERS)
+        # Only claim what can start soon, so other render services get the rest.
+        while backlog < MAX_CONCURRENT_JOBS:
+            claimed = claim_render_task()
+            if not claimed:
+                break
+            claim_path, task = claimed
+            submit_render(
+                task["job_id"],
+                lambda claim_path=claim_path, task=task: run_claimed_task(claim_path, task),
+                style=task["style"],
+                duration=task.get("duration"),
+                ratio_count=task["ratio_count"],
+                memory_mb=task.get("memory_mb", 0.0),
+            )
+            backlog += 1
+        published = publish_render_state(published)
+        time.sleep(RENDER_SERVICE_POLL_SECONDS)
 
-    if mode_value == "auto":
-        return {
-            "mode": "auto",
-            "pattern_choice": DEFAULT_PATTERN_KEY,
-            "pattern": PATTERN_PRESETS[DEFAULT_PATTERN_KEY],
-            "custom_pattern": "",
-            "auto_clean": True,
-            "keep_tokens": False,
-            "add_sequence": False,
-            "append_date": False,
-            "label_mode": "short",
-            "date_stamp": date_stamp,
-        }
 
-    pattern_choice = form.get("naming_preset") if form else None
-    if not pattern_choice:
-        pattern_choice = summary_config.get("pattern_choice", DEFAULT_PATTERN_KEY)
-    if pattern_choice not in PATTERN_PRESETS and pattern_choice != "custom":
-        pattern_choice = DEFAULT_PATTERN_KEY
+@app.cli.command("render-service")
+def render_service_command():
+    """Run renders queued by web workers started with RENDER_MODE=external."""
+    run_render_service()
 
-    custom_pattern = (form.get("naming_custom_pattern") if form else None) or summary_config.get("custom_pattern", "")
-    custom_pattern = custom_pattern.strip()
 
-    auto_clean = parse_bool(form.get("naming_auto_clean"), summary_config.get("auto_clean", True))
-    keep_tokens = parse_bool(form.get("naming_keep_tokens"), summary_config.get("keep_tokens", False))
-    if keep_tokens:
-        auto_clean = False
+def job_progress_state(job_id: str) -> tuple[Optional[dict], Optional[str]]:
+    """(progress entry, output being encoded) from this process or the render service."""
+    entry = JOB_PROGRESS.get(job_id)
+    if entry or RENDER_MODE == "inline":
+        return entry, JOB_RENDERING_OUTPUT.get(job_id)
+    if not is_valid_job_id(job_id):
+        return None, None
+    try:
+        published = json.loads((OUTPUT_DIR / job_id / PROGRESS_FILENAME).read_text())
+    except (OSError, json.JSONDecodeError):
+        return None, None
+    rendering = published.pop("rendering", None)
+    return published, rendering
+
+
+# Cancellation. The page's own pollers (/progress, and batch status with ?watch=1) stamp the
+# job folder; a job whose watchers have all gone quiet for ABANDONED_JOB_SECONDS is cancelled
+# like an explicit POST /jobs/<id>/cancel. API clients and bookmarked /jobs/<id> pages never
+# stamp it, so their jobs keep rendering however rarely they check back.
+ABANDONED_JOB_SECONDS = float(os.environ.get("ABANDONED_JOB_SECONDS", "120"))
+WATCHED_FILENAME = ".watched"
+# Polls refresh the marker at most this often per job and worker, well inside the abandon window.
+WATCHED_TOUCH_SECONDS = min(5.0, ABANDONED_JOB_SECONDS / 4)
+_watched_at: dict[str, float] = {}
+_watchdog_thread: Optional[Thread] = None
+_heartbeat_thread: Optional[Thread] = None
+
+
+def mark_watched(job_id: str) -> None:
+    now = time.monotonic()
+    last = _watched_at.get(job_id)
+    if last is not None and now - last < WATCHED_TOUCH_SECONDS:
+        return
+    job_dir = OUTPUT_DIR / job_id
+    if is_valid_job_id(job_id) and job_dir.is_dir():
+        (job_dir / WATCHED_FILENAME).touch()
+        if len(_watched_at) > 1024:
+            _watched_at.clear()
+        _watched_at[job_id] = now
+
+
+def drop_queued_renders(job_id: str) -> int:
+    """Remove a job's renders that have not started yet, here or in the spool."""
+    with _render_state_lock:
+        pending = _job_tasks.get(job_id)
+        task_ids = [task_id for task_id, _ in pending] if pending else []
+        if pending:
+            pending.clear()
+        for task_id in task_ids:
+            QUEUED_RENDERS.pop(task_id, None)
+    dropped = len(task_ids)
+    if farm_broker is not None:
+        dropped += farm_broker.drop_job(job_id)
+    for path in (RENDER_QUEUE_DIR / "pending").glob(f"*_{job_id}_*.json"):
+        path.unlink(missing_ok=True)
+        dropped += 1
+    return dropped
+
+
+def cancel_job(job_id: str) -> Optional[dict]:
+    """Stop a job: kill its running encode, drop its queued files and delete partial uploads."""
+    request_cancel(OUTPUT_DIR / job_id)
+    # Renders in this process die now; the render service notices the marker within a second.
+    kill_job_processes(job_id)
+    drop_queued_renders(job_id)
+    with job_record_lock(job_id):
+        record = load_job_record(job_id)
+        if record:
+            for entry in record.get("files", []):
+                if entry.get("status") not in JOB_FILE_TERMINAL_STATUSES:
+                    entry["status"] = "cancelled"
+            record["status"] = derive_job_status(record["files"])
+            save_job_record(job_id, record)
+    for upload in app.config["UPLOAD_FOLDER"].glob(f"{job_id}_*"):
+        upload.unlink(missing_ok=True)
+    logging.info("Cancelled job %s", job_id)
+    return record
+
+
+def is_job_active(job_id: str) -> bool:
+    if job_id in JOB_PROGRESS:
+        return True
+    record = load_job_record(job_id)
+    return bool(record) and record.get("status") in ("uploading", "processing")
+
+
+def cancel_abandoned_jobs() -> None:
+    cutoff = time.time() - ABANDONED_JOB_SECONDS
+    for watched in OUTPUT_DIR.glob(f"*/{WATCHED_FILENAME}"):
+        job_dir = watched.parent
+        try:
+            if watched.stat().st_mtime > cutoff:
+                continue
+        except FileNotFoundError:
+            continue
+        if is_cancelled(job_dir) or not is_job_active(job_dir.name):
+            continue
+        logging.info("Nobody is watching job %s any more", job_dir.name)
+        cancel_job(job_dir.name)
 
-    add_sequence = parse_bool(form.get("naming_add_sequence"), summary_config.get("add_sequence", True))
-    append_date = parse_bool(form.get("naming_append_date"), summary_config.get("append_date", True))
 
-    label_mode = (form.get("naming_label_mode") if form else None) or summary_config.get("label_mode", "short")
-    if label_mode not in {"short", "friendly"}:
-        label_mode = "short"
+def abandoned_job_watchdog():
+    while True:
+        time.sleep(min(5.0, ABANDONED_JOB_SECONDS / 4))
+        try:
+            cancel_abandoned_jobs()
+        except Exception:  # pragma: no cover - keep watching
+            logging.exception("Abandoned job check failed")
 
-    if pattern_choice == "custom" and custom_pattern:
-        pattern = custom_pattern
-    else:
-        pattern = PATTERN_PRESETS.get(pattern_choice, PATTERN_PRESETS[DEFAULT_PATTERN_KEY])
 
-    return {
-        "mode": "custom",
-        "pattern_choice": pattern_choice,
-        "pattern": pattern,
-        "custom_pattern": custom_pattern,
-        "auto_clean": auto_clean,
-        "keep_tokens": keep_tokens,
-        "add_sequence": add_sequence,
-        "append_date": append_date,
-        "label_mode": label_mode,
-        "date_stamp": date_stamp,
-    }
+def start_abandoned_job_watchdog():
+    """Run next to the render workers; ABANDONED_JOB_SECONDS=0 disables auto-cancel."""
+    global _watchdog_thread
+    if _watchdog_thread is not None or ABANDONED_JOB_SECONDS <= 0:
+        return
+    _watchdog_thread = Thread(target=abandoned_job_watchdog, daemon=True, name="AbandonedJobWatchdog")
+    _watchdog_thread.start()
 
 
-def serialize_config(config: dict) -> dict:
-    keys = (
-        "mode",
-        "pattern_choice",
-        "pattern",
-        "custom_pattern",
-        "auto_clean",
-        "keep_tokens",
-        "add_sequence",
-        "append_date",
-        "label_mode",
-        "date_stamp",
-    )
-    return {key: config.get(key) for key in keys if key in config}
+def resume_interrupted_renders(own: bool = False) -> None:
+    """Re-queue files whose web worker died mid-render (timeout, recycle, lost host); they continue from their checkpoint.
 
+    Owners are judged by their services/<id>.json heartbeat. With ``own`` (at worker startup)
+    files carrying this SERVICE_ID are resumed too: a restarted container reuses hostname and PIDs.
+    """
+    for record_path in sorted(OUTPUT_DIR.glob(f"*/{JOB_RECORD_FILENAME}")):
+        job_id = record_path.parent.name
+        if not is_valid_job_id(job_id) or is_cancelled(record_path.parent):
+            continue
+        resumed = []
+        with job_record_lock(job_id):
+            record = load_job_record(job_id)
+            if not record:
+                continue
+            changed = False
+            for entry in record.get("files", []):
+                owner = entry.get("worker")
+                if entry.get("status") not in ("queued", "processing") or not owner:
+                    continue
+                if owner == SERVICE_ID and not own:
+                    continue
+                if owner != SERVICE_ID and service_heartbeat_fresh(owner):
+                    continue
+                changed = True
+                if not Path(entry.get("upload", "")).is_file():
+                    entry["status"] = "error"
+                    entry["error"] = "The render was interrupted and its upload is gone."
+                    continue
+                entry["status"] = "queued"
+                entry["worker"] = SERVICE_ID
+                resumed.append(entry)
+            if changed:
+                record["status"] = derive_job_status(record["files"])
+                save_job_record(job_id, record)
+        for entry in resumed:
+            logging.info("Resuming interrupted render %s/%s", job_id, entry["index"])
+            enqueue_job_file(
+                job_id, entry["index"], Path(entry["upload"]), entry.get("duration"), record["style"], record["ratios"]
+            )
 
-def prepare_base_info(original_name: str, override: Optional[str], config: dict) -> dict:
-    source_name = override.strip() if override else original_name
-    base_candidate = strip_known_extensions(source_name)
-    base_candidate = base_candidate.strip()
-    sanitized_base = sanitize_component(base_candidate) or "clip"
-    if config.get("auto_clean", True) and not config.get("keep_tokens", False):
-        base_clean = clean_stub(base_candidate, keep_tokens=False)
-    else:
-        base_clean = sanitized_base
-    if not base_clean:
-        base_clean = "clip"
+
+def prune_service_heartbeats() -> None:
+    """Forget services/*.json of processes gone for an hour; inline workers recycle often."""
+    cutoff = time.time() - 3600
+    for path in (RENDER_QUEUE_DIR / "services").glob("*.json"):
+        try:
+            if path.stat().st_mtime < cutoff:
+                path.unlink()
+        except FileNotFoundError:
+            continue
+
+
+def service_heartbeat():
+    """Inline workers: keep this worker's heartbeat fresh and take over renders of workers that lost theirs."""
+    resumed_at = time.monotonic()
+    while True:
+        time.sleep(SERVICE_HEARTBEAT_SECONDS)
+        try:
+            publish_service_heartbeat()
+            if time.monotonic() - resumed_at >= RENDER_SERVICE_STALE_SECONDS:
+                resume_interrupted_renders()
+                prune_service_heartbeats()
+                resumed_at = time.monotonic()
+        except Exception:  # pragma: no cover - keep beating
+            logging.exception("Render heartbeat failed")
+
+
+def start_service_heartbeat():
+    global _heartbeat_thread
+    if _heartbeat_thread is not None:
+        return
+    publish_service_heartbeat()
+    _heartbeat_thread = Thread(target=service_heartbeat, daemon=True, name="ServiceHeartbeat")
+    _heartbeat_thread.start()
+
+
+if RENDER_MODE == "inline":
+    start_render_workers()
+if RENDER_MODE != "external":
+    start_abandoned_job_watchdog()
+
+
+@app.context_processor
+def inject_config():
+    """Inject configuration variables into templates"""
     return {
-        "base": sanitized_base,
-        "base_clean": base_clean,
-        "original_filename": original_name,
+        "ADS_CLIENT": os.environ.get("ADS_CLIENT"),
+        "ADS_SLOT_TOP": os.environ.get("ADS_SLOT_TOP"),
+        "ADS_SLOT_BOTTOM": os.environ.get("ADS_SLOT_BOTTOM"),
+        "ADS_SLOT_HERO": os.environ.get("ADS_SLOT_HERO"),
+        "ADS_SLOT_INLINE": os.environ.get("ADS_SLOT_INLINE"),
+        "ADS_REWARDED_SLOT": os.environ.get("ADS_REWARDED_SLOT"),
+        "HOSTINGER_API_URL": app.config.get("BACKEND_API_URL", ""),
+        "CLIENT_DURATION_LIMIT": app.config.get("CLIENT_DURATION_LIMIT_SECONDS", 120),
+        "DEFAULT_MAX_BITRATE_KBPS": DEFAULT_MAX_BITRATE_KBPS,
     }
 
 
-def generate_output_filename(
-    base_info: dict,
-    aspect_key: str,
-    style_key: str,
-    config: dict,
-    seq_number: Optional[int],
-    ext: str,
-    output_dir: Path,
-) -> tuple[str, dict]:
-    ratio_meta = ASPECT_OPTIONS.get(aspect_key, {})
-    style_long = STYLE_LABELS.get(style_key, style_key)
-    style_short = STYLE_SHORT_LABELS.get(style_key, style_key)
-    ratio_short = ratio_meta.get("short", aspect_key)
-    ratio_friendly = ratio_meta.get("label", aspect_key)
-
-    label_mode = config.get("label_mode", "short")
-    ratio_token = ratio_short if label_mode == "short" else ratio_friendly
-    style_token = style_short if label_mode == "short" else style_long
-
-    seq_value = f"{seq_number:03d}" if seq_number is not None else ""
-    date_value = config.get("date_stamp", "")
-
-    tokens = SafeFormatDict(
-        {
-            "base": base_info["base"],
-            "base_clean": base_info["base_clean"],
-            "ratio": ratio_token,
-            "style": style_token,
-            "w": ratio_meta.get("size", (0, 0))[0],
-            "h": ratio_meta.get("size", (0, 0))[1],
-            "date": date_value,
-            "seq": seq_value,
-            "ext": ext.lstrip("."),
-        }
-    )
+# Fingerprinted assets produced by build_assets.py (static/dist + manifest.json)
+ASSET_DIST_DIR = Path(app.static_folder) / "dist"
+ASSET_MANIFEST_PATH = ASSET_DIST_DIR / "manifest.json"
+ASSET_MAX_AGE_SECONDS = 365 * 24 * 3600
+ASSET_ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
 
-    pattern = config.get("pattern") or PATTERN_PRESETS[DEFAULT_PATTERN_KEY]
-    formatted = pattern.format_map(tokens).strip("_- ")
-    if not formatted:
-        formatted = f"{tokens['base_clean']}_{ratio_token}"
 
-    normalized_pattern = pattern.lower()
-    if config.get("add_sequence", True) and "{seq}" not in normalized_pattern and seq_value:
-        formatted = f"{formatted}__{seq_value}"
-    if config.get("append_date", True) and "{date}" not in normalized_pattern and date_value:
-        formatted = f"{formatted}__{date_value}"
+def load_asset_manifest() -> dict[str, str]:
+    if not ASSET_MANIFEST_PATH.exists():
+        return {}
+    try:
+        data = json.loads(ASSET_MANIFEST_PATH.read_text())
+    except (OSError, json.JSONDecodeError):
+        logging.warning("Failed to parse asset manifest %s", ASSET_MANIFEST_PATH)
+        return {}
+    return data if isinstance(data, dict) else {}
 
-    filename = sanitize_filename(formatted, ext=ext)
-    filename = ensure_unique_name(output_dir, filename)
-    tokens["ratio_token"] = ratio_token
-    tokens["style_token"] = style_token
-    tokens["filename"] = filename
-    return filename, tokens
 
+ASSET_MANIFEST = load_asset_manifest()
 
-def load_summary(job_id: str) -> dict:
-    summary_path = OUTPUT_DIR / job_id / SUMMARY_FILENAME
-    if summary_path.exists():
-        try:
-            data = json.loads(summary_path.read_text())
-            if "videos" not in data:
-                data["videos"] = []
-            if "config" not in data:
-                data["config"] = {}
-            return data
-        except json.JSONDecodeError:
-            logging.warning("Failed to parse summary for job %s", job_id)
-    return {"videos": [], "config": {}}
-
-
-def append_summary(job_id: str, entry: dict, config: Optional[dict] = None) -> None:
-    summary = load_summary(job_id)
-    summary.setdefault("videos", []).append(entry)
-    if config:
-        summary["config"] = serialize_config(config)
-    summary["updated_at"] = datetime.utcnow().isoformat()
-    summary_path = OUTPUT_DIR / job_id / SUMMARY_FILENAME
-    summary_path.write_text(json.dumps(summary, indent=2))
-
-
-def resize_by_factor(clip: VideoFileClip, factor: float):
-    return clip.resize(factor)
-
-
-def crop_center(clip, width: int, height: int):
-    return clip.crop(
-        width=int(width),
-        height=int(height),
-        x_center=clip.w / 2,
-        y_center=clip.h / 2,
-    )
 
+@app.template_global()
+def asset_url(filename: str) -> str:
+    """Resolve a static asset to its fingerprinted URL, falling back to /static in development."""
+    hashed = ASSET_MANIFEST.get(filename)
+    if hashed:
+        return url_for("serve_asset", filename=hashed)
+    return url_for("static", filename=filename)
 
-def normalize_orientation(clip: VideoFileClip):
-    reader_rotation = getattr(getattr(clip, "reader", None), "rotation", None)
-    raw_rotation = getattr(clip, "rotation", None)
-    rotation = raw_rotation if raw_rotation not in (None, 0) else reader_rotation
-    try:
-        angle = int(rotation or 0) % 360
-    except (TypeError, ValueError):
-        angle = 0
-
-    if angle in (90, 180, 270):
-        clip = clip.rotate(angle, expand=True)
-        clip.rotation = 0
-        if getattr(clip, "reader", None) and hasattr(clip.reader, "rotation"):
-            clip.reader.rotation = 0
-    return clip
-
-def apply_gaussian_blur(clip, radius: float):
-    def blur_frame(frame):
-        return np.array(Image.fromarray(frame).filter(ImageFilter.GaussianBlur(radius)))
-
-    blurred = clip.fl_image(blur_frame)
-    if clip.mask is not None:
-        blurred.mask = clip.mask
-    return blurred
-
-
-def build_blurred_letterbox(clip: VideoFileClip, target_size: tuple[int, int]):
-    target_w, target_h = target_size
-    # Keep the original framing centered within the target size.
-    fit_scale = min(target_w / clip.w, target_h / clip.h)
-    letterboxed = resize_by_factor(clip, fit_scale).set_position(("center", "center"))
-
-    # Create a blurred background that fills the target canvas.
-    fill_scale = max(target_w / clip.w, target_h / clip.h)
-    background = resize_by_factor(clip, fill_scale)
-    background = crop_center(background, target_w, target_h)
-    background = apply_gaussian_blur(background, radius=16)
-
-    composite = CompositeVideoClip(
-        [background, letterboxed],
-        size=(target_w, target_h),
-    )
-    if clip.audio:
-        composite = composite.set_audio(clip.audio)
-    return composite.set_duration(clip.duration)
 
+@app.route("/assets/<path:filename>")
+def serve_asset(filename: str):
+    """Serve fingerprinted assets with immutable caching and precompressed variants."""
+    source = ASSET_DIST_DIR / filename
+    if not source.is_file() or filename.endswith((".gz", ".br")):
+        abort(404)
 
-def build_black_letterbox(clip: VideoFileClip, target_size: tuple[int, int]):
-    target_w, target_h = target_size
+    mimetype = mimetypes.guess_type(source.name)[0] or "application/octet-stream"
+    served_name = filename
+    content_encoding = None
+    for encoding, suffix in ASSET_ENCODINGS:
+        if encoding in request.accept_encodings and (ASSET_DIST_DIR / f"{filename}{suffix}").is_file():
+            served_name = f"{filename}{suffix}"
+            content_encoding = encoding
+            break
 
-    fit_scale = min(target_w / clip.w, target_h / clip.h)
-    letterboxed = resize_by_factor(clip, fit_scale).set_position(("center", "center"))
+    response = send_from_directory(ASSET_DIST_DIR, served_name, mimetype=mimetype, max_age=ASSET_MAX_AGE_SECONDS)
+    if content_encoding:
+        response.headers["Content-Encoding"] = content_encoding
+    response.headers["Cache-Control"] = f"public, max-age={ASSET_MAX_AGE_SECONDS}, immutable"
+    response.headers["Vary"] = "Accept-Encoding"
+    return response
 
-    background = ColorClip(size=(target_w, target_h), color=(0, 0, 0))
-    background = background.set_duration(clip.duration)
 
-    composite = CompositeVideoClip([background, letterboxed], size=(target_w, target_h))
-    if clip.audio:
-        composite = composite.set_audio(clip.audio)
-    return composite.set_duration(clip.duration)
+def allowed_file(filename: str) -> bool:
+    return "." in filename and filename.rsplit(".", 1)[1].lower() in ALLOWED_EXTENSIONS
+
+
+JOB_RECORD_FILENAME = "job.json"
+JOB_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+JOB_FILE_TERMINAL_STATUSES = {"done", "error", "cancelled"}
+_job_record_lock = Lock()
 
 
-def build_fill_and_crop(clip: VideoFileClip, target_size: tuple[int, int]):
-    target_w, target_h = target_size
-    scale = max(target_w / clip.w, target_h / clip.h)
-    filled = resize_by_factor(clip, scale)
-    cropped = crop_center(filled, target_w, target_h)
-    if clip.audio:
-        cropped = cropped.set_audio(clip.audio)
-    return cropped.set_duration(clip.duration)
+@contextmanager
+def job_record_lock(job_id: str):
+    """Serialise read-modify-write of a job record across threads and processes (the render service writes too)."""
+    job_dir = OUTPUT_DIR / job_id
+    job_dir.mkdir(exist_ok=True, parents=True)
+    with _job_record_lock, open(job_dir / ".job.lock", "w") as handle:
+        fcntl.flock(handle, fcntl.LOCK_EX)
+        yield
 
 
+def is_valid_job_id(job_id: str) -> bool:
+    return bool(job_id and JOB_ID_PATTERN.match(job_id))
+
+
+def load_job_record(job_id: str) -> Optional[dict]:
+    record_path = OUTPUT_DIR / job_id / JOB_RECORD_FILENAME
+    if not record_path.exists():
+        return None
+    try:
+        return json.loads(record_path.read_text())
+    except (OSError, json.JSONDecodeError):
+        logging.warning("Failed to parse job record for %s", job_id)
+        return None
+
+
+def save_job_record(job_id: str, record: dict) -> None:
+    job_dir = OUTPUT_DIR / job_id
+    job_dir.mkdir(exist_ok=True, parents=True)
+    record["updated_at"] = datetime.utcnow().isoformat()
+    write_json_atomic(job_dir / JOB_RECORD_FILENAME, record, indent=2)
+
+
+def derive_job_status(files: list[dict]) -> str:
+    statuses = [item.get("status") for item in files]
+    if any(status in ("awaiting_upload", "receiving") for status in statuses):
+        return "uploading"
+    if any(status not in JOB_FILE_TERMINAL_STATUSES for status in statuses):
+        return "processing"
+    if statuses and all(status == "error" for status in statuses):
+        return "error"
+    if any(status == "cancelled" for status in statuses):
+        return "cancelled"
+    return "done"
+
+
+def update_job_file(job_id: str, index: int, **changes) -> Optional[dict]:
+    with job_record_lock(job_id):
+        record = load_job_record(job_id)
+        if not record or not 0 <= index < len(record.get("files", [])):
+            return None
+        record["files"][index].update(changes)
+        record["status"] = derive_job_status(record["files"])
+        save_job_record(job_id, record)
+        return record
+
+
+def job_status_payload(record: dict) -> dict:
+    """Public view of a job record: internal paths stripped, download URLs attached."""
+    job_id = record["job_id"]
+    files = []
+    any_done = False
+    for entry in record.get("files", []):
+        item = {
+            "index": entry["index"],
+            "name": entry["name"],
+            "status": entry.get("status"),
+        }
+        if entry.get("error"):
+            item["error"] = entry["error"]
+        result = entry.get("result")
+        if result:
+            any_done = True
+            outputs = [
+                {**output, "url": url_for("download", job_id=job_id, filename=output["filename"])}
+                for output in result.get("outputs", [])
+            ]
+            item["result"] = {**result, "outputs": outputs}
+        files.append(item)
+
+    payload = {
+        "job_id": job_id,
+        "status": record.get("status"),
+        "style": record.get("style"),
+        "style_label": STYLE_LABELS.get(record.get("style"), record.get("style")),
+        "ratios": record.get("ratios", []),
+        "files": files,
+        "progress": job_progress_state(job_id)[0],
+    }
+    if any_done:
+        payload["downloads"] = {"bundle": url_for("download_bundle", job_id=job_id)}
+    return payload
+
+
+def save_upload(file_storage: FileStorage, job_id: str) -> tuple[Path, str]:
+    original_name = secure_filename(file_storage.filename or "")
+    if not original_name:
+        raise ValueError("Missing filename")
+
+    extension = Path(original_name).suffix.lower() or ".mp4"
+    upload_target = app.config["UPLOAD_FOLDER"] / f"{job_id}_{uuid.uuid4().hex}{extension}"
+    file_storage.save(upload_target)
+    return upload_target, original_name
+
+
+def check_upload_duration(upload_target: Path) -> Optional[float]:
+    with VideoFileClip(str(upload_target)) as tmp_clip:
+        duration = getattr(tmp_clip, "duration", None)
+    if duration and duration > MAX_CLIP_SECONDS:
+        try:
+            upload_target.unlink()
+        except Exception:
+            pass
+        raise ClipTooLongError("Max video length for MVP is 3 minutes (180 seconds).")
+    return duration
 
 
 def process_video_file(
@@ -778,26 +1272,100 @@ def process_video_file(
     ratios: list[str],
     naming_config: dict,
     base_override: Optional[str] = None,
+    encode_settings: Optional[dict] = None,
+    wait_for_memory: bool = True,
 ):
-    raw_filename = file_storage.filename or ""
-    original_name = secure_filename(raw_filename)
-    if not original_name:
-        raise ValueError("Missing filename")
+    if RENDER_MODE != "inline":
+        index = queue_saved_upload(
+            job_id, file_storage, style, ratios, naming_config, base_override, encode_settings
+        )
+        return wait_for_job_file(job_id, index)
 
-    extension = Path(original_name).suffix.lower() or ".mp4"
-    upload_target = app.config["UPLOAD_FOLDER"] / f"{job_id}_{uuid.uuid4().hex}{extension}"
-    file_storage.save(upload_target)
+    upload_target, original_name = save_upload(file_storage, job_id)
+    duration = check_upload_duration(upload_target)
+    reserved = False
+    if not wait_for_memory:
+        try:
+            reserve_memory(job_id, estimate_upload_memory(upload_target, ratios, style), blocking=False)
+        except MemoryBudgetExceeded:
+            upload_target.unlink(missing_ok=True)
+            raise
+        reserved = True
+    try:
+        return render_upload(
+            upload_target,
+            file_storage.filename or "",
+            original_name,
+            style,
+            job_id,
+            ratios,
+            naming_config,
+            base_override,
+            duration,
+            encode_settings,
+        )
+    finally:
+        if reserved:
+            release_memory(job_id)
 
-    with VideoFileClip(str(upload_target)) as tmp_clip:
-        duration = getattr(tmp_clip, "duration", None)
-        if duration and duration > 180:
-            try:
-                upload_target.unlink()
-            except Exception:
-                pass
-            raise ClipTooLongError("Max video length for MVP is 3 minutes (180 seconds).")
 
-    summary = load_summary(job_id)
+def wait_for_job_file(job_id: str, index: int) -> dict:
+    """Block this request (cheaply, under an async worker) until the render service or farm finishes the file."""
+    deadline = None
+    while True:
+        record = load_job_record(job_id) or {}
+        files = record.get("files", [])
+        entry = files[index] if index < len(files) else {}
+        if entry.get("status") == "error":
+            raise RuntimeError(entry.get("error") or "Render failed")
+        if entry.get("status") == "cancelled":
+            raise JobCancelled(job_id)
+        if entry.get("status") == "done":
+            result = entry["result"]
+            for output in result.get("outputs", []):
+                output["url"] = url_for("download", job_id=job_id, filename=output["filename"])
+            return result
+        if deadline is None:
+            expected = estimate_render_seconds(
+                record.get("style", "blur"), entry.get("duration") or MAX_CLIP_SECONDS, len(record.get("ratios", []))
+            )
+            deadline = time.monotonic() + RENDER_WAIT_QUEUE_SECONDS + RENDER_WAIT_FACTOR * expected
+        elif time.monotonic() > deadline:
+            fail_waited_job_file(job_id, index)
+            continue
+        time.sleep(RENDER_SERVICE_POLL_SECONDS)
+
+
+def fail_waited_job_file(job_id: str, index: int) -> None:
+    """Give up on a file nobody rendered in time: drop its queued task and record the error."""
+    drop_queued_renders(job_id)
+    with job_record_lock(job_id):
+        record = load_job_record(job_id)
+        if not record or not 0 <= index < len(record.get("files", [])):
+            raise RuntimeError("Render failed")
+        entry = record["files"][index]
+        if entry.get("status") in JOB_FILE_TERMINAL_STATUSES:
+            return  # finished while we were timing out; the caller reads the outcome
+        entry["status"] = "error"
+        entry["error"] = "No render service finished this file in time."
+        record["status"] = derive_job_status(record["files"])
+        save_job_record(job_id, record)
+    logging.warning("Timed out waiting for the render of %s/%s", job_id, index)
+
+
+def render_upload(
+    upload_target: Path,
+    raw_filename: str,
+    original_name: str,
+    style: str,
+    job_id: str,
+    ratios: list[str],
+    naming_config: dict,
+    base_override: Optional[str] = None,
+    duration: Optional[float] = None,
+    encode_settings: Optional[dict] = None,
+):
+    summary = load_summary(OUTPUT_DIR / job_id)
     base_info = prepare_base_info(raw_filename or original_name, base_override, naming_config)
     existing_outputs = sum(len(video.get("outputs", [])) for video in summary.get("videos", []))
     naming_state = {
@@ -808,19 +1376,59 @@ def process_video_file(
     update_job_progress(job_id, 0.0, "processing")
 
     output_dir = app.config["OUTPUT_FOLDER"] / job_id
+    # Queued and /api/process renders are admitted by their caller; anything else waits here.
+    owns_reservation = job_id not in JOB_MEMORY
+    if owns_reservation:
+        reserve_memory(job_id, estimate_upload_memory(upload_target, ratios, style))
+    record_render_start(job_id, style, duration, len(ratios))
+    rendered = False
     try:
-        outputs = render_variants(upload_target, output_dir, style, job_id, ratios, naming_state)
+        with job_context(job_id, output_dir):
+            outputs = render_variants(
+                upload_target, output_dir, style, job_id, ratios, naming_state, encode_settings, storage=OUTPUT_STORE
+            )
+        OUTPUT_STORE.release(output_dir, [item["filename"] for item in outputs])
+        rendered = True
+        sample_job_memory()
+        peak_rss_mb = JOB_MEMORY.get(job_id, {}).get("peak_mb")
+    except JobCancelled:
+        update_job_progress(job_id, 1.0, "cancelled")
+        raise
     except Exception:
         update_job_progress(job_id, 1.0, "error")
         raise
     finally:
+        if owns_reservation:
+            release_memory(job_id)
+        record_render_finish(job_id, rendered)
         try:
             upload_target.unlink()
         except FileNotFoundError:
             pass
 
+    result = record_rendered_upload(
+        job_id, original_name, base_info, style, ratios, naming_config, encode_settings, outputs, peak_rss_mb
+    )
+    clear_job_progress(job_id)
+    return result
+
+
+def record_rendered_upload(
+    job_id: str,
+    original_name: str,
+    base_info: dict,
+    style: str,
+    ratios: list[str],
+    naming_config: dict,
+    encode_settings: Optional[dict],
+    outputs: list[dict],
+    peak_rss_mb: Optional[float],
+) -> dict:
+    """Add a rendered upload to the job's batch_summary.json and build its result payload."""
     ratio_labels = []
     for item in outputs:
+        if has_request_context():
+            item["url"] = url_for("download", job_id=job_id, filename=item["filename"])
         label = item.get("ratio_label")
         if label and label not in ratio_labels:
             ratio_labels.append(label)
@@ -831,9 +1439,14 @@ def process_video_file(
         "ratios": ratios,
         "ratio_labels": ratio_labels or [ASPECT_OPTIONS[r]["label"] for r in ratios if r in ASPECT_OPTIONS],
         "outputs": [item["filename"] for item in outputs],
+        "encode": encode_settings or build_encode_settings(None),
+        "output_stats": [
+            {key: item.get(key) for key in ("filename", "size_bytes", "bitrate_kbps")}
+            for item in outputs
+        ],
+        "peak_rss_mb": round(peak_rss_mb) if peak_rss_mb else None,
     }
-    append_summary(job_id, summary_entry, naming_config)
-    clear_job_progress(job_id)
+    append_summary(OUTPUT_DIR / job_id, summary_entry, naming_config)
 
     return {
         "original_name": original_name,
@@ -855,6 +1468,31 @@ def health_check():
     }), 200
 
 
+@app.get("/ready")
+@limiter.exempt
+def readiness():
+    """Readiness for the front proxy: 200 while this instance takes new server work, 503 otherwise."""
+    report = readiness_report()
+    response = jsonify(report)
+    if report["status"] != "ready":
+        response.status_code = 503
+        response.headers["Retry-After"] = str(report["retry_after_seconds"])
+    return response
+
+
+@app.get("/capacity")
+def capacity():
+    """Report render load and the predicted wait for a clip of the given duration/ratios."""
+    style = request.args.get("style", "blur")
+    style = style if style in STYLE_LABELS else "blur"
+    try:
+        duration = max(0.0, float(request.args.get("duration", 0) or 0))
+    except ValueError:
+        return {"error": "duration must be a number of seconds."}, 400
+    ratios = [r for r in request.args.getlist("ratios") if r in ASPECT_OPTIONS]
+    return jsonify(get_capacity_snapshot(style, duration, len(ratios) or 1)), 200
+
+
 @app.route('/upgrade', methods=['POST'])
 def upgrade_tier():
     """Upgrade/downgrade user tier (MVP - no payment)"""
@@ -885,10 +1523,21 @@ def increment_usage_endpoint():
 @app.route("/progress/<job_id>")
 def get_progress(job_id):
     """Get progress for server-side processing jobs"""
-    progress_data = JOB_PROGRESS.get(job_id, {
+    mark_watched(job_id)
+    progress_data, rendering = job_progress_state(job_id)
+    progress_data = progress_data or {
         "progress": 0.0,
         "status": "not_found"
-    })
+    }
+    if rendering:
+        # The output being encoded can already be downloaded/previewed while it grows.
+        progress_data = {
+            **progress_data,
+            "rendering": {
+                "filename": rendering,
+                "url": url_for("download", job_id=job_id, filename=rendering),
+            },
+        }
     return jsonify(progress_data), 200
 
 
@@ -905,6 +1554,9 @@ def index():
 
 @app.route("/process", methods=["POST"])
 def process_upload():
+    if shed_load() is not None:
+        flash("The server is busy right now. Please try again in a minute.")
+        return redirect(url_for("index"))
     style = request.form.get("style", "blur")
     files = request.files.getlist("videos")
     if not files:
@@ -936,8 +1588,14 @@ def process_upload():
 
     style = style if style in STYLE_LABELS else "blur"
     job_id = request.form.get("batch_id") or uuid.uuid4().hex
-    naming_config = build_naming_config(job_id, request.form)
+    naming_config = build_naming_config(OUTPUT_DIR / job_id, request.form)
     override_map = parse_base_overrides(request.form.get("base_overrides"))
+    encode_settings = build_encode_settings(request.form, encode_profile())
+
+    if parse_bool(request.form.get("async")) or wants_async_response():
+        return queue_form_upload(
+            valid_files, style, job_id, ratios, naming_config, override_map, encode_settings
+        )
 
     results = []
     errors = []
@@ -953,11 +1611,15 @@ def process_upload():
                     ratios,
                     naming_config,
                     override,
+                    encode_settings,
                 )
             )
         except ClipTooLongError:
             flash("Max video length for MVP is 3 minutes (180 seconds).")
             continue
+        except JobCancelled:
+            flash("Rendering was cancelled.")
+            break
         except Exception as exc:  # pragma: no cover - surfaced to the UI
             logging.exception("Video rendering failed")
             errors.append(f"{file_storage.filename}: {exc}")
@@ -979,6 +1641,79 @@ def process_upload():
     )
 
 
+def queue_form_upload(valid_files, style, job_id, ratios, naming_config, override_map, encode_settings):
+    if not is_valid_job_id(job_id):
+        job_id = uuid.uuid4().hex
+    queued = 0
+    errors = []
+    for file_storage in valid_files:
+        raw_name = file_storage.filename or ""
+        override = override_map.get(raw_name) or override_map.get(secure_filename(raw_name))
+        try:
+            queue_saved_upload(job_id, file_storage, style, ratios, naming_config, override, encode_settings)
+            queued += 1
+        except ClipTooLongError:
+            flash("Max video length for MVP is 3 minutes (180 seconds).")
+        except Exception as exc:  # pragma: no cover - surfaced to the UI
+            logging.exception("Video upload failed")
+            errors.append(f"{raw_name}: {exc}")
+
+    if errors:
+        flash("Some files could not be queued: " + "; ".join(errors))
+    if not queued:
+        if not errors:
+            flash("Nothing was rendered.")
+        return redirect(url_for("index"))
+    return redirect(url_for("job_status", job_id=job_id), code=303)
+
+
+@app.get("/jobs/<job_id>")
+def job_status(job_id: str):
+    """Status of a queued job: JSON for API clients, the result page once rendering is done."""
+    if not is_valid_job_id(job_id):
+        abort(404)
+    wants_json = request.accept_mimetypes.best_match(["application/json", "text/html"]) != "text/html"
+    record = load_job_record(job_id)
+    if not record:
+        if wants_json:
+            return {"error": "Unknown job.", "status": "not_found"}, 404
+        abort(404)
+
+    payload = job_status_payload(record)
+    if wants_json:
+        return jsonify(payload), 200
+
+    if payload["status"] not in ("done", "error", "cancelled"):
+        return render_template("job_pending.html", job=payload)
+
+    for item in payload["files"]:
+        if item.get("error"):
+            flash(f"{item['name']}: {item['error']}")
+    if payload["status"] == "cancelled":
+        flash("This job was cancelled.")
+    results = [item["result"] for item in payload["files"] if item.get("result")]
+    if not results:
+        return redirect(url_for("index"))
+    return render_template(
+        "result.html",
+        job_id=job_id,
+        results=results,
+        style_label=payload["style_label"],
+        download_all=url_for("download_bundle", job_id=job_id),
+    )
+
+
+@app.post("/jobs/<job_id>/cancel")
+def job_cancel(job_id: str):
+    """Cancel a job's running and queued renders (also sent by the UI when the tab closes)."""
+    if not is_valid_job_id(job_id) or not (OUTPUT_DIR / job_id).is_dir():
+        return {"error": "Unknown job.", "status": "not_found"}, 404
+    record = cancel_job(job_id)
+    if record:
+        return jsonify(job_status_payload(record)), 200
+    return {"job_id": job_id, "status": "cancelled"}, 200
+
+
 @app.post("/api/process")
 @limiter.limit("10 per hour")  # Strict limit for server processing
 def api_process():
@@ -998,33 +1733,69 @@ def api_process():
     if not can_process:
         return {"error": error_msg}, 429
 
-    # Check if server is at capacity
-    if not processing_semaphore.acquire(blocking=False):
+    shed = shed_load()
+    if shed is not None:
+        return shed
+
+    # Async submissions queue for a render slot; synchronous ones rendered inline need a free
+    # slot now. With a render service or farm this worker only waits, and shed_load() guards the queue.
+    async_mode = wants_async_response()
+    holds_slot = not async_mode and RENDER_MODE == "inline"
+    if holds_slot and not processing_semaphore.acquire(blocking=False):
         return {"error": f"Server at capacity ({MAX_CONCURRENT_JOBS} jobs processing). Please wait and try again."}, 503
 
+    try:
+        return handle_api_process(async_mode)
+    finally:
+        if holds_slot:
+            processing_semaphore.release()
+
+
+def handle_api_process(async_mode: bool):
     style = request.form.get("style", "blur")
     file_storage = request.files.get("video")
 
     if not file_storage or file_storage.filename == "":
-        processing_semaphore.release()
         return {"error": "Select a video to upload."}, 400
 
     if not allowed_file(file_storage.filename):
-        processing_semaphore.release()
         return {"error": "Supported formats: mp4, mov, m4v, mkv."}, 400
 
     ratios = request.form.getlist("ratios") or request.form.getlist("ratio")
     ratios = [r for r in ratios if r in ASPECT_OPTIONS]
     if not ratios:
-        processing_semaphore.release()
         return {"error": "Select at least one aspect ratio (max two)."}, 400
     if len(ratios) > 3:
         ratios = ratios[:3]
 
     style = style if style in STYLE_LABELS else "blur"
     batch_id = request.form.get("batch_id") or uuid.uuid4().hex
-    naming_config = build_naming_config(batch_id, request.form)
+    if async_mode and not is_valid_job_id(batch_id):
+        batch_id = uuid.uuid4().hex
+    naming_config = build_naming_config(OUTPUT_DIR / batch_id, request.form)
     base_override = request.form.get("base_override")
+    encode_settings = build_encode_settings(request.form, encode_profile())
+
+    if async_mode:
+        try:
+            index = queue_saved_upload(
+                batch_id, file_storage, style, ratios, naming_config, base_override, encode_settings
+            )
+        except ClipTooLongError:
+            return {"error": "Max video length for MVP is 3 minutes (180 seconds)."}, 400
+        except Exception as exc:  # pragma: no cover
+            logging.exception("Video upload failed")
+            return {"error": str(exc)}, 500
+
+        increment_usage()
+        status_url = url_for("job_status", job_id=batch_id)
+        return {
+            "status": "queued",
+            "job_id": batch_id,
+            "batch_id": batch_id,
+            "index": index,
+            "status_url": status_url,
+        }, 202, {"Location": status_url}
 
     try:
         result = process_video_file(
@@ -1034,17 +1805,18 @@ def api_process():
             ratios,
             naming_config,
             base_override,
+            encode_settings,
+            wait_for_memory=False,
         )
     except ClipTooLongError:
-        processing_semaphore.release()
         return {"error": "Max video length for MVP is 3 minutes (180 seconds)."}, 400
+    except MemoryBudgetExceeded as exc:
+        return {"error": f"Server memory is fully booked. {exc} Please try again shortly."}, 503
+    except JobCancelled:
+        return {"error": "The render was cancelled.", "status": "cancelled", "job_id": batch_id}, 409
     except Exception as exc:  # pragma: no cover
         logging.exception("Video rendering failed")
-        processing_semaphore.release()
         return {"error": str(exc)}, 500
-    finally:
-        # Always release semaphore
-        processing_semaphore.release()
 
     # Increment usage counter after successful processing
     increment_usage()
@@ -1059,40 +1831,596 @@ def api_process():
     }
 
 
+def encode_profile() -> Optional[dict]:
+    """Encode limits (preset, fps and resolution caps) of the current session's tier."""
+    return app.config.get("ENCODE_PROFILES", {}).get(get_tier())
+
+
+def wants_async_response() -> bool:
+    """Async mode is requested with `Prefer: respond-async` or `?async=1` (checked without reading the body)."""
+    prefer = request.headers.get("Prefer", "").lower()
+    return "respond-async" in prefer or parse_bool(request.args.get("async"))
+
+
+def add_job_file(
+    job_id: str,
+    style: str,
+    ratios: list[str],
+    naming_config: dict,
+    encode_settings: dict,
+    entry: dict,
+) -> int:
+    with job_record_lock(job_id):
+        record = load_job_record(job_id) or {
+            "job_id": job_id,
+            "kind": "async",
+            "style": style,
+            "ratios": ratios,
+            "naming": serialize_config(naming_config),
+            "encode": encode_settings,
+            "files": [],
+            "created_at": datetime.utcnow().isoformat(),
+        }
+        index = len(record["files"])
+        record["files"].append({**entry, "index": index})
+        record["status"] = derive_job_status(record["files"])
+        save_job_record(job_id, record)
+        return index
+
+
+def queue_saved_upload(
+    job_id: str,
+    file_storage: FileStorage,
+    style: str,
+    ratios: list[str],
+    naming_config: dict,
+    base_override: Optional[str] = None,
+    encode_settings: Optional[dict] = None,
+) -> int:
+    """Store an upload, add it to the job record and queue its render. Returns the file index."""
+    upload_target, original_name = save_upload(file_storage, job_id)
+    duration = check_upload_duration(upload_target)
+    entry = {
+        "name": file_storage.filename or original_name,
+        "original_name": original_name,
+        "status": "queued",
+        "duration": duration,
+    }
+    if base_override:
+        entry["base_override"] = base_override
+    encode_settings = encode_settings or build_encode_settings(None)
+    index = add_job_file(job_id, style, ratios, naming_config, encode_settings, entry)
+    enqueue_job_file(job_id, index, upload_target, duration, style, ratios)
+    return index
+
+
+def run_job_file(job_id: str, index: int, upload_target: Path, duration: Optional[float]) -> None:
+    record = load_job_record(job_id)
+    if not record:
+        return
+    entry = record["files"][index]
+    if is_cancelled(OUTPUT_DIR / job_id) or entry.get("status") == "cancelled":
+        update_job_file(job_id, index, status="cancelled")
+        upload_target.unlink(missing_ok=True)
+        return
+    update_job_file(job_id, index, status="processing")
+    try:
+        result = render_upload(
+            upload_target,
+            entry["name"],
+            entry["original_name"],
+            record["style"],
+            job_id,
+            record["ratios"],
+            record["naming"],
+            entry.get("base_override"),
+            duration,
+            record.get("encode"),
+        )
+    except JobCancelled:
+        update_job_file(job_id, index, status="cancelled")
+        return
+    except Exception as exc:
+        logging.exception("Queued render failed for %s/%s", job_id, index)
+        update_job_file(job_id, index, status="error", error=str(exc))
+        return
+    record = load_job_record(job_id)
+    if record and record["files"][index].get("status") in ("error", "cancelled"):
+        # The upload this render started on was cut off (or the job was cancelled); its outputs are incomplete.
+        return
+    update_job_file(job_id, index, status="done", result=result)
+
+
+if RENDER_MODE == "inline":
+    start_service_heartbeat()
+    resume_interrupted_renders(own=True)
+
+
+@app.post("/api/batch")
+@limiter.limit("10 per hour")
+def api_batch_create():
+    """Register a batch manifest; files are then uploaded one by one and render as they arrive."""
+    if get_tier() == 'free':
+        return {"error": "FREE tier must use browser rendering. Upgrade to PAID for server processing."}, 403
+
+    can_process, error_msg = check_tier_usage()
+    if not can_process:
+        return {"error": error_msg}, 429
+
+    shed = shed_load()
+    if shed is not None:
+        return shed
+
+    payload = request.get_json(silent=True) or {}
+    manifest = payload.get("files") or []
+    if not isinstance(manifest, list) or not manifest:
+        return {"error": "Provide a manifest with at least one file."}, 400
+
+    max_files = app.config.get("MAX_BATCH_SIZE", MAX_FILES_PER_BATCH)
+    if len(manifest) > max_files:
+        return {"error": f"You can upload up to {max_files} videos per batch."}, 400
+
+    max_size = 400 * 1024 * 1024  # 400 MB (buffer above 300MB tier limit)
+    files = []
+    for index, item in enumerate(manifest):
+        name = str((item or {}).get("name") or "")
+        if not name or not allowed_file(name):
+            return {"error": f"Unsupported file in manifest: {name or 'unnamed'}. Supported formats: mp4, mov, m4v, mkv."}, 400
+        size = int((item or {}).get("size") or 0)
+        if size > max_size:
+            return {"error": f"{name} is too large. Maximum upload size is 300MB."}, 413
+        files.append({
+            "index": index,
+            "name": name,
+            "original_name": secure_filename(name) or "clip.mp4",
+            "size": size,
+            "status": "awaiting_upload",
+        })
+
+    ratios = [r for r in payload.get("ratios") or [] if r in ASPECT_OPTIONS]
+    if not ratios:
+        return {"error": "Select at least one aspect ratio."}, 400
+    ratios = ratios[:3]
+
+    style = payload.get("style", "blur")
+    style = style if style in STYLE_LABELS else "blur"
+    batch_id = uuid.uuid4().hex
+    naming_config = build_naming_config(OUTPUT_DIR / batch_id, payload)
+    overrides = payload.get("base_overrides") or {}
+    if isinstance(overrides, dict):
+        for entry in files:
+            override = overrides.get(entry["name"]) or overrides.get(entry["original_name"])
+            if override:
+                entry["base_override"] = str(override)
+
+    record = {
+        "job_id": batch_id,
+        "kind": "batch",
+        "status": "uploading",
+        "style": style,
+        "ratios": ratios,
+        "naming": serialize_config(naming_config),
+        "encode": build_encode_settings(payload, encode_profile()),
+        "files": files,
+        "created_at": datetime.utcnow().isoformat(),
+    }
+    save_job_record(batch_id, record)
+    increment_usage()
+
+    return {
+        "batch_id": batch_id,
+        "status_url": url_for("api_batch_status", batch_id=batch_id),
+        "files": [
+            {
+                "index": entry["index"],
+                "name": entry["name"],
+                "upload_url": url_for("api_batch_upload", batch_id=batch_id, index=entry["index"]),
+            }
+            for entry in files
+        ],
+    }, 201
+
+
+@app.post("/api/batch/<batch_id>/files/<int:index>")
+def api_batch_upload(batch_id: str, index: int):
+    """Accept one file of a batch and queue it; responds as soon as the upload is stored."""
+    if not is_valid_job_id(batch_id):
+        abort(404)
+    with job_record_lock(batch_id):
+        record = load_job_record(batch_id)
+        if not record or record.get("kind") != "batch":
+            return {"error": "Unknown batch."}, 404
+        if not 0 <= index < len(record["files"]):
+            return {"error": "Unknown file index."}, 404
+        entry = record["files"][index]
+        if entry.get("status") == "cancelled":
+            return {"error": "This batch was cancelled."}, 409
+        if entry.get("status") != "awaiting_upload":
+            return {"error": "This file was already uploaded."}, 409
+        # Claim the file before reading the body, so a retry or a concurrent POST gets the 409 above.
+        entry["status"] = "receiving"
+        record["status"] = derive_job_status(record["files"])
+        save_job_record(batch_id, record)
+
+    if request.mimetype != "multipart/form-data":
+        return receive_streamed_upload(batch_id, index, record)
+
+    file_storage = request.files.get("video")
+    if not file_storage or not file_storage.filename:
+        update_job_file(batch_id, index, status="awaiting_upload")
+        return {"error": "Select a video to upload."}, 400
+    if not allowed_file(file_storage.filename):
+        update_job_file(batch_id, index, status="awaiting_upload")
+        return {"error": "Supported formats: mp4, mov, m4v, mkv."}, 400
+
+    try:
+        upload_target, _ = save_upload(file_storage, batch_id)
+        duration = check_upload_duration(upload_target)
+    except ClipTooLongError as exc:
+        update_job_file(batch_id, index, status="error", error=str(exc))
+        return {"error": str(exc)}, 400
+    except Exception as exc:  # pragma: no cover
+        logging.exception("Batch upload failed")
+        update_job_file(batch_id, index, status="error", error=str(exc))
+        return {"error": str(exc)}, 500
+
+    update_job_file(batch_id, index, status="queued", duration=duration)
+    enqueue_job_file(batch_id, index, upload_target, duration, record["style"], record["ratios"])
+    return {
+        "status": "queued",
+        "batch_id": batch_id,
+        "index": index,
+        "status_url": url_for("api_batch_status", batch_id=batch_id),
+    }, 202
+
+
+def probe_partial_duration(upload_target: Path) -> Optional[float]:
+    try:
+        return ffmpeg_parse_infos(str(upload_target)).get("duration")
+    except (IOError, OSError):
+        return None
+
+
+def receive_streamed_upload(batch_id: str, index: int, record: dict):
+    """Write a raw request body straight into UPLOAD_DIR, probing and rendering it while it arrives.
+
+    The header is probed as soon as it is in (a leading moov for MP4/MOV, the first
+    STREAM_PROBE_BYTES otherwise) so over-long clips are refused before the rest is sent.
+    Faststart sources are queued right away and render from the bytes received so far.
+    """
+    raw_name = unquote(request.headers.get("X-Filename", "")) or record["files"][index]["name"]
+    original_name = secure_filename(raw_name)
+    if not original_name or not allowed_file(original_name):
+        update_job_file(batch_id, index, status="awaiting_upload")
+        return {"error": "Supported formats: mp4, mov, m4v, mkv."}, 400
+
+    extension = Path(original_name).suffix.lower()
+    upload_target = app.config["UPLOAD_FOLDER"] / f"{batch_id}_{uuid.uuid4().hex}{extension}"
+    marker = receiving_marker(upload_target)
+    marker.touch()
+    received = 0
+    probed = False
+    queued = False
+    duration = None
+    try:
+        with upload_target.open("wb") as handle:
+            while True:
+                chunk = request.stream.read(STREAM_CHUNK_BYTES)
+                if not chunk:
+                    break
+                handle.write(chunk)
+                # Flushed right away so a render following the file sees every byte.
+                handle.flush()
+                received += len(chunk)
+                if is_cancelled(OUTPUT_DIR / batch_id):
+                    raise JobCancelled(batch_id)
+                if probed:
+                    continue
+                layout = mp4_layout(upload_target, received)
+                if layout == "moov_at_end":
+                    probed = True
+                elif layout == "faststart" or (layout == "unknown" and received >= STREAM_PROBE_BYTES):
+                    probed = True
+                    duration = probe_partial_duration(upload_target)
+                    if duration and duration > MAX_CLIP_SECONDS:
+                        raise ClipTooLongError("Max video length for MVP is 3 minutes (180 seconds).")
+                    if layout == "faststart" and duration:
+                        update_job_file(batch_id, index, status="queued", duration=duration)
+                        enqueue_job_file(batch_id, index, upload_target, duration, record["style"], record["ratios"])
+                        queued = True
+        marker.unlink(missing_ok=True)
+        if not queued:
+            duration = check_upload_duration(upload_target)
+    except JobCancelled:
+        marker.unlink(missing_ok=True)
+        upload_target.unlink(missing_ok=True)
+        update_job_file(batch_id, index, status="cancelled")
+        return {"error": "This batch was cancelled."}, 409
+    except Exception as exc:
+        marker.unlink(missing_ok=True)
+        upload_target.unlink(missing_ok=True)
+        if not isinstance(exc, ClipTooLongError):
+            logging.exception("Streamed upload failed for %s/%s", batch_id, index)
+        update_job_file(batch_id, index, status="error", error=str(exc))
+        return {"error": str(exc)}, 400 if isinstance(exc, ClipTooLongError) else 500
+
+    if not queued:
+        update_job_file(batch_id, index, status="queued", duration=duration)
+        enqueue_job_file(batch_id, index, upload_target, duration, record["style"], record["ratios"])
+    return {
+        "status": "queued",
+        "batch_id": batch_id,
+        "index": index,
+        "streamed": queued,
+        "status_url": url_for("api_batch_status", batch_id=batch_id),
+    }, 202
+
+
+@app.get("/api/batch/<batch_id>")
+def api_batch_status(batch_id: str):
+    if not is_valid_job_id(batch_id):
+        abort(404)
+    record = load_job_record(batch_id)
+    if not record:
+        return {"error": "Unknown batch.", "status": "not_found"}, 404
+    if parse_bool(request.args.get("watch")):
+        mark_watched(batch_id)
+    return jsonify(job_status_payload(record)), 200
+
+
+# Render farm node API (RENDER_MODE=farm). Nodes authenticate with RENDER_FARM_TOKEN and
+# identify themselves in X-Farm-Node; they poll continuously, so the rate limits do not apply.
+def require_farm_node() -> str:
+    if RENDER_MODE != "farm":
+        abort(404)
+    token = request.headers.get("X-Farm-Token", "")
+    node = request.headers.get("X-Farm-Node", "")
+    if not RENDER_FARM_TOKEN or not hmac.compare_digest(token, RENDER_FARM_TOKEN) or not node:
+        abort(403)
+    return node
+
+
+def finish_farm_task(task: dict) -> None:
+    # A node whose lease ran out must not delete the upload the task's new node still reads.
+    if not farm_broker.finish(task["task_id"], task.get("node")):
+        return
+    Path(task["upload_target"]).unlink(missing_ok=True)
+    (OUTPUT_DIR / task["job_id"] / PROGRESS_FILENAME).unlink(missing_ok=True)
+
+
+def farm_assignment(task: dict, node: str) -> Optional[dict]:
+    """Everything a node needs to render a leased task, or None if the file no longer needs it."""
+    job_id, index = task["job_id"], task["index"]
+    record = load_job_record(job_id)
+    entry = record["files"][index] if record and index < len(record.get("files", [])) else None
+    if entry is None or entry.get("status") in JOB_FILE_TERMINAL_STATUSES or is_cancelled(OUTPUT_DIR / job_id):
+        finish_farm_task(task)
+        return None
+    update_job_file(job_id, index, status="processing", worker=node)
+    summary = load_summary(OUTPUT_DIR / job_id)
+    return {
+        "task_id": task["task_id"],
+        "job_id": job_id,
+        "index": index,
+        "name": entry["name"],
+        "original_name": entry["original_name"],
+        "base_override": entry.get("base_override"),
+        "duration": task.get("duration"),
+        "style": record["style"],
+        "ratios": record["ratios"],
+        "naming": record["naming"],
+        "encode": record.get("encode"),
+        "memory_mb": task.get("memory_mb", 0.0),
+        "sequence_start": sum(len(video.get("outputs", [])) for video in summary.get("videos", [])),
+        "input_url": url_for("farm_task_input", task_id=task["task_id"]),
+        "attempts": task["attempts"],
+    }
+
+
+@app.post("/farm/claim")
+@limiter.exempt
+def farm_claim():
+    """Lease the next render task to the calling node (204 when the queue is empty)."""
+    node = require_farm_node()
+    payload = request.get_json(silent=True) or {}
+    if payload.get("state"):
+        farm_broker.report_node(node, payload["state"])
+    while True:
+        task = farm_broker.claim(node)
+        if task is None:
+            return "", 204
+        assignment = farm_assignment(task, node)
+        if assignment:
+            return jsonify(assignment), 200
+
+
+@app.get("/farm/tasks/<task_id>/input")
+@limiter.exempt
+def farm_task_input(task_id: str):
+    node = require_farm_node()
+    task = farm_broker.get(task_id, node)
+    if task is None:
+        return {"error": "Task is not assigned to this node."}, 410
+    upload_target = Path(task["upload_target"])
+    marker = receiving_marker(upload_target)
+    if marker.exists():
+        # Still being uploaded: pass bytes on as they arrive.
+        return Response(
+            stream_with_context(follow_growing_file(upload_target, marker)),
+            mimetype="application/octet-stream",
+        )
+    if not upload_target.is_file():
+        abort(404)
+    return send_file(upload_target, mimetype="application/octet-stream")
+
+
+@app.post("/farm/tasks/<task_id>/progress")
+@limiter.exempt
+def farm_task_progress(task_id: str):
+    """Heartbeat: extends the lease, publishes progress and tells the node if the job was cancelled."""
+    node = require_farm_node()
+    payload = request.get_json(silent=True) or {}
+    if payload.get("state"):
+        farm_broker.report_node(node, payload["state"])
+    task = farm_broker.renew(task_id, node)
+    if task is None:
+        return {"error": "Task is no longer assigned to this node.", "cancelled": True}, 410
+    job_dir = OUTPUT_DIR / task["job_id"]
+    if payload.get("progress") and job_dir.is_dir():
+        write_json_atomic(job_dir / PROGRESS_FILENAME, payload["progress"])
+    return {"cancelled": is_cancelled(job_dir)}, 200
+
+
+@app.put("/farm/tasks/<task_id>/outputs/<filename>")
+@limiter.exempt
+def farm_task_output(task_id: str, filename: str):
+    """Store one rendered output; answers with the name it was saved under."""
+    node = require_farm_node()
+    task = farm_broker.get(task_id, node)
+    if task is None:
+        return {"error": "Task is no longer assigned to this node."}, 410
+    name = secure_filename(filename)
+    if not name or Path(name).suffix.lower() != ".mp4":
+        return {"error": "Outputs must be .mp4 files."}, 400
+    job_dir = OUTPUT_DIR / task["job_id"]
+    job_dir.mkdir(exist_ok=True, parents=True)
+    name = ensure_unique_name(job_dir, name)
+    OUTPUT_STORE.receive(job_dir, name, request.stream)
+    return {"filename": name}, 201
+
+
+@app.post("/farm/tasks/<task_id>/complete")
+@limiter.exempt
+def farm_task_complete(task_id: str):
+    node = require_farm_node()
+    task = farm_broker.get(task_id, node)
+    if task is None:
+        return {"error": "Task is no longer assigned to this node."}, 410
+    payload = request.get_json(silent=True) or {}
+    job_id, index = task["job_id"], task["index"]
+    job_dir = OUTPUT_DIR / job_id
+    outputs = [
+        item for item in payload.get("outputs", [])
+        if secure_filename(item.get("filename", "")) == item.get("filename") and OUTPUT_STORE.has(job_dir, item["filename"])
+    ]
+    record = load_job_record(job_id)
+    entry = record["files"][index] if record else {}
+    if not record or entry.get("status") in JOB_FILE_TERMINAL_STATUSES or is_cancelled(job_dir):
+        # Cancelled (or failed at upload) while the node rendered it.
+        discard_outputs(job_dir, outputs)
+        finish_farm_task(task)
+        return {"status": entry.get("status", "cancelled")}, 200
+
+    base_info = prepare_base_info(entry["name"], entry.get("base_override"), record["naming"])
+    result = record_rendered_upload(
+        job_id,
+        entry["original_name"],
+        base_info,
+        record["style"],
+        record["ratios"],
+        record["naming"],
+        record.get("encode"),
+        outputs,
+        payload.get("peak_rss_mb"),
+    )
+    finish_farm_task(task)
+    update_job_file(job_id, index, status="done", result=result)
+    return {"status": "done"}, 200
+
+
+@app.post("/farm/tasks/<task_id>/fail")
+@limiter.exempt
+def farm_task_fail(task_id: str):
+    node = require_farm_node()
+    task = farm_broker.get(task_id, node)
+    if task is None:
+        return {"error": "Task is no longer assigned to this node."}, 410
+    payload = request.get_json(silent=True) or {}
+    job_id, index = task["job_id"], task["index"]
+    record = load_job_record(job_id)
+    entry = record["files"][index] if record else {}
+    if record and entry.get("status") not in JOB_FILE_TERMINAL_STATUSES:
+        if payload.get("cancelled") or is_cancelled(OUTPUT_DIR / job_id):
+            update_job_file(job_id, index, status="cancelled")
+        else:
+            logging.warning("Render node %s failed %s/%s: %s", node, job_id, index, payload.get("error"))
+            update_job_file(job_id, index, status="error", error=payload.get("error") or "Render failed")
+    finish_farm_task(task)
+    return {"status": "recorded"}, 200
+
+
 @app.route("/download/<job_id>/<path:filename>")
 def download(job_id: str, filename: str):
     target_dir = app.config["OUTPUT_FOLDER"] / job_id
     if not target_dir.exists():
         abort(404)
+
+    target = safe_join(str(target_dir), filename)
+    if target:
+        target_path = Path(target)
+        marker = rendering_marker(target_path)
+        if marker.exists() and target_path.is_file():
+            # Still encoding: stream the fragmented MP4 as it grows. Its final length is unknown
+            # until ffmpeg finishes, so no Content-Length and no ranges; requests after that get both.
+            return Response(
+                stream_with_context(follow_growing_file(target_path, marker)),
+                mimetype="video/mp4",
+                headers={
+                    "Content-Disposition": f'attachment; filename="{target_path.name}"',
+                    "Cache-Control": "no-store",
+                    "Accept-Ranges": "none",
+                    "X-Render-Status": "in-progress",
+                },
+            )
+        stored_url = OUTPUT_STORE.url(target_dir, target_path.name) if target_path.parent == target_dir else None
+        if stored_url:
+            return redirect(stored_url)
     return send_from_directory(target_dir, filename, as_attachment=True)
 
 
+BUNDLE_SPOOL_BYTES = 8 * 1024 * 1024
+
+
 @app.route("/download/<job_id>/bundle")
 def download_bundle(job_id: str):
     target_dir = app.config["OUTPUT_FOLDER"] / job_id
     if not target_dir.exists():
         abort(404)
 
-    buffer = io.BytesIO()
+    # Only small bundles stay in memory; the rest spill to a temp file that is gone once sent,
+    # so a batch streamed back from the bucket never sits in a web worker's RAM.
+    buffer = tempfile.SpooledTemporaryFile(max_size=BUNDLE_SPOOL_BYTES)
     files_added = 0
-    with zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_DEFLATED) as archive:
-        for path in sorted(target_dir.glob("*.mp4")):
-            archive.write(path, arcname=path.name)
-            files_added += 1
+    names = {path.name for path in target_dir.glob("*.mp4")} | set(stored_names(target_dir))
+    try:
+        with zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+            for name in sorted(names):
+                if rendering_marker(target_dir / name).exists():
+                    continue
+                with OUTPUT_STORE.open(target_dir, name) as source, archive.open(name, "w", force_zip64=True) as entry:
+                    shutil.copyfileobj(source, entry, STREAM_CHUNK_BYTES)
+                files_added += 1
+    except BaseException:
+        buffer.close()
+        raise
 
     if files_added == 0:
+        buffer.close()
         abort(404)
 
+    size = buffer.tell()
     buffer.seek(0)
-    summary = load_summary(job_id)
+    summary = load_summary(OUTPUT_DIR / job_id)
     date_stamp = summary.get("config", {}).get("date_stamp") or datetime.utcnow().strftime(DATE_FORMAT)
     filename = f"Free_AutoFrame__{date_stamp}.zip"
-    return send_file(
+    response = send_file(
         buffer,
         mimetype="application/zip",
         download_name=filename,
         as_attachment=True,
     )
+    response.content_length = size
+    return response
 
 
 @app.get("/progress/<job_id>")
@@ -1103,97 +2431,25 @@ def job_progress(job_id: str):
     return entry
 
 
-def write_clip(
-    clip_obj,
-    output_dir: Path,
-    fps: float,
-    aspect_key: str,
-    style: str,
-    job_id: str,
-    naming_state: dict,
-    seq_number: Optional[int],
-    logger: Optional[ProgressBarLogger],
-):
-    config = ASPECT_OPTIONS.get(aspect_key)
-    if not config:
-        raise ValueError(f"Unsupported aspect key: {aspect_key}")
-
-    filename, tokens = generate_output_filename(
-        naming_state["base_info"],
-        aspect_key,
-        style,
-        naming_state["config"],
-        seq_number,
-        ext="mp4",
-        output_dir=output_dir,
-    )
-    output_path = output_dir / filename
-    try:
-        clip_obj.write_videofile(
-            str(output_path),
-            codec="libx264",
-            audio_codec="aac",
-            fps=fps,
-            preset="veryfast",
-            threads=os.cpu_count() or 4,
-            temp_audiofile=str(output_path.with_suffix(".m4a")),
-            remove_temp=True,
-            logger=logger,
-        )
-    finally:
-        clip_obj.close()
-
-    result = {
-        "label": f"{config['label']} • {STYLE_LABELS.get(style, style)}",
-        "filename": filename,
-        "aspect_key": aspect_key,
-        "ratio_label": tokens.get("ratio_token", config.get("short", aspect_key)),
-    }
-    result["url"] = url_for("download", job_id=job_id, filename=filename)
-    return result
-
-
-def render_variants(
-    input_path: Path,
-    output_dir: Path,
-    style: str,
-    job_id: str,
-    ratios: list[str],
-    naming_state: dict,
-) -> list[dict]:
-    output_dir.mkdir(exist_ok=True, parents=True)
-    outputs: list[dict] = []
-
-    with VideoFileClip(str(input_path)) as clip:
-        clip = normalize_orientation(clip)
-        fps = getattr(clip, "fps", None) or getattr(clip.reader, "fps", 30)
-
-        builder = build_fill_and_crop if style == "fill" else build_blurred_letterbox
-        if style == "black":
-            builder = build_black_letterbox
-
-        ratio_total = max(1, len(ratios))
-        for idx, aspect_key in enumerate(ratios):
-            config = ASPECT_OPTIONS.get(aspect_key)
-            if not config:
+def follow_growing_file(path: Path, marker: Path, chunk_size: int = 256 * 1024):
+    """Stream a file that is still being written until its rendering marker disappears."""
+    with path.open("rb") as handle:
+        last_data = time.time()
+        while True:
+            chunk = handle.read(chunk_size)
+            if chunk:
+                last_data = time.time()
+                yield chunk
                 continue
-            target_clip = builder(clip, config["size"])
-            seq_number = naming_state["sequence_start"] + len(outputs) + 1
-            logger = JobProgressLogger(job_id, idx, ratio_total)
-            update_job_progress(job_id, idx / ratio_total, "processing")
-            outputs.append(
-                write_clip(
-                    target_clip,
-                    output_dir,
-                    fps,
-                    aspect_key,
-                    style,
-                    job_id,
-                    naming_state,
-                    seq_number,
-                    logger,
-                )
-            )
+            if not marker.exists():
+                # Encoding finished; send whatever was flushed last. The finished file may have
+                # been swapped for its faststart copy, but this handle keeps the complete original.
+                remainder = handle.read()
+                if remainder:
+                    yield remainder
+                return
+            if time.time() - last_data > PARTIAL_STALL_SECONDS:
+                return
+            time.sleep(PARTIAL_POLL_SECONDS)
+
 
-    update_job_progress(job_id, 1.0, "done")
-    return outputs
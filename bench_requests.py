@@ -0,0 +1,89 @@
+"""
+Request throughput benchmark for Free AutoFrame's hot routes.
+
+Drives the app in-process through Flask's test client (one thread, so the figure
+is requests per second per worker without network overhead) with a session
+cookie set, the way a browser polls a running job. Every route is measured with
+the lean request path switched off and on:
+
+    SECRET_KEY=... python bench_requests.py --seconds 3
+"""
+
+import argparse
+import itertools
+import os
+import shutil
+import sys
+import time
+import uuid
+
+os.environ.setdefault("SECRET_KEY", "bench-only-secret")
+
+import app as autoframe  # noqa: E402
+
+
+# The full path counts every request against the default "200 per hour" limit, so the
+# benchmark spreads its traffic over client addresses to keep measuring 200s, not 429s.
+REQUESTS_PER_ADDRESS = 150
+_sent = itertools.count()
+
+
+def client_headers() -> dict:
+    slot = next(_sent) // REQUESTS_PER_ADDRESS
+    return {"X-Real-IP": f"10.{slot >> 16 & 255}.{slot >> 8 & 255}.{slot & 255}"}
+
+
+def measure(client, path: str, seconds: float) -> float:
+    for _ in range(20):  # warm caches and the URL map
+        client.get(path, headers=client_headers())
+    count = 0
+    started = time.perf_counter()
+    deadline = started + seconds
+    while time.perf_counter() < deadline:
+        response = client.get(path, headers=client_headers())
+        response.close()
+        if response.status_code >= 400:
+            raise RuntimeError(f"GET {path} answered HTTP {response.status_code}")
+        count += 1
+    return count / (time.perf_counter() - started)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Requests per second per worker, full vs lean request path.")
+    parser.add_argument("--seconds", type=float, default=2.0, help="Measuring time per route and mode")
+    args = parser.parse_args(argv)
+
+    autoframe.app.config["TESTING"] = True
+    job_id = uuid.uuid4().hex
+    job_dir = autoframe.OUTPUT_DIR / job_id
+    job_dir.mkdir(parents=True, exist_ok=True)
+    autoframe.JOB_PROGRESS[job_id] = {"progress": 42.0, "status": "processing", "message": "Rendering"}
+
+    routes = [f"/progress/{job_id}", "/static/js/app.js", "/health"]
+    if autoframe.ASSET_MANIFEST:  # fingerprinted copies exist after build_assets.py
+        routes.append("/assets/" + next(iter(autoframe.ASSET_MANIFEST.values())))
+
+    lean_default = autoframe.LEAN_ROUTES
+    results = {}
+    try:
+        for lean in (False, True):
+            autoframe.LEAN_ROUTES = lean
+            client = autoframe.app.test_client()
+            client.get("/")  # start a session like a browser that loaded the page
+            for path in routes:
+                results[(path, lean)] = measure(client, path, args.seconds)
+    finally:
+        autoframe.LEAN_ROUTES = lean_default
+        autoframe.JOB_PROGRESS.pop(job_id, None)
+        shutil.rmtree(job_dir, ignore_errors=True)
+
+    print(f"{'route':<44} {'full req/s':>11} {'lean req/s':>11} {'speedup':>8}")
+    for path in routes:
+        full, lean = results[(path, False)], results[(path, True)]
+        label = path.replace(job_id, "<job_id>")
+        print(f"{label:<44} {full:>11.0f} {lean:>11.0f} {lean / full:>7.2f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
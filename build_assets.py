@@ -0,0 +1,93 @@
+"""
+Static asset build step for Free AutoFrame.
+
+Content-hashes every stylesheet/script under ``static/`` into ``static/dist/``,
+writes gzip and brotli siblings next to each fingerprinted file and records the
+mapping in ``static/dist/manifest.json``. Templates resolve asset URLs through
+that manifest (see ``asset_url`` in app.py), so a deploy only has to run:
+
+    python build_assets.py
+"""
+
+import argparse
+import gzip
+import hashlib
+import json
+import shutil
+import sys
+from pathlib import Path
+
+try:
+    import brotli
+except ImportError:  # Brotli is optional; gzip siblings are always written
+    brotli = None
+
+BASE_DIR = Path(__file__).parent.absolute()
+STATIC_DIR = BASE_DIR / "static"
+DIST_DIRNAME = "dist"
+MANIFEST_FILENAME = "manifest.json"
+FINGERPRINT_EXTENSIONS = {".js", ".css", ".svg", ".wasm", ".json"}
+HASH_LENGTH = 12
+
+
+def iter_source_assets(static_dir: Path):
+    dist_dir = static_dir / DIST_DIRNAME
+    for path in sorted(static_dir.rglob("*")):
+        if not path.is_file() or dist_dir in path.parents:
+            continue
+        if path.suffix.lower() in FINGERPRINT_EXTENSIONS:
+            yield path
+
+
+def fingerprint_name(relative: Path, payload: bytes) -> Path:
+    digest = hashlib.sha256(payload).hexdigest()[:HASH_LENGTH]
+    return relative.with_name(f"{relative.stem}.{digest}{relative.suffix}")
+
+
+def write_compressed_variants(target: Path, payload: bytes) -> list[str]:
+    written = []
+    # mtime=0 keeps the .gz output byte-identical between builds
+    with gzip.GzipFile(target.with_name(target.name + ".gz"), "wb", compresslevel=9, mtime=0) as handle:
+        handle.write(payload)
+    written.append("gzip")
+    if brotli is not None:
+        target.with_name(target.name + ".br").write_bytes(brotli.compress(payload, quality=11))
+        written.append("br")
+    return written
+
+
+def build(static_dir: Path = STATIC_DIR, clean: bool = True) -> dict[str, str]:
+    dist_dir = static_dir / DIST_DIRNAME
+    if clean and dist_dir.exists():
+        shutil.rmtree(dist_dir)
+    dist_dir.mkdir(parents=True, exist_ok=True)
+
+    manifest: dict[str, str] = {}
+    for source in iter_source_assets(static_dir):
+        relative = source.relative_to(static_dir)
+        payload = source.read_bytes()
+        hashed = fingerprint_name(relative, payload)
+        target = dist_dir / hashed
+        target.parent.mkdir(parents=True, exist_ok=True)
+        target.write_bytes(payload)
+        encodings = write_compressed_variants(target, payload)
+        manifest[relative.as_posix()] = hashed.as_posix()
+        print(f"{relative.as_posix()} -> {hashed.as_posix()} ({', '.join(encodings)})")
+
+    (dist_dir / MANIFEST_FILENAME).write_text(json.dumps(manifest, indent=2, sort_keys=True))
+    if brotli is None:
+        print("Brotli module not installed; only gzip variants were written.", file=sys.stderr)
+    return manifest
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Fingerprint and precompress static assets.")
+    parser.add_argument("--static-dir", type=Path, default=STATIC_DIR)
+    parser.add_argument("--no-clean", action="store_true", help="Keep previously built files in static/dist")
+    args = parser.parse_args(argv)
+    build(args.static_dir, clean=not args.no_clean)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,356 @@
+"""
+Headless bulk renderer for Free AutoFrame.
+
+Renders a whole directory (or a JSON/CSV manifest) of clips with the same engine
+as the web app, without Flask or HTTP. Files render in parallel, one process per
+worker, and every finished file is recorded in ``batch_summary.json`` inside the
+output directory. Re-running skips outputs that already exist, so an interrupted
+back-catalogue run picks up where it stopped:
+
+    python bulk_render.py ~/clips -o ~/reframed --style fill --ratios square landscape
+    python bulk_render.py --resume -o ~/reframed
+
+A throughput report is printed and written to ``bulk_report.json``.
+"""
+
+import argparse
+import csv
+import json
+import logging
+import os
+import sys
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import Optional
+
+from moviepy.video.io.ffmpeg_reader import ffmpeg_parse_infos
+
+from render_engine import (
+    ADAPTIVE_PRESET,
+    ASPECT_OPTIONS,
+    PATTERN_PRESETS,
+    STYLE_LABELS,
+    VIDEO_EXTENSIONS,
+    X264_PRESET_COST,
+    append_summary,
+    build_encode_settings,
+    build_naming_config,
+    load_summary,
+    prepare_base_info,
+    render_variants,
+)
+
+MANIFEST_FILENAME = "bulk_manifest.json"
+REPORT_FILENAME = "bulk_report.json"
+DEFAULT_RATIOS = ["square", "landscape"]
+
+
+def discover_sources(path: Path) -> list[dict]:
+    """Expand a directory, a ``.json`` manifest or a ``.csv`` manifest into source entries."""
+    if path.is_dir():
+        return [
+            {"path": str(source)}
+            for source in sorted(path.rglob("*"))
+            if source.is_file() and source.suffix.lower() in VIDEO_EXTENSIONS
+        ]
+    if path.suffix.lower() == ".json":
+        items = json.loads(path.read_text())
+        if isinstance(items, dict):
+            items = items.get("files", [])
+        entries = [item if isinstance(item, dict) else {"path": str(item)} for item in items]
+    elif path.suffix.lower() == ".csv":
+        with path.open(newline="") as handle:
+            entries = [dict(row) for row in csv.DictReader(handle)]
+    elif path.suffix.lower() in VIDEO_EXTENSIONS:
+        entries = [{"path": str(path)}]
+    else:
+        raise ValueError(f"Not a directory, manifest or video: {path}")
+
+    sources = []
+    for entry in entries:
+        if not entry.get("path"):
+            continue
+        source = Path(entry["path"]).expanduser()
+        if not source.is_absolute():
+            source = path.parent / source
+        ratios = entry.get("ratios")
+        if isinstance(ratios, str):
+            ratios = ratios.replace(";", " ").replace(",", " ").split()
+        sources.append(
+            {
+                "path": str(source),
+                "base": entry.get("base") or None,
+                "style": entry.get("style") or None,
+                "ratios": ratios or None,
+            }
+        )
+    return sources
+
+
+def clean_interrupted_outputs(output_dir: Path) -> None:
+    """Delete outputs a killed run left half-written (they still carry a rendering marker)."""
+    for marker in output_dir.glob(".*.rendering"):
+        partial = output_dir / marker.name[1 : -len(".rendering")]
+        partial.unlink(missing_ok=True)
+        marker.unlink(missing_ok=True)
+        logging.info("Removed interrupted output %s", partial.name)
+
+
+def existing_outputs(summary: dict, output_dir: Path) -> dict[str, set[str]]:
+    """Map each recorded source to the ratios whose output file is still on disk."""
+    done: dict[str, set[str]] = {}
+    for video in summary.get("videos", []):
+        source = video.get("source")
+        if not source:
+            continue
+        for stat in video.get("output_stats", []):
+            if stat.get("aspect_key") and (output_dir / stat["filename"]).exists():
+                done.setdefault(source, set()).add(stat["aspect_key"])
+    return done
+
+
+def probe_duration(path: Path) -> Optional[float]:
+    try:
+        return ffmpeg_parse_infos(str(path)).get("duration")
+    except (IOError, OSError):
+        return None
+
+
+def render_source(task: dict) -> dict:
+    """Worker entry point: render the missing ratios of one source into the shared output directory."""
+    source = Path(task["path"])
+    output_dir = Path(task["output_dir"])
+    naming_state = {
+        "config": task["naming_config"],
+        "base_info": prepare_base_info(source.name, task["base"], task["naming_config"]),
+        "sequence_start": task["sequence_start"],
+    }
+    started = time.monotonic()
+    outputs = render_variants(
+        source,
+        output_dir,
+        task["style"],
+        f"bulk-{uuid.uuid4().hex}",
+        task["ratios"],
+        naming_state,
+        task["encode_settings"],
+        # Files already render in parallel processes; ratios of one file stay in its process.
+        ratio_workers=1,
+    )
+    return {
+        "outputs": outputs,
+        "base_clean": naming_state["base_info"]["base_clean"],
+        "duration": probe_duration(source),
+        "elapsed": time.monotonic() - started,
+    }
+
+
+def summary_entry_for(task: dict, result: dict) -> dict:
+    outputs = result["outputs"]
+    ratio_labels = []
+    for item in outputs:
+        if item["ratio_label"] not in ratio_labels:
+            ratio_labels.append(item["ratio_label"])
+    return {
+        "source": task["path"],
+        "original_name": Path(task["path"]).name,
+        "display_name": result["base_clean"],
+        "style": STYLE_LABELS.get(task["style"], task["style"]),
+        "ratios": task["ratios"],
+        "ratio_labels": ratio_labels,
+        "outputs": [item["filename"] for item in outputs],
+        "encode": task["encode_settings"],
+        "output_stats": [
+            {key: item.get(key) for key in ("filename", "aspect_key", "size_bytes", "bitrate_kbps")}
+            for item in outputs
+        ],
+        "render_seconds": round(result["elapsed"], 2),
+    }
+
+
+def plan_tasks(settings: dict, output_dir: Path) -> tuple[list[dict], int]:
+    """Build one task per source that still has missing outputs; returns (tasks, skipped_outputs)."""
+    summary = load_summary(output_dir)
+    naming_config = build_naming_config(output_dir, settings["naming"])
+    done = existing_outputs(summary, output_dir)
+
+    tasks = []
+    skipped = 0
+    seen_bases: dict[str, int] = {}
+    sequence_start = 0
+    for entry in settings["sources"]:
+        ratios = [key for key in entry.get("ratios") or settings["ratios"] if key in ASPECT_OPTIONS]
+        # Sequence numbers follow manifest order, so a resumed run names files like the first one.
+        entry_sequence_start = sequence_start
+        sequence_start += len(ratios)
+        style = entry.get("style") or settings["style"]
+        base = entry.get("base")
+        # Clips that share a name in different folders would otherwise collide in the flat output dir.
+        base_clean = prepare_base_info(Path(entry["path"]).name, base, naming_config)["base_clean"]
+        seen_bases[base_clean] = seen_bases.get(base_clean, 0) + 1
+        if seen_bases[base_clean] > 1 and not base:
+            base = f"{base_clean}_{seen_bases[base_clean]}"
+
+        missing = [key for key in ratios if key not in done.get(entry["path"], set())]
+        skipped += len(ratios) - len(missing)
+        if not missing:
+            continue
+        tasks.append(
+            {
+                "path": entry["path"],
+                "base": base,
+                "style": style,
+                "ratios": missing,
+                "output_dir": str(output_dir),
+                "naming_config": naming_config,
+                "encode_settings": settings["encode"],
+                "sequence_start": entry_sequence_start + len(ratios) - len(missing),
+            }
+        )
+    return tasks, skipped
+
+
+def run(settings: dict, output_dir: Path, workers: int) -> dict:
+    output_dir.mkdir(parents=True, exist_ok=True)
+    clean_interrupted_outputs(output_dir)
+    tasks, skipped = plan_tasks(settings, output_dir)
+    logging.info(
+        "%d file(s) to render, %d existing output(s) skipped, %d worker(s)", len(tasks), skipped, workers
+    )
+
+    report = {
+        "files_total": len(settings["sources"]),
+        "files_rendered": 0,
+        "files_failed": 0,
+        "outputs_rendered": 0,
+        "outputs_skipped": skipped,
+        "source_seconds": 0.0,
+        "output_bytes": 0,
+        "failures": [],
+    }
+    started = time.monotonic()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(render_source, task): task for task in tasks}
+        for finished, future in enumerate(as_completed(futures), start=1):
+            task = futures[future]
+            name = Path(task["path"]).name
+            try:
+                result = future.result()
+            except Exception as exc:  # keep going; the file is retried on the next run
+                report["files_failed"] += 1
+                report["failures"].append({"source": task["path"], "error": str(exc)})
+                logging.error("[%d/%d] %s failed: %s", finished, len(tasks), name, exc)
+                continue
+            # Only the parent writes the summary, so workers never race on it.
+            append_summary(output_dir, summary_entry_for(task, result), task["naming_config"])
+            report["files_rendered"] += 1
+            report["outputs_rendered"] += len(result["outputs"])
+            report["source_seconds"] += result["duration"] or 0.0
+            report["output_bytes"] += sum(item["size_bytes"] for item in result["outputs"])
+            logging.info(
+                "[%d/%d] %s -> %s (%.1fs)",
+                finished,
+                len(tasks),
+                name,
+                ", ".join(item["filename"] for item in result["outputs"]),
+                result["elapsed"],
+            )
+
+    wall_seconds = time.monotonic() - started
+    report.update(
+        {
+            "workers": workers,
+            "wall_seconds": round(wall_seconds, 2),
+            "source_seconds": round(report["source_seconds"], 2),
+            "files_per_minute": round(report["files_rendered"] * 60 / wall_seconds, 2) if wall_seconds else None,
+            "outputs_per_minute": round(report["outputs_rendered"] * 60 / wall_seconds, 2) if wall_seconds else None,
+            # Seconds of source footage processed per wall-clock second, across all workers.
+            "realtime_factor": round(report["source_seconds"] / wall_seconds, 2) if wall_seconds else None,
+        }
+    )
+    (output_dir / REPORT_FILENAME).write_text(json.dumps(report, indent=2))
+    return report
+
+
+def build_settings(args) -> dict:
+    sources = []
+    for path in args.inputs:
+        sources.extend(discover_sources(Path(path).expanduser()))
+    naming = {"naming_mode": "custom" if args.pattern else "auto"}
+    if args.pattern:
+        naming["naming_preset"] = args.pattern if args.pattern in PATTERN_PRESETS else "custom"
+        naming["naming_custom_pattern"] = "" if args.pattern in PATTERN_PRESETS else args.pattern
+        naming["naming_add_sequence"] = str(args.sequence)
+        naming["naming_append_date"] = str(args.date)
+    encode = build_encode_settings(
+        {
+            "rate_control": args.rate_control,
+            "quality": args.quality,
+            "target_size_mb": args.target_size_mb,
+            "max_bitrate_kbps": args.max_bitrate_kbps,
+        },
+        {"preset": args.preset, "max_fps": args.max_fps, "max_long_edge": args.max_long_edge},
+    )
+    return {
+        "sources": sources,
+        "style": args.style,
+        "ratios": args.ratios,
+        "naming": naming,
+        "encode": encode,
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Reframe a directory or manifest of clips without the web app.")
+    parser.add_argument("inputs", nargs="*", help="Directories, .json/.csv manifests or individual videos")
+    parser.add_argument("-o", "--output", type=Path, required=True, help="Directory for outputs, summary and report")
+    parser.add_argument("--style", choices=sorted(STYLE_LABELS), default="blur")
+    parser.add_argument("--ratios", nargs="+", choices=sorted(ASPECT_OPTIONS), default=DEFAULT_RATIOS)
+    parser.add_argument(
+        "--pattern",
+        help=f"Naming preset ({', '.join(PATTERN_PRESETS)}) or a custom pattern such as '{{base_clean}}_{{ratio}}.{{ext}}'",
+    )
+    parser.add_argument("--sequence", action="store_true", help="Append a sequence number (custom patterns only)")
+    parser.add_argument("--date", action="store_true", help="Append the date stamp (custom patterns only)")
+    parser.add_argument("--rate-control", choices=["crf", "target_size", "capped"])
+    parser.add_argument("--quality", choices=["high", "standard", "compact"])
+    parser.add_argument("--target-size-mb", type=float)
+    parser.add_argument("--max-bitrate-kbps", type=int)
+    parser.add_argument(
+        "--preset",
+        choices=[*X264_PRESET_COST, ADAPTIVE_PRESET],
+        help="x264 preset, or 'adaptive' to pick the slowest one expected to finish within DEFAULT_DEADLINE_FACTOR x the clip length",
+    )
+    parser.add_argument("--max-fps", type=int, help="Cap the output frame rate")
+    parser.add_argument("--max-long-edge", type=int, help="Cap the output resolution (long edge in pixels)")
+    parser.add_argument("-j", "--workers", type=int, default=os.cpu_count() or 1, help="Parallel render processes")
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help=f"Continue the run recorded in OUTPUT/{MANIFEST_FILENAME}, ignoring inputs and render options",
+    )
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+
+    manifest_path = args.output / MANIFEST_FILENAME
+    if args.resume:
+        if not manifest_path.exists():
+            parser.error(f"--resume needs an earlier run in {args.output}")
+        settings = json.loads(manifest_path.read_text())
+    else:
+        if not args.inputs:
+            parser.error("give at least one input directory, manifest or video (or --resume)")
+        settings = build_settings(args)
+        args.output.mkdir(parents=True, exist_ok=True)
+        # Recorded before rendering starts so an interrupted run can be resumed with the same plan.
+        manifest_path.write_text(json.dumps(settings, indent=2))
+
+    report = run(settings, args.output, max(1, args.workers))
+    print(json.dumps(report, indent=2))
+    return 1 if report["files_failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -27,7 +27,7 @@ class Config:
     MAX_CONTENT_LENGTH = int(os.getenv('MAX_CONTENT_LENGTH_MB', 120)) * 1024 * 1024  # MB to bytes
 
     # Video processing limits
-    CLIENT_DURATION_LIMIT_SECONDS = int(os.getenv('CLIENT_DURATION_LIMIT_SECONDS', 75))
+    CLIENT_DURATION_LIMIT_SECONDS = int(os.getenv('CLIENT_DURATION_LIMIT_SECONDS', 120))
     MAX_SERVER_DURATION_SECONDS = int(os.getenv('MAX_SERVER_DURATION_SECONDS', 180))
     MAX_BATCH_SIZE = int(os.getenv('MAX_BATCH_SIZE', 10))
 
@@ -43,6 +43,27 @@ class Config:
     # Cleanup settings
     AUTO_CLEANUP_HOURS = int(os.getenv('AUTO_CLEANUP_HOURS', 24))
 
+    # Encode profiles per tier: what a server render may cost.
+    # 'preset' is an x264 preset or 'adaptive', which picks the slowest preset
+    # expected to finish within 'deadline_factor' x the clip duration.
+    ENCODE_PROFILES = {
+        'free': {
+            'max_fps': int(os.getenv('FREE_MAX_FPS', 30)),
+            'max_long_edge': int(os.getenv('FREE_MAX_LONG_EDGE', 1280)),
+            'preset': os.getenv('FREE_ENCODE_PRESET', 'veryfast'),
+            'rate_control': 'crf',
+            'quality': 'compact',
+        },
+        'paid': {
+            'max_fps': int(os.getenv('PAID_MAX_FPS', 60)),
+            'max_long_edge': int(os.getenv('PAID_MAX_LONG_EDGE', 1920)),
+            'preset': os.getenv('PAID_ENCODE_PRESET', 'adaptive'),
+            'deadline_factor': float(os.getenv('PAID_DEADLINE_FACTOR', 1.5)),
+            'rate_control': 'crf',
+            'quality': 'standard',
+        },
+    }
+
     # Ensure directories exist
     UPLOAD_FOLDER.mkdir(exist_ok=True)
     OUTPUT_FOLDER.mkdir(exist_ok=True)
@@ -73,6 +73,10 @@ sudo ${APP_DIR}/venv/bin/pip install --upgrade pip
 sudo ${APP_DIR}/venv/bin/pip install -r requirements.txt
 sudo ${APP_DIR}/venv/bin/pip install gunicorn debugpy
 
+# Fingerprint and precompress static assets
+echo -e "${YELLOW}Building static assets...${NC}"
+sudo ${APP_DIR}/venv/bin/python build_assets.py
+
 # Create necessary directories
 echo -e "${YELLOW}Creating upload/output directories...${NC}"
 sudo mkdir -p ${APP_DIR}/uploads ${APP_DIR}/outputs ${APP_DIR}/backups
@@ -222,6 +226,13 @@ server {
         proxy_set_header X-Real-IP $remote_addr;
     }
 
+    # Readiness endpoint (no rate limit): 503 while the instance is saturated or cannot render
+    location /ready {
+        proxy_pass http://autoframe_app;
+        proxy_set_header Host $host;
+        proxy_set_header X-Real-IP $remote_addr;
+    }
+
     # Upload endpoint (strict rate limit)
     location /upload {
         limit_req zone=upload_limit burst=5 nodelay;
@@ -51,6 +51,12 @@ source venv/bin/activate
 pip install -r requirements.txt --upgrade --quiet
 echo -e "${GREEN}✓ Dependencies updated${NC}"
 
+# Fingerprint and precompress static assets
+echo ""
+echo -e "${YELLOW}Building static assets...${NC}"
+python build_assets.py
+echo -e "${GREEN}✓ Static assets built${NC}"
+
 # Set permissions
 echo ""
 echo -e "${YELLOW}Setting permissions...${NC}"
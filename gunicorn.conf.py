@@ -15,16 +15,32 @@ backlog = 2048
 # Formula: (2 x CPU cores) + 1 is standard, but we reduce it for video processing
 cpu_count = multiprocessing.cpu_count()
 workers = max(2, cpu_count)  # At least 2 workers, max = CPU count
+if os.getenv('RENDER_MODE') in ('external', 'farm'):
+    workers = 2  # Async I/O workers; the render service or farm nodes own the CPU
 
 # Worker class
-worker_class = 'sync'  # Sync workers for video processing
+# With RENDER_MODE=external or farm the web tier only moves bytes (uploads, downloads,
+# progress polls) and renders run in `flask --app app render-service` or on
+# `render_node.py` hosts, so an event-driven worker serves worker_connections
+# clients each. Inline rendering keeps sync workers, which render inside the request.
+render_mode = os.getenv('RENDER_MODE', 'inline')
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gevent' if render_mode in ('external', 'farm') else 'sync')
 worker_connections = 1000
-max_requests = 100  # Restart workers after N requests to prevent memory leaks
+async_workers = worker_class != 'sync'
+if async_workers:
+    # One async worker carries hundreds of clients polling every second or two, so a
+    # request-count recycle would restart it every few seconds and cut off uploads,
+    # streamed downloads and sync /api/process waiters in flight.
+    max_requests = 0
+else:
+    max_requests = 100  # Restart workers after N requests to prevent memory leaks
 max_requests_jitter = 10  # Add randomness to prevent all workers restarting simultaneously
 
 # Timeouts
 timeout = 300  # 5 minutes - enough for processing 200MB videos
-graceful_timeout = 30  # Graceful shutdown timeout
+# Async workers let in-flight transfers finish on restart: a 200MB upload or download on a
+# slow link, or a sync /api/process call waiting out RENDER_WAIT_QUEUE_SECONDS plus its render.
+graceful_timeout = 900 if async_workers else 30
 keepalive = 2
 
 # Logging
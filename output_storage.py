@@ -0,0 +1,285 @@
+"""
+Output storage for Free AutoFrame.
+
+Rendered outputs are addressed by their job folder (``OUTPUT_DIR/<job_id>/``) and
+file name. With ``OUTPUT_STORAGE=local`` (the default) they simply stay in that
+folder. With ``OUTPUT_STORAGE=s3`` they live in an S3-compatible bucket under
+``S3_PREFIX<job_id>/<name>``: encodes are streamed into a multipart upload while
+ffmpeg is still writing them, the local file is only scratch space until the
+render of its source finishes, and downloads are redirected to presigned URLs.
+A zero-byte ``.<name>.stored`` sidecar in the job folder marks outputs that are
+in the bucket, so every worker and the render service sharing OUTPUT_DIR agree.
+
+Any S3 API works (AWS S3, MinIO, Cloudflare R2, ...). To try it locally, start a
+stand-in such as ``moto_server -p 9000`` or MinIO and set ``S3_ENDPOINT_URL``.
+"""
+
+import logging
+import os
+import shutil
+import time
+import uuid
+from contextlib import closing
+from pathlib import Path
+from threading import Event, Thread
+from typing import Optional
+
+try:
+    import boto3
+    from boto3.s3.transfer import TransferConfig
+except ImportError:  # Only needed for OUTPUT_STORAGE=s3
+    boto3 = None
+
+OUTPUT_STORAGE = os.environ.get("OUTPUT_STORAGE", "local").lower()
+S3_BUCKET = os.environ.get("S3_BUCKET", "")
+S3_ENDPOINT_URL = os.environ.get("S3_ENDPOINT_URL") or None
+S3_REGION = os.environ.get("S3_REGION") or None
+S3_PREFIX = os.environ.get("S3_PREFIX", "outputs/")
+S3_PRESIGN_SECONDS = int(os.environ.get("S3_PRESIGN_SECONDS", "3600"))
+# S3 rejects multipart parts below 5 MB (except the last one).
+S3_PART_BYTES = max(5, int(os.environ.get("S3_PART_MB", "8"))) * 1024 * 1024
+FOLLOW_POLL_SECONDS = 0.25
+COPY_CHUNK_BYTES = 1024 * 1024
+
+
+def stored_marker(path: Path) -> Path:
+    """Sidecar that marks ``path`` as kept in the object store instead of on local disk."""
+    return path.with_name(f".{path.name}.stored")
+
+
+def stored_names(job_dir: Path) -> list[str]:
+    return [marker.name[1:-len(".stored")] for marker in job_dir.glob(".*.stored")]
+
+
+class LocalStorage:
+    """Outputs stay in the job folder the encoder wrote them to."""
+
+    kind = "local"
+    remote = False
+
+    def has(self, job_dir: Path, filename: str) -> bool:
+        return (job_dir / filename).is_file()
+
+    def follow(self, job_dir: Path, filename: str, marker: Path):
+        return None
+
+    def store(self, job_dir: Path, filename: str, upload=None) -> None:
+        pass
+
+    def receive(self, job_dir: Path, filename: str, stream) -> None:
+        staging = job_dir / f".{filename}.{uuid.uuid4().hex}"
+        try:
+            with staging.open("wb") as handle:
+                shutil.copyfileobj(stream, handle, COPY_CHUNK_BYTES)
+            os.replace(staging, job_dir / filename)
+        finally:
+            staging.unlink(missing_ok=True)
+
+    def release(self, job_dir: Path, filenames: list[str]) -> None:
+        pass
+
+    def url(self, job_dir: Path, filename: str) -> Optional[str]:
+        return None
+
+    def open(self, job_dir: Path, filename: str):
+        return (job_dir / filename).open("rb")
+
+    def delete(self, job_dir: Path, filenames: list[str]) -> None:
+        for filename in filenames:
+            (job_dir / filename).unlink(missing_ok=True)
+
+    def sweep(self, cutoff: float) -> tuple[int, int]:
+        # Job folders, and the outputs in them, are removed by the cleanup worker itself.
+        return 0, 0
+
+
+class MultipartWriter:
+    """Write-only file object that sends what it is given to S3 as a multipart upload."""
+
+    def __init__(self, client, bucket: str, key: str, part_bytes: int = S3_PART_BYTES):
+        self.client, self.bucket, self.key, self.part_bytes = client, bucket, key, part_bytes
+        self.upload_id = client.create_multipart_upload(Bucket=bucket, Key=key, ContentType="video/mp4")["UploadId"]
+        self.parts: list[dict] = []
+        self.buffer = bytearray()
+        self.size = 0
+
+    def write(self, data) -> int:
+        self.buffer += data
+        self.size += len(data)
+        while len(self.buffer) >= self.part_bytes:
+            self._send(bytes(self.buffer[:self.part_bytes]))
+            del self.buffer[:self.part_bytes]
+        return len(data)
+
+    def _send(self, body: bytes) -> None:
+        number = len(self.parts) + 1
+        reply = self.client.upload_part(
+            Bucket=self.bucket, Key=self.key, UploadId=self.upload_id, PartNumber=number, Body=body
+        )
+        self.parts.append({"ETag": reply["ETag"], "PartNumber": number})
+
+    def close(self) -> None:
+        if self.buffer or not self.parts:
+            self._send(bytes(self.buffer))
+            self.buffer.clear()
+        self.client.complete_multipart_upload(
+            Bucket=self.bucket, Key=self.key, UploadId=self.upload_id, MultipartUpload={"Parts": self.parts}
+        )
+
+    def abort(self) -> None:
+        try:
+            self.client.abort_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id)
+        except Exception as exc:  # the bucket's lifecycle rules reap it otherwise
+            logging.warning("Aborting the upload of %s failed: %s", self.key, exc)
+
+
+class GrowingFileUpload:
+    """Upload a file while the encoder is still appending to it, until its rendering marker goes."""
+
+    def __init__(self, writer: MultipartWriter, path: Path, marker: Path):
+        self.writer, self.path, self.marker = writer, path, marker
+        self.stop = Event()
+        self.error: Optional[BaseException] = None
+        self.thread = Thread(target=self.run, daemon=True, name=f"Upload-{path.name}")
+        self.thread.start()
+
+    def run(self) -> None:
+        try:
+            while not self.path.exists():
+                if self.stop.is_set() or not self.marker.exists():
+                    return
+                time.sleep(FOLLOW_POLL_SECONDS)
+            with self.path.open("rb") as handle:
+                while not self.stop.is_set():
+                    chunk = handle.read(COPY_CHUNK_BYTES)
+                    if chunk:
+                        self.writer.write(chunk)
+                        continue
+                    if not self.marker.exists():
+                        # Encoding finished: drain what was flushed last.
+                        shutil.copyfileobj(handle, self.writer, COPY_CHUNK_BYTES)
+                        return
+                    time.sleep(FOLLOW_POLL_SECONDS)
+        except Exception as exc:
+            self.error = exc
+
+    def finish(self) -> None:
+        """Complete the upload; call once the marker is gone."""
+        self.thread.join()
+        if self.error is not None:
+            self.writer.abort()
+            raise RuntimeError(f"Uploading {self.path.name} failed: {self.error}") from self.error
+        self.writer.close()
+
+    def abort(self) -> None:
+        self.stop.set()
+        self.thread.join()
+        self.writer.abort()
+
+
+class S3Storage:
+    """Outputs in an S3-compatible bucket, downloaded through presigned URLs."""
+
+    kind = "s3"
+    remote = True
+
+    def __init__(self, bucket: str, prefix: str = S3_PREFIX, endpoint_url: Optional[str] = S3_ENDPOINT_URL):
+        self.bucket, self.prefix = bucket, prefix
+        self.client = boto3.client("s3", endpoint_url=endpoint_url, region_name=S3_REGION)
+        self.transfer = TransferConfig(multipart_threshold=S3_PART_BYTES, multipart_chunksize=S3_PART_BYTES)
+
+    def key(self, job_dir: Path, filename: str) -> str:
+        return f"{self.prefix}{job_dir.name}/{filename}"
+
+    def has(self, job_dir: Path, filename: str) -> bool:
+        return stored_marker(job_dir / filename).exists()
+
+    def follow(self, job_dir: Path, filename: str, marker: Path) -> GrowingFileUpload:
+        """Start streaming ``job_dir/filename`` to the bucket while it is being encoded."""
+        writer = MultipartWriter(self.client, self.bucket, self.key(job_dir, filename))
+        return GrowingFileUpload(writer, job_dir / filename, marker)
+
+    def store(self, job_dir: Path, filename: str, upload: Optional[GrowingFileUpload] = None) -> None:
+        """Finish ``upload``, or upload the finished file, and mark the output as stored."""
+        if upload is not None:
+            upload.finish()
+        else:
+            self.client.upload_file(
+                str(job_dir / filename),
+                self.bucket,
+                self.key(job_dir, filename),
+                ExtraArgs={"ContentType": "video/mp4"},
+                Config=self.transfer,
+            )
+        stored_marker(job_dir / filename).touch()
+
+    def receive(self, job_dir: Path, filename: str, stream) -> None:
+        writer = MultipartWriter(self.client, self.bucket, self.key(job_dir, filename))
+        try:
+            shutil.copyfileobj(stream, writer, COPY_CHUNK_BYTES)
+            writer.close()
+        except BaseException:
+            writer.abort()
+            raise
+        stored_marker(job_dir / filename).touch()
+
+    def release(self, job_dir: Path, filenames: list[str]) -> None:
+        """Drop the local scratch copies of outputs that are safely in the bucket."""
+        for filename in filenames:
+            if self.has(job_dir, filename):
+                (job_dir / filename).unlink(missing_ok=True)
+
+    def url(self, job_dir: Path, filename: str) -> Optional[str]:
+        if not self.has(job_dir, filename):
+            return None
+        return self.client.generate_presigned_url(
+            "get_object",
+            Params={
+                "Bucket": self.bucket,
+                "Key": self.key(job_dir, filename),
+                "ResponseContentDisposition": f'attachment; filename="{filename}"',
+            },
+            ExpiresIn=S3_PRESIGN_SECONDS,
+        )
+
+    def open(self, job_dir: Path, filename: str):
+        if not self.has(job_dir, filename):
+            return (job_dir / filename).open("rb")
+        body = self.client.get_object(Bucket=self.bucket, Key=self.key(job_dir, filename))["Body"]
+        return closing(body)
+
+    def delete(self, job_dir: Path, filenames: list[str]) -> None:
+        keys = [{"Key": self.key(job_dir, name)} for name in filenames if self.has(job_dir, name)]
+        if keys:
+            self.client.delete_objects(Bucket=self.bucket, Delete={"Objects": keys, "Quiet": True})
+        for filename in filenames:
+            stored_marker(job_dir / filename).unlink(missing_ok=True)
+            (job_dir / filename).unlink(missing_ok=True)
+
+    def sweep(self, cutoff: float) -> tuple[int, int]:
+        """Delete stored outputs last written before ``cutoff`` (a UNIX timestamp)."""
+        expired: list[dict] = []
+        freed_bytes = 0
+        pages = self.client.get_paginator("list_objects_v2").paginate(Bucket=self.bucket, Prefix=self.prefix)
+        for page in pages:
+            for item in page.get("Contents", []):
+                if item["LastModified"].timestamp() < cutoff:
+                    expired.append({"Key": item["Key"]})
+                    freed_bytes += item["Size"]
+        for start in range(0, len(expired), 1000):
+            self.client.delete_objects(
+                Bucket=self.bucket, Delete={"Objects": expired[start:start + 1000], "Quiet": True}
+            )
+        return len(expired), freed_bytes
+
+
+def create_output_storage(kind: str = OUTPUT_STORAGE):
+    if kind == "local":
+        return LocalStorage()
+    if kind == "s3":
+        if boto3 is None:
+            raise RuntimeError("OUTPUT_STORAGE=s3 needs boto3 (pip install boto3)")
+        if not S3_BUCKET:
+            raise RuntimeError("OUTPUT_STORAGE=s3 needs S3_BUCKET")
+        return S3Storage(S3_BUCKET)
+    raise RuntimeError(f"Unknown OUTPUT_STORAGE {kind!r}; use 'local' or 's3'")
@@ -0,0 +1,163 @@
+"""SQLite job broker for the render farm (RENDER_MODE=farm).
+
+The web node owns the database; render nodes never open it. They talk to the web
+node over HTTP (see ``render_node.py``) and the routes there call into this broker
+to hand out tasks, extend leases while nodes report progress and take tasks back
+when a node stops reporting.
+"""
+
+import json
+import sqlite3
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Optional
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    task_id TEXT PRIMARY KEY,
+    job_id TEXT NOT NULL,
+    file_index INTEGER NOT NULL,
+    payload TEXT NOT NULL,
+    state TEXT NOT NULL DEFAULT 'pending',
+    node TEXT,
+    lease_until REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS tasks_state ON tasks (state, created_at);
+CREATE TABLE IF NOT EXISTS nodes (
+    node TEXT PRIMARY KEY,
+    state TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+"""
+
+
+class RenderBroker:
+    def __init__(self, path: Path, lease_seconds: float = 60.0):
+        self.path = Path(path)
+        self.lease_seconds = lease_seconds
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self.connect() as conn:
+            conn.executescript(SCHEMA)
+
+    @contextmanager
+    def connect(self):
+        # One short-lived connection per call: safe across threads, gevent and gunicorn workers.
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            yield conn
+        finally:
+            conn.close()
+
+    @contextmanager
+    def transaction(self):
+        with self.connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+
+    def enqueue(self, job_id: str, index: int, payload: dict) -> str:
+        task_id = uuid.uuid4().hex
+        with self.connect() as conn:
+            conn.execute(
+                "INSERT INTO tasks (task_id, job_id, file_index, payload, created_at) VALUES (?, ?, ?, ?, ?)",
+                (task_id, job_id, index, json.dumps(payload), time.time()),
+            )
+        return task_id
+
+    def claim(self, node: str) -> Optional[dict]:
+        """Lease the oldest pending task to ``node``; files of one job are handed out one at a time."""
+        now = time.time()
+        with self.transaction() as conn:
+            # Tasks of nodes that stopped reporting go back to the queue first.
+            conn.execute(
+                "UPDATE tasks SET state = 'pending', node = NULL, lease_until = NULL "
+                "WHERE state = 'claimed' AND lease_until < ?",
+                (now,),
+            )
+            row = conn.execute(
+                "SELECT * FROM tasks WHERE state = 'pending' AND job_id NOT IN "
+                "(SELECT job_id FROM tasks WHERE state = 'claimed') ORDER BY created_at LIMIT 1"
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE tasks SET state = 'claimed', node = ?, lease_until = ?, attempts = attempts + 1 "
+                "WHERE task_id = ?",
+                (node, now + self.lease_seconds, row["task_id"]),
+            )
+            row = conn.execute("SELECT * FROM tasks WHERE task_id = ?", (row["task_id"],)).fetchone()
+        return self._task(row, node)
+
+    def renew(self, task_id: str, node: str) -> Optional[dict]:
+        """Extend the lease of a task ``node`` still holds; None once it was taken away."""
+        with self.transaction() as conn:
+            updated = conn.execute(
+                "UPDATE tasks SET lease_until = ? WHERE task_id = ? AND node = ? AND state = 'claimed'",
+                (time.time() + self.lease_seconds, task_id, node),
+            ).rowcount
+            row = conn.execute("SELECT * FROM tasks WHERE task_id = ?", (task_id,)).fetchone()
+        return self._task(row, node) if updated else None
+
+    def get(self, task_id: str, node: Optional[str] = None) -> Optional[dict]:
+        with self.connect() as conn:
+            row = conn.execute("SELECT * FROM tasks WHERE task_id = ?", (task_id,)).fetchone()
+        if row is None or (node is not None and row["node"] != node):
+            return None
+        return self._task(row, row["node"])
+
+    def finish(self, task_id: str, node: Optional[str] = None) -> bool:
+        """Remove a task; with ``node``, only while that node still holds its lease."""
+        with self.connect() as conn:
+            if node is None:
+                return conn.execute("DELETE FROM tasks WHERE task_id = ?", (task_id,)).rowcount > 0
+            return conn.execute(
+                "DELETE FROM tasks WHERE task_id = ? AND node = ?", (task_id, node)
+            ).rowcount > 0
+
+    def drop_job(self, job_id: str) -> int:
+        """Remove a job's tasks that no node has started yet."""
+        with self.connect() as conn:
+            return conn.execute(
+                "DELETE FROM tasks WHERE job_id = ? AND state = 'pending'", (job_id,)
+            ).rowcount
+
+    def pending(self) -> list[dict]:
+        with self.connect() as conn:
+            rows = conn.execute("SELECT payload FROM tasks WHERE state = 'pending' ORDER BY created_at").fetchall()
+        return [json.loads(row["payload"]) for row in rows]
+
+    def report_node(self, node: str, state: dict) -> None:
+        with self.connect() as conn:
+            conn.execute(
+                "INSERT INTO nodes (node, state, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT (node) DO UPDATE SET state = excluded.state, updated_at = excluded.updated_at",
+                (node, json.dumps(state), time.time()),
+            )
+
+    def nodes(self, stale_seconds: float) -> list[dict]:
+        with self.connect() as conn:
+            rows = conn.execute(
+                "SELECT node, state FROM nodes WHERE updated_at >= ?", (time.time() - stale_seconds,)
+            ).fetchall()
+        return [{**json.loads(row["state"]), "node": row["node"]} for row in rows]
+
+    @staticmethod
+    def _task(row: sqlite3.Row, node: Optional[str]) -> dict:
+        return {
+            **json.loads(row["payload"]),
+            "task_id": row["task_id"],
+            "job_id": row["job_id"],
+            "index": row["file_index"],
+            "node": node,
+            "attempts": row["attempts"],
+        }
@@ -0,0 +1,2149 @@
+"""
+Rendering core for Free AutoFrame.
+
+Everything needed to turn one source clip into its reframed outputs: the style
+builders and geometry planner, encode settings, output naming, batch summaries,
+progress reporting and per-job memory accounting. Nothing here imports Flask, so
+the web app (app.py) and the bulk CLI (bulk_render.py) share the same engine.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import queue
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from threading import Condition, Event, Thread, local
+from typing import Callable, Optional
+
+import numpy as np
+from PIL import Image
+from proglog import ProgressBarLogger
+
+from moviepy.audio.io import readers as audio_readers
+from moviepy.config import get_setting
+from moviepy.editor import AudioFileClip, VideoFileClip
+from moviepy.video.VideoClip import VideoClip
+from moviepy.video.io import ffmpeg_reader, ffmpeg_writer
+from moviepy.audio.io.ffmpeg_audiowriter import FFMPEG_AudioWriter
+from moviepy.audio.io.readers import FFMPEG_AudioReader
+from moviepy.video.io.ffmpeg_reader import FFMPEG_VideoReader, ffmpeg_parse_infos
+from moviepy.video.io.ffmpeg_writer import FFMPEG_VideoWriter
+
+from output_storage import create_output_storage, stored_marker
+
+if not hasattr(Image, "ANTIALIAS"):
+    resample_filter = None
+    try:
+        resample_filter = Image.Resampling.LANCZOS  # Pillow >= 9.1
+    except AttributeError:
+        pass
+    if resample_filter is None:
+        resample_filter = getattr(Image, "LANCZOS", None)
+    if resample_filter is None:
+        resample_filter = getattr(Image, "BICUBIC", None)
+    if resample_filter is not None:
+        Image.ANTIALIAS = resample_filter
+        if hasattr(Image, "Resampling") and not hasattr(Image.Resampling, "ANTIALIAS"):
+            setattr(Image.Resampling, "ANTIALIAS", resample_filter)
+
+_copying_write_frame = FFMPEG_VideoWriter.write_frame
+
+
+def _write_frame_buffer(self, img_array):
+    """Pass frames to ffmpeg's stdin as a buffer; MoviePy's version copies each one via tobytes()."""
+    try:
+        self.proc.stdin.write(memoryview(np.ascontiguousarray(img_array)).cast("B"))
+    except IOError:
+        # Let MoviePy collect ffmpeg's stderr and raise its descriptive error.
+        _copying_write_frame(self, img_array)
+
+
+FFMPEG_VideoWriter.write_frame = _write_frame_buffer
+
+
+def _registers_ffmpeg_process(method):
+    """Wrap a MoviePy method that spawns ``self.proc`` so the child is counted against the current job."""
+    def wrapper(self, *args, **kwargs):
+        result = method(self, *args, **kwargs)
+        register_job_process(getattr(self, "proc", None))
+        return result
+    return wrapper
+
+
+FFMPEG_VideoReader.initialize = _registers_ffmpeg_process(FFMPEG_VideoReader.initialize)
+FFMPEG_AudioReader.initialize = _registers_ffmpeg_process(FFMPEG_AudioReader.initialize)
+FFMPEG_VideoWriter.__init__ = _registers_ffmpeg_process(FFMPEG_VideoWriter.__init__)
+FFMPEG_AudioWriter.__init__ = _registers_ffmpeg_process(FFMPEG_AudioWriter.__init__)
+
+
+# Uploads can be rendered while they are still arriving. Such files carry a ``.receiving``
+# marker, and every ffmpeg that opens one uses the file protocol's follow mode so it waits
+# for more bytes at EOF instead of ending the stream early.
+RECEIVING_STALL_SECONDS = float(os.environ.get("UPLOAD_STALL_SECONDS", "60"))
+
+
+def receiving_marker(path: Path) -> Path:
+    return path.with_name(f".{path.name}.receiving")
+
+
+def ffmpeg_input_args(source: str) -> list[str]:
+    if not receiving_marker(Path(source)).exists():
+        return ["-i", source]
+    timeout_us = str(int(RECEIVING_STALL_SECONDS * 1_000_000))
+    return ["-follow", "1", "-rw_timeout", timeout_us, "-i", f"file:{source}"]
+
+
+class _FollowingSubprocess:
+    """``subprocess`` stand-in for MoviePy's ffmpeg modules that rewrites inputs still being received."""
+
+    def __getattr__(self, name):
+        return getattr(subprocess, name)
+
+    @staticmethod
+    def Popen(cmd, *args, **kwargs):
+        rewritten = []
+        index = 0
+        while index < len(cmd):
+            if cmd[index] == "-i" and index + 1 < len(cmd) and cmd[index + 1] != "-":
+                rewritten += ffmpeg_input_args(cmd[index + 1])
+                index += 2
+                continue
+            rewritten.append(cmd[index])
+            index += 1
+        return subprocess.Popen(rewritten, *args, **kwargs)
+
+
+ffmpeg_reader.sp = ffmpeg_writer.sp = audio_readers.sp = _FollowingSubprocess()
+
+
+def mp4_layout(path: Path, received: int) -> str:
+    """Where the moov atom sits in a (partial) MP4/MOV.
+
+    Returns ``"faststart"`` once a leading moov has fully arrived, ``"moov_at_end"`` when media
+    data comes first, ``"unknown"`` for other containers and ``"pending"`` while undecided.
+    """
+    offset = 0
+    with path.open("rb") as handle:
+        while offset + 8 <= received:
+            handle.seek(offset)
+            header = handle.read(16)
+            size = int.from_bytes(header[:4], "big")
+            box_type = header[4:8]
+            if offset == 0 and box_type != b"ftyp":
+                return "unknown"
+            if size == 1 and len(header) >= 16:
+                size = int.from_bytes(header[8:16], "big")
+            if box_type == b"moov":
+                return "faststart" if size and offset + size <= received else "pending"
+            if box_type == b"mdat":
+                return "moov_at_end"
+            if size < 8:
+                return "unknown"
+            offset += size
+    return "pending"
+
+
+STYLE_LABELS = {
+    "blur": "Blurred background letterbox",
+    "fill": "Fill & crop",
+    "black": "Black background letterbox",
+}
+STYLE_SHORT_LABELS = {
+    "blur": "blur",
+    "fill": "fill",
+    "black": "black",
+}
+ASPECT_OPTIONS = {
+    "portrait": {
+        "label": "9:16 Portrait",
+        "short": "9x16",
+        "description": "Vertical stories / shorts",
+        "size": (1080, 1920),
+        "suffix": "1080x1920",
+    },
+    "four_five": {
+        "label": "4:5 Portrait",
+        "short": "4x5",
+        "description": "Feeds & portrait posts",
+        "size": (1080, 1350),
+        "suffix": "1080x1350",
+    },
+    "square": {
+        "label": "1:1 Square",
+        "short": "1x1",
+        "description": "Feeds & carousels",
+        "size": (1080, 1080),
+        "suffix": "1080x1080",
+    },
+    "landscape": {
+        "label": "16:9 Landscape",
+        "short": "16x9",
+        "description": "YouTube & players",
+        "size": (1920, 1080),
+        "suffix": "1920x1080",
+    },
+}
+SUMMARY_FILENAME = "batch_summary.json"
+PATTERN_PRESETS = {
+    "base_ratio": "{base_clean}_{ratio}",
+    "base_ratio_style": "{base_clean}__{ratio}__{style}",
+    "base_dash_ratio": "{base_clean}-{ratio}",
+    "base_style": "{base_clean}__{style}",
+}
+DEFAULT_PATTERN_KEY = "base_ratio"
+VIDEO_EXTENSIONS = {".mp4", ".mov", ".m4v", ".mkv"}
+DATE_FORMAT = "%Y-%m-%d"
+RATE_CONTROL_MODES = {"crf", "target_size", "capped"}
+CRF_LEVELS = {"high": 18, "standard": 23, "compact": 28}
+DEFAULT_RATE_CONTROL = os.environ.get("DEFAULT_RATE_CONTROL", "crf")
+DEFAULT_QUALITY = os.environ.get("DEFAULT_QUALITY", "standard")
+DEFAULT_MAX_BITRATE_KBPS = int(os.environ.get("DEFAULT_MAX_BITRATE_KBPS", "8000"))
+AUDIO_BITRATE_KBPS = 128
+MIN_VIDEO_BITRATE_KBPS = 200
+# x264 presets from fastest to slowest, with their encode cost relative to veryfast.
+X264_PRESET_COST = {
+    "ultrafast": 0.45,
+    "superfast": 0.65,
+    "veryfast": 1.0,
+    "faster": 1.5,
+    "fast": 2.0,
+    "medium": 2.6,
+    "slow": 4.0,
+}
+ADAPTIVE_PRESET = "adaptive"
+DEFAULT_PRESET = os.environ.get("DEFAULT_PRESET", "veryfast")
+DEFAULT_DEADLINE_FACTOR = float(os.environ.get("DEFAULT_DEADLINE_FACTOR", "2"))
+# Render seconds per megapixel-frame at veryfast, used until this host has measured its own.
+DEFAULT_ENCODE_COST = 0.03
+ENCODE_SPEED_WINDOW = 20
+JOB_PROGRESS: dict[str, dict] = {}
+# A job is cancelled by dropping this marker into its output folder; renders in any process
+# notice it between frames (and the monitor thread kills their ffmpeg children).
+CANCEL_FILENAME = ".cancel"
+CANCEL_CHECK_SECONDS = 0.5
+# Output file currently being encoded per job, so /progress can link to the growing file.
+JOB_RENDERING_OUTPUT: dict[str, str] = {}
+# Write fragmented MP4 while encoding so outputs can be downloaded before they finish.
+FRAGMENTED_OUTPUT = os.environ.get("FRAGMENTED_OUTPUT", "1").lower() in {"1", "true", "yes", "on"}
+FRAGMENT_SECONDS = float(os.environ.get("FRAGMENT_SECONDS", "2"))
+# Long renders are encoded in time segments of this length and checkpointed next to the
+# outputs, so a render interrupted by a worker restart resumes instead of starting over.
+CHECKPOINT_SEGMENT_SECONDS = float(os.environ.get("CHECKPOINT_SEGMENT_SECONDS", "30"))
+# Ratios of one render are encoded by up to this many worker processes at once, all
+# reading the source decoded once into a memory-mapped frame store on local scratch.
+RATIO_WORKERS = int(os.environ.get("RATIO_WORKERS", str(os.cpu_count() or 1)))
+FRAME_STORE_DIR = Path(os.environ.get("FRAME_STORE_DIR", tempfile.gettempdir()))
+FRAME_STORE_MAX_MB = float(os.environ.get("FRAME_STORE_MAX_MB", "4096"))
+# x264 threads per encode; ratio workers split them between themselves.
+ENCODE_THREADS = int(os.environ.get("ENCODE_THREADS", "0")) or os.cpu_count() or 4
+
+
+class JobCancelled(Exception):
+    """Raised inside a render once its job has been cancelled."""
+
+
+def is_cancelled(job_dir: Path) -> bool:
+    return (job_dir / CANCEL_FILENAME).exists()
+
+
+def request_cancel(job_dir: Path) -> None:
+    job_dir.mkdir(parents=True, exist_ok=True)
+    (job_dir / CANCEL_FILENAME).touch()
+
+
+def update_job_progress(job_id: str, value: float, status: str = "processing") -> None:
+    JOB_PROGRESS[job_id] = {
+        "progress": max(0.0, min(1.0, value)),
+        "status": status,
+    }
+
+
+def clear_job_progress(job_id: str) -> None:
+    JOB_PROGRESS.pop(job_id, None)
+
+
+class JobProgressLogger(ProgressBarLogger):
+    def __init__(
+        self,
+        job_id: str,
+        ratio_index: int,
+        ratio_total: int,
+        job_dir: Optional[Path] = None,
+        report: Optional[Callable[[float], None]] = None,
+    ):
+        super().__init__()
+        self.job_id = job_id
+        # Ratio workers hand progress to their parent process instead of JOB_PROGRESS.
+        self.report = report
+        self.ratio_index = ratio_index
+        self.ratio_total = max(1, ratio_total)
+        self.job_dir = job_dir
+        self.cancel_checked_at = 0.0
+        # Share of the current ratio covered by the time segment being encoded.
+        self.segment_start = 0.0
+        self.segment_span = 1.0
+
+    def bars_callback(self, bar, attr, value, old_value=None):
+        bar_data = self.bars.get(bar)
+        if not bar_data:
+            return
+        total = bar_data.get("total") or 0
+        if total <= 0:
+            return
+        # attr == "index" gives frame count processed
+        if attr == "index":
+            now = time.monotonic()
+            if self.job_dir is not None and now - self.cancel_checked_at >= CANCEL_CHECK_SECONDS:
+                # Raised from inside write_videofile's frame loop, which stops the encode.
+                self.cancel_checked_at = now
+                if is_cancelled(self.job_dir):
+                    raise JobCancelled(self.job_id)
+            fraction = self.segment_start + self.segment_span * min(1.0, value / total)
+            overall = (self.ratio_index + fraction) / self.ratio_total
+            if self.report is not None:
+                self.report(overall)
+            else:
+                update_job_progress(self.job_id, overall, "processing")
+
+    def callback(self, **changes):  # pragma: no cover - proglog internal usage
+        pass
+
+
+RESOLUTION_PATTERN = re.compile(
+    r"""
+    (?<!\w)                            # no word char before
+    [\(\[\{<_-]*\s*                    # optional wrappers
+    (?P<num1>\d{3,4})\s*
+    (?:x|×|\*|/|:|-|_|\.|\s+by\s+)\s*  # separators
+    (?P<num2>\d{3,4})\s*
+    (?:px)?\s*
+    [\)\]\}>_-]*                       # optional wrappers
+    (?!\w)                             # no word char after
+    """,
+    re.IGNORECASE | re.VERBOSE,
+)
+ASPECT_RATIO_PATTERN = re.compile(
+    r"""
+    (?<!\w)
+    [\(\[\{<_-]*\s*
+    (?:
+        (?:\d(?:\.\d+)?)\s*(?:x|×|:|/|\s+by\s+)\s*(?:\d(?:\.\d+)?)
+    )
+    \s*[\)\]\}>_-]*
+    (?!\w)
+    """,
+    re.IGNORECASE | re.VERBOSE,
+)
+ASPECT_WORD_PATTERN = re.compile(
+    r"(?<!\w)[\(\[\{<_-]*(portrait|vertical|landscape|square)[\)\]\}>_-]*(?!\w)",
+    re.IGNORECASE,
+)
+
+
+class SafeFormatDict(dict):
+    def __missing__(self, key):
+        return ""
+
+
+# Memory accounting: every render reserves its estimated footprint against a host budget,
+# and a monitor thread measures the real RSS (Python share + the job's ffmpeg children).
+JOB_MEMORY_OVERHEAD_MB = int(os.environ.get("JOB_MEMORY_OVERHEAD_MB", "120"))
+MEMORY_SAMPLE_SECONDS = float(os.environ.get("MEMORY_SAMPLE_SECONDS", "1"))
+JOB_MEMORY: dict[str, dict] = {}
+# ffmpeg processes spawned for each running job, so a cancelled job can be killed outright.
+JOB_PROCESSES: dict[str, dict] = {}
+_memory_condition = Condition()
+_job_context = local()
+_memory_monitor_thread = None
+
+
+class MemoryBudgetExceeded(Exception):
+    """Raised when a render cannot be admitted without exceeding the host memory budget."""
+
+
+def read_host_memory_mb() -> Optional[float]:
+    """Memory available to this container: the cgroup limit if set, otherwise MemTotal."""
+    try:
+        limit = Path("/sys/fs/cgroup/memory.max").read_text().strip()
+        if limit.isdigit():
+            return int(limit) / (1024 * 1024)
+    except OSError:
+        pass
+    try:
+        for line in Path("/proc/meminfo").read_text().splitlines():
+            if line.startswith("MemTotal:"):
+                return int(line.split()[1]) / 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+def default_memory_budget_mb() -> float:
+    configured = os.environ.get("HOST_MEMORY_BUDGET_MB")
+    if configured:
+        return float(configured)
+    host_mb = read_host_memory_mb()
+    # Leave a quarter of the box to the OS, Caddy and the web workers.
+    return host_mb * 0.75 if host_mb else 2048.0
+
+
+HOST_MEMORY_BUDGET_MB = default_memory_budget_mb()
+
+
+def process_rss_mb(pid: int) -> float:
+    try:
+        for line in Path(f"/proc/{pid}/status").read_text().splitlines():
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return 0.0
+
+
+def probe_video_size(path: Path) -> tuple[int, int]:
+    try:
+        width, height = ffmpeg_parse_infos(str(path))["video_size"]
+        return int(width), int(height)
+    except Exception:  # pragma: no cover - fall back to the most common upload shape
+        return 1080, 1920
+
+
+def estimate_upload_memory(upload_target: Path, ratios: list[str], style: str) -> float:
+    return estimate_job_memory_mb(probe_video_size(upload_target), ratios, style)
+
+
+def estimate_job_memory_mb(source_size: tuple[int, int], ratios: list[str], style: str) -> float:
+    """Rough peak footprint of one render: decoder, frames held in Python and the x264 encoder."""
+    source_px = source_size[0] * source_size[1]
+    output_px = max(
+        (ASPECT_OPTIONS[key]["size"][0] * ASPECT_OPTIONS[key]["size"][1] for key in ratios if key in ASPECT_OPTIONS),
+        default=1080 * 1920,
+    )
+    frame_mb = 3 / (1024 * 1024)
+    decoder_mb = 30 + 4 * source_px * frame_mb
+    # Decoded frame + PIL copy + resampled layers + a batch of canvases; black/passthrough
+    # skip the layers and hand single frames to the encoder.
+    layers = 1 if style == "black" else 3 + FRAME_BATCH_SIZE
+    python_mb = 2 * source_px * frame_mb + layers * output_px * frame_mb
+    # Lookahead and reference frames in yuv420p (1.5 bytes per pixel).
+    encoder_mb = 40 + 60 * output_px * 1.5 / (1024 * 1024)
+    # Ratio workers each hold their own layers and encoder; the frame store is page cache.
+    workers = max(1, min(len([key for key in ratios if key in ASPECT_OPTIONS]), RATIO_WORKERS))
+    return JOB_MEMORY_OVERHEAD_MB + decoder_mb + workers * (python_mb + encoder_mb)
+
+
+def memory_in_use_mb() -> float:
+    """Reserved memory, counting each job at the larger of its estimate and its measured RSS."""
+    return sum(max(entry["estimate_mb"], entry["current_mb"]) for entry in JOB_MEMORY.values())
+
+
+def reserve_memory(job_id: str, estimate_mb: float, blocking: bool = True) -> None:
+    """Admit a render once its estimate fits the budget; a lone job is always admitted."""
+    with _memory_condition:
+        while JOB_MEMORY and memory_in_use_mb() + estimate_mb > HOST_MEMORY_BUDGET_MB:
+            if not blocking:
+                raise MemoryBudgetExceeded(
+                    f"Render needs ~{estimate_mb:.0f} MB; {memory_in_use_mb():.0f} of "
+                    f"{HOST_MEMORY_BUDGET_MB:.0f} MB already in use."
+                )
+            _memory_condition.wait(timeout=MEMORY_SAMPLE_SECONDS)
+        JOB_MEMORY[job_id] = {
+            "estimate_mb": estimate_mb,
+            "current_mb": 0.0,
+            "peak_mb": 0.0,
+            "pids": set(),
+            "baseline_mb": process_rss_mb(os.getpid()),
+        }
+
+
+def release_memory(job_id: str) -> Optional[dict]:
+    with _memory_condition:
+        entry = JOB_MEMORY.pop(job_id, None)
+        _memory_condition.notify_all()
+    if entry:
+        logging.info(
+            "Render %s peak RSS %.0f MB (estimated %.0f MB)",
+            job_id,
+            entry["peak_mb"],
+            entry["estimate_mb"],
+        )
+    return entry
+
+
+@contextmanager
+def job_context(job_id: str, job_dir: Optional[Path] = None):
+    """Attribute ffmpeg processes spawned by this thread to ``job_id`` while the block runs."""
+    _job_context.job_id = job_id
+    with _memory_condition:
+        JOB_PROCESSES[job_id] = {"job_dir": job_dir, "procs": []}
+    try:
+        yield
+    finally:
+        _job_context.job_id = None
+        with _memory_condition:
+            JOB_PROCESSES.pop(job_id, None)
+
+
+def kill_job_processes(job_id: str) -> int:
+    """Kill every live ffmpeg child of a job; its render then fails on the broken pipe."""
+    with _memory_condition:
+        procs = list(JOB_PROCESSES.get(job_id, {}).get("procs", []))
+    killed = 0
+    for proc in procs:
+        if proc.poll() is None:
+            proc.kill()
+            killed += 1
+    return killed
+
+
+def kill_cancelled_jobs() -> None:
+    with _memory_condition:
+        cancelled = [
+            job_id
+            for job_id, entry in JOB_PROCESSES.items()
+            if entry["job_dir"] is not None and is_cancelled(entry["job_dir"])
+        ]
+    for job_id in cancelled:
+        if kill_job_processes(job_id):
+            logging.info("Killed ffmpeg processes of cancelled job %s", job_id)
+
+
+def register_job_process(proc) -> None:
+    job_id = getattr(_job_context, "job_id", None)
+    if proc is None or not job_id:
+        return
+    with _memory_condition:
+        entry = JOB_MEMORY.get(job_id)
+        if entry is not None:
+            entry["pids"].add(proc.pid)
+        processes = JOB_PROCESSES.get(job_id)
+        if processes is not None:
+            processes["procs"] = [item for item in processes["procs"] if item.poll() is None] + [proc]
+
+
+def sample_job_memory() -> None:
+    """Attribute Python RSS growth evenly across running jobs and add each job's own ffmpeg children."""
+    process_mb = process_rss_mb(os.getpid())
+    with _memory_condition:
+        if not JOB_MEMORY:
+            return
+        baseline = min(entry["baseline_mb"] for entry in JOB_MEMORY.values())
+        python_share = max(0.0, process_mb - baseline) / len(JOB_MEMORY)
+        for entry in JOB_MEMORY.values():
+            children_mb = 0.0
+            for pid in list(entry["pids"]):
+                rss = process_rss_mb(pid)
+                if rss:
+                    children_mb += rss
+                else:
+                    entry["pids"].discard(pid)
+            entry["current_mb"] = python_share + children_mb
+            entry["peak_mb"] = max(entry["peak_mb"], entry["current_mb"])
+        _memory_condition.notify_all()
+
+
+def memory_monitor():
+    while True:
+        time.sleep(MEMORY_SAMPLE_SECONDS)
+        try:
+            sample_job_memory()
+            kill_cancelled_jobs()
+        except Exception:  # pragma: no cover - monitoring must never kill the thread
+            logging.exception("Memory sampling failed")
+
+
+def start_memory_monitor():
+    global _memory_monitor_thread
+    if _memory_monitor_thread is not None:
+        return
+    _memory_monitor_thread = Thread(target=memory_monitor, daemon=True, name="MemoryMonitor")
+    _memory_monitor_thread.start()
+
+
+def strip_known_extensions(name: str) -> str:
+    base = name
+    while True:
+        stem, suffix = os.path.splitext(base)
+        if suffix.lower() in VIDEO_EXTENSIONS and stem:
+            base = stem
+        else:
+            break
+    return base
+
+
+def remove_naming_tokens(text: str) -> str:
+    cleaned = text
+    prev = None
+    while prev != cleaned:
+        prev = cleaned
+        cleaned = RESOLUTION_PATTERN.sub(" ", cleaned)
+    prev = None
+    while prev != cleaned:
+        prev = cleaned
+        cleaned = ASPECT_RATIO_PATTERN.sub(" ", cleaned)
+    prev = None
+    while prev != cleaned:
+        prev = cleaned
+        cleaned = ASPECT_WORD_PATTERN.sub(" ", cleaned)
+    cleaned = re.sub(r"[._\-]{2,}", " ", cleaned)
+    cleaned = re.sub(r"\s+", " ", cleaned)
+    return cleaned.strip()
+
+
+def sanitize_component(text: str) -> str:
+    sanitized = re.sub(r"[^A-Za-z0-9._-]+", "_", text)
+    sanitized = re.sub(r"_+", "_", sanitized)
+    sanitized = sanitized.strip("_-. ")
+    return sanitized
+
+
+def clean_stub(original_name: str, *, keep_tokens: bool = False) -> str:
+    base = strip_known_extensions(original_name)
+    base = base.strip()
+    if not keep_tokens:
+        base = remove_naming_tokens(base)
+    base = sanitize_component(base)
+    return base or "clip"
+
+
+def sanitize_filename(candidate: str, *, ext: str) -> str:
+    name, current_ext = os.path.splitext(candidate)
+    if not name:
+        name = "clip"
+    name = re.sub(r"[^A-Za-z0-9._-]+", "_", name)
+    name = re.sub(r"_{2,}", "__", name)
+    name = re.sub(r"-{2,}", "--", name)
+    name = re.sub(r"\s+", "_", name)
+    name = name.strip("_-.")
+    if not name:
+        name = "clip"
+    full_ext = f".{ext.lstrip('.')}" if ext else current_ext
+    full_name = f"{name}{full_ext}"
+    if len(full_name) > 120:
+        max_name_len = 120 - len(full_ext)
+        name = name[: max(1, max_name_len)]
+        full_name = f"{name}{full_ext}"
+    return full_name
+
+
+def ensure_unique_name(directory: Path, filename: str) -> str:
+    base, ext = os.path.splitext(filename)
+    counter = 1
+    candidate = filename
+    while (directory / candidate).exists() or stored_marker(directory / candidate).exists():
+        candidate = f"{base}__{counter:03d}{ext}"
+        counter += 1
+    return candidate
+
+
+def parse_bool(value, default: bool = False) -> bool:
+    if value is None:
+        return default
+    return str(value).strip().lower() in {"1", "true", "yes", "y", "on"}
+
+
+def parse_base_overrides(raw_value: Optional[str]) -> dict[str, str]:
+    if not raw_value:
+        return {}
+    try:
+        data = json.loads(raw_value)
+    except json.JSONDecodeError:
+        logging.warning("Failed to parse base overrides payload")
+        return {}
+    if not isinstance(data, dict):
+        return {}
+    cleaned: dict[str, str] = {}
+    for key, value in data.items():
+        if not isinstance(key, str) or value is None:
+            continue
+        cleaned[str(key)] = str(value)
+    return cleaned
+
+
+def build_naming_config(job_dir: Path, form) -> dict:
+    summary = load_summary(job_dir)
+    summary_config = summary.get("config") or {}
+
+    mode_value = (form.get("naming_mode") if form else None) or summary_config.get("mode", "auto")
+    mode_value = "custom" if mode_value == "custom" else "auto"
+
+    date_stamp = summary_config.get("date_stamp") or datetime.utcnow().strftime(DATE_FORMAT)
+
+    if mode_value == "auto":
+        return {
+            "mode": "auto",
+            "pattern_choice": DEFAULT_PATTERN_KEY,
+            "pattern": PATTERN_PRESETS[DEFAULT_PATTERN_KEY],
+            "custom_pattern": "",
+            "auto_clean": True,
+            "keep_tokens": False,
+            "add_sequence": False,
+            "append_date": False,
+            "label_mode": "short",
+            "date_stamp": date_stamp,
+        }
+
+    pattern_choice = form.get("naming_preset") if form else None
+    if not pattern_choice:
+        pattern_choice = summary_config.get("pattern_choice", DEFAULT_PATTERN_KEY)
+    if pattern_choice not in PATTERN_PRESETS and pattern_choice != "custom":
+        pattern_choice = DEFAULT_PATTERN_KEY
+
+    custom_pattern = (form.get("naming_custom_pattern") if form else None) or summary_config.get("custom_pattern", "")
+    custom_pattern = custom_pattern.strip()
+
+    auto_clean = parse_bool(form.get("naming_auto_clean"), summary_config.get("auto_clean", True))
+    keep_tokens = parse_bool(form.get("naming_keep_tokens"), summary_config.get("keep_tokens", False))
+    if keep_tokens:
+        auto_clean = False
+
+    add_sequence = parse_bool(form.get("naming_add_sequence"), summary_config.get("add_sequence", True))
+    append_date = parse_bool(form.get("naming_append_date"), summary_config.get("append_date", True))
+
+    label_mode = (form.get("naming_label_mode") if form else None) or summary_config.get("label_mode", "short")
+    if label_mode not in {"short", "friendly"}:
+        label_mode = "short"
+
+    if pattern_choice == "custom" and custom_pattern:
+        pattern = custom_pattern
+    else:
+        pattern = PATTERN_PRESETS.get(pattern_choice, PATTERN_PRESETS[DEFAULT_PATTERN_KEY])
+
+    return {
+        "mode": "custom",
+        "pattern_choice": pattern_choice,
+        "pattern": pattern,
+        "custom_pattern": custom_pattern,
+        "auto_clean": auto_clean,
+        "keep_tokens": keep_tokens,
+        "add_sequence": add_sequence,
+        "append_date": append_date,
+        "label_mode": label_mode,
+        "date_stamp": date_stamp,
+    }
+
+
+def parse_positive_number(value) -> Optional[float]:
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    return number if number > 0 else None
+
+
+def build_encode_settings(form, profile: Optional[dict] = None) -> dict:
+    """Rate control for libx264: a CRF quality level, a per-output target size, or CRF capped at a max bitrate.
+
+    ``profile`` is a tier's encode profile: its rate control and quality are the defaults
+    when the form does not pick any, and its preset and caps always apply.
+    """
+    defaults = profile or {}
+    mode = (form.get("rate_control") if form else None) or defaults.get("rate_control") or DEFAULT_RATE_CONTROL
+    if mode not in RATE_CONTROL_MODES:
+        mode = "crf"
+    quality = (form.get("quality") if form else None) or defaults.get("quality") or DEFAULT_QUALITY
+    if quality not in CRF_LEVELS:
+        quality = "standard"
+    settings = {"rate_control": mode, "quality": quality, "crf": CRF_LEVELS[quality]}
+
+    if mode == "target_size":
+        target_mb = parse_positive_number(form.get("target_size_mb") if form else None)
+        if target_mb is None:
+            settings["rate_control"] = "crf"
+        else:
+            settings["target_size_mb"] = target_mb
+    elif mode == "capped":
+        max_kbps = parse_positive_number(form.get("max_bitrate_kbps") if form else None)
+        settings["max_bitrate_kbps"] = int(max_kbps or defaults.get("max_bitrate_kbps") or DEFAULT_MAX_BITRATE_KBPS)
+    return apply_encode_profile(settings, profile)
+
+
+def apply_encode_profile(settings: dict, profile: Optional[dict]) -> dict:
+    """Add a tier's cost limits to encode settings: x264 preset, output fps and resolution caps."""
+    profile = profile or {}
+    preset = profile.get("preset") or DEFAULT_PRESET
+    if preset != ADAPTIVE_PRESET and preset not in X264_PRESET_COST:
+        preset = "veryfast"
+    settings["preset"] = preset
+    if preset == ADAPTIVE_PRESET:
+        settings["deadline_factor"] = float(profile.get("deadline_factor") or DEFAULT_DEADLINE_FACTOR)
+    for key in ("max_fps", "max_long_edge"):
+        value = parse_positive_number(profile.get(key))
+        if value:
+            settings[key] = int(value)
+    return settings
+
+
+def capped_size(size: tuple[int, int], max_long_edge: Optional[int]) -> tuple[int, int]:
+    """Scale an output size down (keeping even dimensions) so its long edge fits the cap."""
+    if not max_long_edge or max(size) <= max_long_edge:
+        return size
+    scale = max_long_edge / max(size)
+    return (int(size[0] * scale) // 2 * 2, int(size[1] * scale) // 2 * 2)
+
+
+ENCODE_SPEED: dict[str, deque] = {}
+
+
+def record_encode_speed(style: str, preset: str, size: tuple[int, int], frames: float, elapsed: float) -> None:
+    """Remember how long a render took per megapixel-frame, normalised to the veryfast preset."""
+    megapixel_frames = size[0] * size[1] * frames / 1_000_000
+    if megapixel_frames <= 0 or elapsed <= 0:
+        return
+    cost = elapsed / megapixel_frames / X264_PRESET_COST.get(preset, 1.0)
+    ENCODE_SPEED.setdefault(style, deque(maxlen=ENCODE_SPEED_WINDOW)).append(cost)
+
+
+def predict_render_seconds(style: str, preset: str, size: tuple[int, int], frames: float) -> float:
+    samples = list(ENCODE_SPEED.get(style, ()))
+    cost = sum(samples) / len(samples) if samples else DEFAULT_ENCODE_COST
+    return cost * X264_PRESET_COST[preset] * size[0] * size[1] * frames / 1_000_000
+
+
+def choose_preset(settings: Optional[dict], style: str, size: tuple[int, int], fps: float, duration: float) -> str:
+    """The configured preset, or in adaptive mode the slowest (best) one predicted to meet the deadline."""
+    settings = settings or {}
+    preset = settings.get("preset") or DEFAULT_PRESET
+    if preset != ADAPTIVE_PRESET:
+        return preset
+    deadline = settings.get("deadline_factor", DEFAULT_DEADLINE_FACTOR) * duration
+    frames = duration * fps
+    for candidate in reversed(list(X264_PRESET_COST)):
+        if predict_render_seconds(style, candidate, size, frames) <= deadline:
+            return candidate
+    return "ultrafast"
+
+
+def rate_control_params(settings: Optional[dict], duration: Optional[float]) -> list[str]:
+    settings = settings or build_encode_settings(None)
+    mode = settings.get("rate_control", "crf")
+    if mode == "target_size" and duration:
+        # Single-pass ABR with the bitrate capped, leaving ~3% for container overhead.
+        total_kbits = settings["target_size_mb"] * 1024 * 1024 * 8 / 1000 * 0.97
+        video_kbps = max(MIN_VIDEO_BITRATE_KBPS, int(total_kbits / duration) - AUDIO_BITRATE_KBPS)
+        return ["-b:v", f"{video_kbps}k", "-maxrate", f"{video_kbps}k", "-bufsize", f"{video_kbps * 2}k"]
+
+    params = ["-crf", str(settings.get("crf", CRF_LEVELS["standard"]))]
+    if mode == "capped":
+        max_kbps = settings["max_bitrate_kbps"]
+        params += ["-maxrate", f"{max_kbps}k", "-bufsize", f"{max_kbps * 2}k"]
+    return params
+
+
+def source_fits_encode_settings(settings: Optional[dict], source: Path, duration: Optional[float]) -> bool:
+    """Whether stream-copying the source still honours the requested rate control."""
+    settings = settings or build_encode_settings(None)
+    mode = settings.get("rate_control", "crf")
+    if mode == "crf":
+        return settings.get("quality") != "compact"
+    size_bytes = source.stat().st_size
+    if mode == "target_size":
+        return size_bytes <= settings["target_size_mb"] * 1024 * 1024
+    if not duration:
+        return False
+    return size_bytes * 8 / 1000 / duration <= settings["max_bitrate_kbps"]
+
+
+def serialize_config(config: dict) -> dict:
+    keys = (
+        "mode",
+        "pattern_choice",
+        "pattern",
+        "custom_pattern",
+        "auto_clean",
+        "keep_tokens",
+        "add_sequence",
+        "append_date",
+        "label_mode",
+        "date_stamp",
+    )
+    return {key: config.get(key) for key in keys if key in config}
+
+
+def prepare_base_info(original_name: str, override: Optional[str], config: dict) -> dict:
+    source_name = override.strip() if override else original_name
+    base_candidate = strip_known_extensions(source_name)
+    base_candidate = base_candidate.strip()
+    sanitized_base = sanitize_component(base_candidate) or "clip"
+    if config.get("auto_clean", True) and not config.get("keep_tokens", False):
+        base_clean = clean_stub(base_candidate, keep_tokens=False)
+    else:
+        base_clean = sanitized_base
+    if not base_clean:
+        base_clean = "clip"
+    return {
+        "base": sanitized_base,
+        "base_clean": base_clean,
+        "original_filename": original_name,
+    }
+
+
+def generate_output_filename(
+    base_info: dict,
+    aspect_key: str,
+    style_key: str,
+    config: dict,
+    seq_number: Optional[int],
+    ext: str,
+    output_dir: Path,
+) -> tuple[str, dict]:
+    ratio_meta = ASPECT_OPTIONS.get(aspect_key, {})
+    style_long = STYLE_LABELS.get(style_key, style_key)
+    style_short = STYLE_SHORT_LABELS.get(style_key, style_key)
+    ratio_short = ratio_meta.get("short", aspect_key)
+    ratio_friendly = ratio_meta.get("label", aspect_key)
+
+    label_mode = config.get("label_mode", "short")
+    ratio_token = ratio_short if label_mode == "short" else ratio_friendly
+    style_token = style_short if label_mode == "short" else style_long
+
+    seq_value = f"{seq_number:03d}" if seq_number is not None else ""
+    date_value = config.get("date_stamp", "")
+
+    tokens = SafeFormatDict(
+        {
+            "base": base_info["base"],
+            "base_clean": base_info["base_clean"],
+            "ratio": ratio_token,
+            "style": style_token,
+            "w": ratio_meta.get("size", (0, 0))[0],
+            "h": ratio_meta.get("size", (0, 0))[1],
+            "date": date_value,
+            "seq": seq_value,
+            "ext": ext.lstrip("."),
+        }
+    )
+
+    pattern = config.get("pattern") or PATTERN_PRESETS[DEFAULT_PATTERN_KEY]
+    formatted = pattern.format_map(tokens).strip("_- ")
+    if not formatted:
+        formatted = f"{tokens['base_clean']}_{ratio_token}"
+
+    normalized_pattern = pattern.lower()
+    if config.get("add_sequence", True) and "{seq}" not in normalized_pattern and seq_value:
+        formatted = f"{formatted}__{seq_value}"
+    if config.get("append_date", True) and "{date}" not in normalized_pattern and date_value:
+        formatted = f"{formatted}__{date_value}"
+
+    filename = sanitize_filename(formatted, ext=ext)
+    filename = ensure_unique_name(output_dir, filename)
+    tokens["ratio_token"] = ratio_token
+    tokens["style_token"] = style_token
+    tokens["filename"] = filename
+    return filename, tokens
+
+
+def load_summary(job_dir: Path) -> dict:
+    summary_path = job_dir / SUMMARY_FILENAME
+    if summary_path.exists():
+        try:
+            data = json.loads(summary_path.read_text())
+            if "videos" not in data:
+                data["videos"] = []
+            if "config" not in data:
+                data["config"] = {}
+            return data
+        except json.JSONDecodeError:
+            logging.warning("Failed to parse summary for job %s", job_dir.name)
+    return {"videos": [], "config": {}}
+
+
+def append_summary(job_dir: Path, entry: dict, config: Optional[dict] = None) -> None:
+    summary = load_summary(job_dir)
+    summary.setdefault("videos", []).append(entry)
+    if config:
+        summary["config"] = serialize_config(config)
+    summary["updated_at"] = datetime.utcnow().isoformat()
+    summary_path = job_dir / SUMMARY_FILENAME
+    summary_path.write_text(json.dumps(summary, indent=2))
+
+
+BLUR_RADIUS = 16
+# The blurred background is computed at 1/BLUR_DOWNSCALE of the output size and scaled up.
+BLUR_DOWNSCALE = 8
+# Frames composed together per batch by FrameCompositor.
+FRAME_BATCH_SIZE = int(os.environ.get("FRAME_BATCH_SIZE", "8"))
+# Quarter turns applied to decoded frames, as PIL transposes and as ffmpeg filters.
+# Both rotate counter-clockwise, like MoviePy's clip.rotate().
+PIL_ROTATIONS = {
+    90: Image.Transpose.ROTATE_90,
+    180: Image.Transpose.ROTATE_180,
+    270: Image.Transpose.ROTATE_270,
+}
+FFMPEG_ROTATIONS = {90: "transpose=cclock", 180: "hflip,vflip", 270: "transpose=clock"}
+# Sources with these streams can be copied into an .mp4 output without re-encoding.
+REMUX_VIDEO_CODECS = {"h264"}
+REMUX_PIXEL_FORMATS = {"yuv420p", "yuvj420p"}
+REMUX_AUDIO_CODECS = {"aac", "mp3"}
+# Sources whose aspect ratio is off by at most this many output pixels are just scaled.
+TRIVIAL_SCALE_TOLERANCE = 2
+
+
+def fit_size(source_size: tuple[int, int], target_size: tuple[int, int]) -> tuple[int, int]:
+    """Largest size with the source aspect ratio that fits inside the target."""
+    scale = min(target_size[0] / source_size[0], target_size[1] / source_size[1])
+    return int(source_size[0] * scale), int(source_size[1] * scale)
+
+
+def orientation_angle(clip: VideoFileClip) -> int:
+    reader_rotation = getattr(getattr(clip, "reader", None), "rotation", None)
+    raw_rotation = getattr(clip, "rotation", None)
+    rotation = raw_rotation if raw_rotation not in (None, 0) else reader_rotation
+    try:
+        angle = int(rotation or 0) % 360
+    except (TypeError, ValueError):
+        angle = 0
+    return angle if angle in PIL_ROTATIONS else 0
+
+
+def plan_geometry(source_size: tuple[int, int], target_size: tuple[int, int], rotation: int = 0) -> dict:
+    """Work out, in decoded (unrotated) source pixels, what each layer of a render needs.
+
+    The target is expressed in the source's own orientation, so each layer is cropped
+    to the minimal source region and resampled once, straight to its output size. The
+    rotation is applied afterwards to the already output-sized result.
+    """
+    target_w, target_h = target_size
+    quarter_turn = rotation in (90, 270)
+    plan_w, plan_h = (target_h, target_w) if quarter_turn else (target_w, target_h)
+    src_w, src_h = source_size
+
+    # Fill layer: the centered source region that covers the whole target.
+    scale = max(plan_w / src_w, plan_h / src_h)
+    crop_w, crop_h = plan_w / scale, plan_h / scale
+    left, top = (src_w - crop_w) / 2, (src_h - crop_h) / 2
+
+    fit_w, fit_h = fit_size(source_size, (plan_w, plan_h))
+    placed_w, placed_h = (fit_h, fit_w) if quarter_turn else (fit_w, fit_h)
+    return {
+        "rotation": rotation,
+        "target_size": (target_w, target_h),
+        "fill_size": (plan_w, plan_h),
+        "fill_box": (left, top, left + crop_w, top + crop_h),
+        "fit_size": (fit_w, fit_h),
+        "fit_offset": ((target_w - placed_w) // 2, (target_h - placed_h) // 2),
+        "placed_size": (placed_w, placed_h),
+    }
+
+
+def is_trivial_geometry(source_size: tuple[int, int], target_size: tuple[int, int], rotation: int = 0) -> bool:
+    """True when every style reduces to a plain scale because the source already has the target's shape."""
+    if rotation:
+        return False
+    fit_w, fit_h = fit_size(source_size, target_size)
+    return (
+        abs(fit_w - target_size[0]) <= TRIVIAL_SCALE_TOLERANCE
+        and abs(fit_h - target_size[1]) <= TRIVIAL_SCALE_TOLERANCE
+    )
+
+
+def probe_streams(path: Path) -> dict:
+    """Codecs of the first video/audio streams, parsed from ``ffmpeg -i`` output."""
+    proc = subprocess.run(
+        [get_setting("FFMPEG_BINARY"), "-hide_banner", *ffmpeg_input_args(str(path))],
+        capture_output=True,
+        text=True,
+        errors="replace",
+    )
+    streams = {"video": None, "pix_fmt": None, "audio": None}
+    for line in proc.stderr.splitlines():
+        match = re.search(r"Stream #\d+:\d+.*?: (Video|Audio): (\w+)", line)
+        if not match:
+            continue
+        kind = match.group(1).lower()
+        if streams[kind] is not None:
+            continue
+        streams[kind] = match.group(2)
+        if kind == "video":
+            pix_fmt = re.search(r"Video: [^,]+, (\w+)", line)
+            streams["pix_fmt"] = pix_fmt.group(1) if pix_fmt else None
+    return streams
+
+
+ENCODER_CHECK_SECONDS = 60.0
+_encoder_status: dict = {}
+
+
+def encoder_status() -> dict:
+    """Whether the ffmpeg binary runs and has libx264; re-checked at most every ENCODER_CHECK_SECONDS."""
+    now = time.monotonic()
+    if _encoder_status and now - _encoder_status["checked_at"] < ENCODER_CHECK_SECONDS:
+        return {key: value for key, value in _encoder_status.items() if key != "checked_at"}
+    binary = get_setting("FFMPEG_BINARY")
+    try:
+        proc = subprocess.run([binary, "-hide_banner", "-encoders"], capture_output=True, text=True, timeout=10)
+        ok = proc.returncode == 0 and "libx264" in proc.stdout
+        error = None if ok else (proc.stderr.strip()[-200:] or "ffmpeg has no libx264 encoder")
+    except (OSError, subprocess.TimeoutExpired) as exc:
+        ok, error = False, str(exc)
+    _encoder_status.update(ok=ok, error=error, checked_at=now)
+    return {"ok": ok, "error": error}
+
+
+def can_remux(streams: dict) -> bool:
+    return (
+        streams.get("video") in REMUX_VIDEO_CODECS
+        and streams.get("pix_fmt") in REMUX_PIXEL_FORMATS
+        and (streams.get("audio") is None or streams["audio"] in REMUX_AUDIO_CODECS)
+    )
+
+
+def remux_video(source: Path, output_path: Path) -> None:
+    """Stream-copy the source into an .mp4 with the moov atom up front."""
+    cmd = [
+        get_setting("FFMPEG_BINARY"),
+        "-y",
+        "-loglevel", "error",
+        *ffmpeg_input_args(str(source)),
+        "-map", "0:v:0",
+        "-map", "0:a:0?",
+        "-c", "copy",
+        "-movflags", "+faststart",
+        str(output_path),
+    ]
+    proc = subprocess.run(cmd, capture_output=True, text=True, errors="replace")
+    if proc.returncode != 0:
+        output_path.unlink(missing_ok=True)
+        raise IOError(f"ffmpeg remux failed for {output_path.name}: {proc.stderr.strip()}")
+
+
+def gaussian_matrix(size: int, sigma: float) -> np.ndarray:
+    """Blur along one axis as a (size, size) matrix; rows are renormalised at the edges."""
+    index = np.arange(size)
+    distance = index[:, None] - index[None, :]
+    # Truncated at 4 sigma: the far tail would only add denormals, which make the matmul crawl.
+    weights = np.where(np.abs(distance) <= 4 * sigma, np.exp(-0.5 * (distance / sigma) ** 2), 0.0)
+    return (weights / weights.sum(axis=1, keepdims=True)).astype(np.float32)
+
+
+class FrameCompositor:
+    """Renders one style/ratio in batches of ``FRAME_BATCH_SIZE`` frames held in one array.
+
+    When the encoder asks for a frame outside the current batch, the next batch of frame
+    times (at the output ``fps``) is decoded and composed at once. Per frame, only the
+    sharp layers are resampled (or, for a fill at 1:1 scale, sliced out of the decoded
+    frame); the blurred background is reduced to a small image and the whole batch is
+    blurred with two matrix products, then scaled up into the letterbox bars only,
+    since the foreground covers the rest. Frames returned by ``make_frame`` alias the
+    batch array, so they are only valid until the next batch; ``write_videofile``
+    encodes every frame before requesting the next one.
+    """
+
+    def __init__(
+        self,
+        clip,
+        target_size: tuple[int, int],
+        style: str,
+        rotation: int = 0,
+        fps: Optional[float] = None,
+    ):
+        self.clip = clip
+        self.style = style
+        self.fps = fps or getattr(clip, "fps", None) or 30
+        self.plan = plan_geometry((clip.w, clip.h), target_size, rotation)
+        self.rotation = rotation
+        self.transpose = PIL_ROTATIONS.get(rotation)
+        target_w, target_h = self.plan["target_size"]
+
+        batch = max(1, FRAME_BATCH_SIZE)
+        self.canvases = np.zeros((batch, target_h, target_w, 3), dtype=np.uint8)
+        self.batch_times = np.empty(0)
+        left, top = self.plan["fit_offset"]
+        placed_w, placed_h = self.plan["placed_size"]
+        self.foreground_rows = slice(top, top + placed_h)
+        self.foreground_cols = slice(left, left + placed_w)
+
+        # A fill at 1:1 scale with a whole-pixel crop needs no resampling at all.
+        box_left, box_top, box_right, box_bottom = self.plan["fill_box"]
+        fill_w, fill_h = self.plan["fill_size"]
+        self.crop = None
+        if (
+            style == "fill"
+            and float(box_left).is_integer()
+            and float(box_top).is_integer()
+            and (box_right - box_left, box_bottom - box_top) == (fill_w, fill_h)
+        ):
+            self.crop = (slice(int(box_top), int(box_bottom)), slice(int(box_left), int(box_right)))
+
+        if style == "blur":
+            small_w = max(1, round(target_w / BLUR_DOWNSCALE))
+            small_h = max(1, round(target_h / BLUR_DOWNSCALE))
+            self.small_size = (small_h, small_w) if rotation in (90, 270) else (small_w, small_h)
+            self.small = np.zeros((batch, small_h, small_w, 3), dtype=np.float32)
+            self.blur_rows = gaussian_matrix(small_h, BLUR_RADIUS * small_h / target_h)
+            self.blur_cols = gaussian_matrix(small_w, BLUR_RADIUS * small_w / target_w).T.copy()
+            scale_x, scale_y = small_w / target_w, small_h / target_h
+            bars = [
+                (0, top, 0, target_w),
+                (top + placed_h, target_h, 0, target_w),
+                (top, top + placed_h, 0, left),
+                (top, top + placed_h, left + placed_w, target_w),
+            ]
+            self.bars = [
+                ((y0, y1, x0, x1), (x0 * scale_x, y0 * scale_y, x1 * scale_x, y1 * scale_y))
+                for y0, y1, x0, x1 in bars
+                if y1 > y0 and x1 > x0
+            ]
+
+    def resample(self, image, size, box=None, method=None):
+        layer = image.resize(size, method or Image.ANTIALIAS, box=box)
+        return layer.transpose(self.transpose) if self.transpose is not None else layer
+
+    def make_frame(self, t):
+        matches = np.flatnonzero(np.abs(self.batch_times - t) < 0.5 / self.fps)
+        if not len(matches):
+            self.fill_batch(t)
+            return self.canvases[0]
+        return self.canvases[matches[0]]
+
+    def fill_batch(self, t: float) -> None:
+        times = t + np.arange(len(self.canvases)) / self.fps
+        if self.clip.duration:
+            times = times[: max(1, int(np.count_nonzero(times < self.clip.duration)))]
+        for index, frame_time in enumerate(times):
+            self.compose(self.clip.get_frame(frame_time), index)
+        if self.style == "blur":
+            self.blur_backgrounds(len(times))
+        self.batch_times = times
+
+    def compose(self, frame: np.ndarray, index: int) -> None:
+        canvas = self.canvases[index]
+        if self.crop is not None:
+            canvas[:] = np.rot90(frame[self.crop], self.rotation // 90)
+            return
+        image = Image.fromarray(frame)
+        if self.style == "fill":
+            canvas[:] = np.asarray(self.resample(image, self.plan["fill_size"], self.plan["fill_box"]))
+            return
+        if self.style == "blur":
+            self.small[index] = np.asarray(self.resample(image, self.small_size, self.plan["fill_box"], Image.BOX))
+        # Black bars are the untouched zeros of the canvas.
+        canvas[self.foreground_rows, self.foreground_cols] = np.asarray(self.resample(image, self.plan["fit_size"]))
+
+    def blur_backgrounds(self, count: int) -> None:
+        """Blur the batch's reduced backgrounds together and scale them up into the bars."""
+        small = self.small[:count]
+        _, small_h, small_w, _ = small.shape
+        rows = self.blur_rows @ np.ascontiguousarray(small.transpose(1, 0, 2, 3)).reshape(small_h, -1)
+        rows = np.ascontiguousarray(rows.reshape(small_h, count, small_w, 3).transpose(1, 0, 3, 2))
+        blurred = (rows.reshape(-1, small_w) @ self.blur_cols).reshape(count, small_h, 3, small_w)
+        blurred = np.ascontiguousarray(blurred.transpose(0, 1, 3, 2))
+        np.clip(blurred + 0.5, 0, 255, out=blurred)
+        blurred = blurred.astype(np.uint8)
+        for index in range(count):
+            background = Image.fromarray(blurred[index])
+            for (y0, y1, x0, x1), box in self.bars:
+                self.canvases[index, y0:y1, x0:x1] = np.asarray(
+                    background.resize((x1 - x0, y1 - y0), Image.BILINEAR, box=box)
+                )
+
+    def to_clip(self):
+        composed = VideoClip(self.make_frame, duration=self.clip.duration)
+        if self.clip.audio:
+            composed = composed.set_audio(self.clip.audio)
+        return composed
+
+
+def build_blurred_letterbox(
+    clip: VideoFileClip, target_size: tuple[int, int], rotation: int = 0, fps: Optional[float] = None
+):
+    return FrameCompositor(clip, target_size, "blur", rotation, fps).to_clip()
+
+
+def build_black_letterbox(
+    clip: VideoFileClip, target_size: tuple[int, int], rotation: int = 0, fps: Optional[float] = None
+):
+    """Source frames go to the encoder untouched; ffmpeg scales them once and pads with black (``fps`` is unused)."""
+    plan = plan_geometry((clip.w, clip.h), target_size, rotation)
+    fit_w, fit_h = plan["fit_size"]
+    target_w, target_h = plan["target_size"]
+    filters = [f"scale={fit_w}:{fit_h}:flags=lanczos"]
+    if rotation in FFMPEG_ROTATIONS:
+        filters.append(FFMPEG_ROTATIONS[rotation])
+    filters.append(f"pad={target_w}:{target_h}:(ow-iw)/2:(oh-ih)/2:black")
+
+    return passthrough_clip(clip, ",".join(filters))
+
+
+def build_scaled_passthrough(clip: VideoFileClip, target_size: tuple[int, int], rotation: int = 0):
+    """For sources that already have the target's shape: no compositing, at most an encoder-side scale."""
+    target_w, target_h = target_size
+    if (clip.w, clip.h) == (target_w, target_h):
+        return passthrough_clip(clip)
+    return passthrough_clip(clip, f"scale={target_w}:{target_h}:flags=lanczos")
+
+
+def passthrough_clip(clip: VideoFileClip, encoder_filters: Optional[str] = None):
+    """Hands decoded source frames to the encoder as-is; ``write_clip`` applies ``encoder_filters``."""
+    passthrough = VideoClip(clip.get_frame, duration=clip.duration)
+    if clip.audio:
+        passthrough = passthrough.set_audio(clip.audio)
+    passthrough.encoder_filters = encoder_filters
+    passthrough.remux_source = None
+    return passthrough
+
+
+def build_fill_and_crop(
+    clip: VideoFileClip, target_size: tuple[int, int], rotation: int = 0, fps: Optional[float] = None
+):
+    return FrameCompositor(clip, target_size, "fill", rotation, fps).to_clip()
+
+
+def style_builder(style: str):
+    if style == "fill":
+        return build_fill_and_crop
+    if style == "black":
+        return build_black_letterbox
+    return build_blurred_letterbox
+
+
+def rendering_marker(output_path: Path) -> Path:
+    """Sidecar that exists while ``output_path`` is still being encoded (visible to every worker)."""
+    return output_path.with_name(f".{output_path.name}.rendering")
+
+
+def fragmented_mp4_params() -> list[str]:
+    # A keyframe every FRAGMENT_SECONDS so each fragment is independently playable.
+    return [
+        "-movflags", "frag_keyframe+empty_moov+default_base_moof",
+        "-force_key_frames", f"expr:gte(t,n_forced*{FRAGMENT_SECONDS})",
+    ]
+
+
+def finalize_faststart(output_path: Path) -> None:
+    """Rewrite a finished fragmented MP4 as a regular one with the moov atom up front."""
+    staging = output_path.with_name(f".{output_path.name}.faststart")
+    cmd = [
+        get_setting("FFMPEG_BINARY"),
+        "-y",
+        "-loglevel", "error",
+        "-i", str(output_path),
+        "-c", "copy",
+        "-movflags", "+faststart",
+        "-f", "mp4",
+        str(staging),
+    ]
+    proc = subprocess.run(cmd, capture_output=True, text=True, errors="replace")
+    if proc.returncode != 0:
+        staging.unlink(missing_ok=True)
+        # The fragmented file is still a valid MP4, so keep serving it.
+        logging.warning("Faststart rewrite failed for %s: %s", output_path.name, proc.stderr.strip())
+        return
+    os.replace(staging, output_path)
+
+
+def checkpoint_path(output_dir: Path, input_path: Path) -> Path:
+    digest = hashlib.sha1(str(input_path.resolve()).encode()).hexdigest()[:16]
+    return output_dir / f".checkpoint-{digest}.json"
+
+
+def save_checkpoint(checkpoint: dict) -> None:
+    path = Path(checkpoint["path"])
+    staging = path.with_name(f"{path.name}.tmp")
+    staging.write_text(json.dumps({key: value for key, value in checkpoint.items() if key != "path"}))
+    os.replace(staging, path)
+
+
+def is_complete_video(path: Path, size_bytes: Optional[int]) -> bool:
+    """A checkpointed file still counts only if it is unchanged and ffmpeg can read its index."""
+    try:
+        if path.stat().st_size != size_bytes:
+            return False
+        return bool(ffmpeg_parse_infos(str(path)).get("duration"))
+    except (OSError, IOError):
+        return False
+
+
+def load_checkpoint(output_dir: Path, input_path: Path, fingerprint: dict) -> dict:
+    """Checkpoint of an earlier, interrupted render of ``input_path`` with invalid pieces discarded.
+
+    Finished ratios are kept when their output is intact; for the ratio that was in progress,
+    the leading run of intact time segments is kept and everything else is deleted.
+    """
+    path = checkpoint_path(output_dir, input_path)
+    fresh = {"path": str(path), "fingerprint": fingerprint, "outputs": [], "current": None}
+    try:
+        stored = json.loads(path.read_text())
+    except (OSError, json.JSONDecodeError):
+        return fresh
+    if stored.get("fingerprint") != fingerprint:
+        discard_outputs(output_dir, stored.get("outputs", []))
+        discard_current(output_dir, stored.get("current"))
+        return fresh
+
+    outputs = []
+    for item in stored.get("outputs", []):
+        if is_complete_video(output_dir / item["filename"], item.get("size_bytes")):
+            outputs.append(item)
+        else:
+            (output_dir / item["filename"]).unlink(missing_ok=True)
+    current = stored.get("current")
+    if current:
+        # The final file of an unfinished ratio is never complete; only its segments can be.
+        (output_dir / current["filename"]).unlink(missing_ok=True)
+        stored_marker(output_dir / current["filename"]).unlink(missing_ok=True)
+        rendering_marker(output_dir / current["filename"]).unlink(missing_ok=True)
+        parts = []
+        for part in current.get("parts", []):
+            if len(parts) == part["index"] and is_complete_video(output_dir / part["file"], part.get("size_bytes")):
+                parts.append(part)
+            else:
+                (output_dir / part["file"]).unlink(missing_ok=True)
+        current["parts"] = parts
+    if outputs or current:
+        logging.info(
+            "Resuming %s from checkpoint: %d finished output(s), %d segment(s)",
+            input_path.name,
+            len(outputs),
+            len(current["parts"]) if current else 0,
+        )
+    return {**fresh, "outputs": outputs, "current": current}
+
+
+def discard_current(output_dir: Path, current: Optional[dict]) -> None:
+    if not current:
+        return
+    (output_dir / current["filename"]).unlink(missing_ok=True)
+    for part in current.get("parts", []):
+        (output_dir / part["file"]).unlink(missing_ok=True)
+
+
+def segment_part_path(output_path: Path, index: int) -> Path:
+    return output_path.with_name(f".{output_path.stem}.part{index:03d}.mp4")
+
+
+def segment_bounds(duration: float, fps: float) -> list[tuple[float, float]]:
+    """Frame-aligned [start, end) windows of about CHECKPOINT_SEGMENT_SECONDS each."""
+    frames = max(1, round(CHECKPOINT_SEGMENT_SECONDS * fps))
+    step = frames / fps
+    bounds = []
+    start = 0.0
+    while start < duration - 0.5 / fps:
+        end = min(duration, start + step)
+        bounds.append((start, end))
+        start = end
+    return bounds
+
+
+def concat_segments(parts: list[tuple[Path, float]], output_path: Path) -> None:
+    listing = output_path.with_name(f".{output_path.stem}.parts.txt")
+    # Explicit durations keep AAC padding at the end of each part from shifting the next one.
+    listing.write_text(
+        "".join(f"file '{part.resolve()}'\nduration {seconds:.6f}\n" for part, seconds in parts)
+    )
+    cmd = [
+        get_setting("FFMPEG_BINARY"),
+        "-y",
+        "-loglevel", "error",
+        "-f", "concat",
+        "-safe", "0",
+        "-i", str(listing),
+        "-c", "copy",
+        "-movflags", "+faststart",
+        "-f", "mp4",
+        str(output_path),
+    ]
+    try:
+        proc = subprocess.run(cmd, capture_output=True, text=True, errors="replace")
+    finally:
+        listing.unlink(missing_ok=True)
+    if proc.returncode != 0:
+        output_path.unlink(missing_ok=True)
+        raise RuntimeError(f"Joining segments of {output_path.name} failed: {proc.stderr.strip()}")
+
+
+def encode_video(
+    clip_obj,
+    output_path: Path,
+    fps: float,
+    audio,
+    ffmpeg_params: list[str],
+    logger: Optional[ProgressBarLogger],
+    preset: str = "veryfast",
+) -> None:
+    clip_obj.write_videofile(
+        str(output_path),
+        audio=audio,
+        codec="libx264",
+        audio_codec="aac",
+        audio_bitrate=f"{AUDIO_BITRATE_KBPS}k",
+        fps=fps,
+        preset=preset,
+        threads=ENCODE_THREADS,
+        temp_audiofile=str(output_path.with_suffix(".m4a")),
+        remove_temp=True,
+        ffmpeg_params=ffmpeg_params,
+        logger=logger,
+    )
+
+
+def encode_segments(
+    clip_obj,
+    output_path: Path,
+    fps: float,
+    audio,
+    ffmpeg_params: list[str],
+    logger: Optional[ProgressBarLogger],
+    job_id: str,
+    checkpoint: dict,
+    preset: str = "veryfast",
+) -> None:
+    """Encode ``clip_obj`` as separately checkpointed time segments, then join them losslessly."""
+    current = checkpoint["current"]
+    bounds = segment_bounds(clip_obj.duration, fps)
+    duration = clip_obj.duration or 1.0
+    for index, (start, end) in enumerate(bounds):
+        if index < len(current["parts"]):
+            continue
+        part_path = segment_part_path(output_path, index)
+        part_params = list(ffmpeg_params)
+        if isinstance(audio, str):
+            # The source audio is a separate ffmpeg input, so trim it to this window there.
+            part_params += ["-af", f"atrim=start={start:.6f}:end={end:.6f},asetpts=PTS-STARTPTS"]
+        marker = rendering_marker(part_path)
+        if FRAGMENTED_OUTPUT:
+            # The segment being encoded is what /progress offers for preview.
+            part_params += fragmented_mp4_params()
+            marker.touch()
+            JOB_RENDERING_OUTPUT[job_id] = part_path.name
+        if isinstance(logger, JobProgressLogger):
+            logger.segment_start, logger.segment_span = start / duration, (end - start) / duration
+        try:
+            encode_video(clip_obj.subclip(start, end), part_path, fps, audio, part_params, logger, preset)
+        except Exception:
+            part_path.unlink(missing_ok=True)
+            raise
+        finally:
+            marker.unlink(missing_ok=True)
+            JOB_RENDERING_OUTPUT.pop(job_id, None)
+        current["parts"].append({"index": index, "file": part_path.name, "size_bytes": part_path.stat().st_size})
+        save_checkpoint(checkpoint)
+
+    parts = [
+        (output_path.parent / part["file"], end - start)
+        for part, (start, end) in zip(current["parts"], bounds)
+    ]
+    concat_segments(parts, output_path)
+    for part, _ in parts:
+        part.unlink(missing_ok=True)
+
+
+def write_clip(
+    clip_obj,
+    output_dir: Path,
+    fps: float,
+    aspect_key: str,
+    style: str,
+    job_id: str,
+    naming_state: dict,
+    seq_number: Optional[int],
+    logger: Optional[ProgressBarLogger],
+    encode_settings: Optional[dict] = None,
+    audio_source: Optional[Path] = None,
+    checkpoint: Optional[dict] = None,
+    output_name: Optional[tuple[str, dict]] = None,
+    preset: Optional[str] = None,
+    storage=None,
+):
+    """Encode one ratio into ``output_dir``; with a remote ``storage`` the output also goes to
+    the object store, streamed there while it is encoded when it is a fragmented MP4."""
+    config = ASPECT_OPTIONS.get(aspect_key)
+    if not config:
+        raise ValueError(f"Unsupported aspect key: {aspect_key}")
+
+    size = capped_size(config["size"], (encode_settings or {}).get("max_long_edge"))
+    duration = clip_obj.duration
+    current = checkpoint.get("current") if checkpoint else None
+    resuming = bool(current and current["aspect_key"] == aspect_key)
+    if resuming:
+        # Resuming this ratio: keep the name and preset its finished segments were rendered with.
+        filename, tokens = current["filename"], current["tokens"]
+        preset = preset or current.get("preset")
+    elif output_name:
+        filename, tokens = output_name
+    else:
+        filename, tokens = generate_output_filename(
+            naming_state["base_info"],
+            aspect_key,
+            style,
+            naming_state["config"],
+            seq_number,
+            ext="mp4",
+            output_dir=output_dir,
+        )
+    preset = preset or choose_preset(encode_settings, style, size, fps, duration or 0.0)
+    output_path = output_dir / filename
+    ffmpeg_params = rate_control_params(encode_settings, duration)
+    encoder_filters = getattr(clip_obj, "encoder_filters", None)
+    if encoder_filters:
+        # The clip is not at the output size yet, so MoviePy may not add yuv420p itself.
+        ffmpeg_params += ["-vf", encoder_filters, "-pix_fmt", "yuv420p"]
+    audio = True
+    if audio_source is not None and clip_obj.audio is not None:
+        # Encode the source's audio in the video ffmpeg itself instead of MoviePy's
+        # decode-to-temp-file pass, which would also have to wait for the whole upload.
+        audio = str(audio_source)
+        ffmpeg_params += ["-map", "0:v:0", "-map", "1:a:0", "-c:a", "aac", "-b:a", f"{AUDIO_BITRATE_KBPS}k"]
+    remux_source = getattr(clip_obj, "remux_source", None)
+    segmented = (
+        checkpoint is not None
+        and not remux_source
+        and CHECKPOINT_SEGMENT_SECONDS > 0
+        and duration
+        and duration > CHECKPOINT_SEGMENT_SECONDS * 1.5
+    )
+    if checkpoint is not None and not resuming:
+        checkpoint["current"] = {
+            "aspect_key": aspect_key,
+            "filename": filename,
+            "tokens": tokens,
+            "preset": preset,
+            "parts": [],
+        }
+        save_checkpoint(checkpoint)
+    fragmented = FRAGMENTED_OUTPUT and not remux_source and not segmented
+    marker = rendering_marker(output_path)
+    upload = None
+    if fragmented:
+        ffmpeg_params += fragmented_mp4_params()
+        marker.touch()
+        JOB_RENDERING_OUTPUT[job_id] = filename
+        if storage is not None:
+            upload = storage.follow(output_dir, filename, marker)
+    started = time.monotonic()
+    try:
+        if remux_source:
+            remux_video(remux_source, output_path)
+        elif segmented:
+            encode_segments(clip_obj, output_path, fps, audio, ffmpeg_params, logger, job_id, checkpoint, preset)
+        else:
+            encode_video(clip_obj, output_path, fps, audio, ffmpeg_params, logger, preset)
+            # A streamed upload already holds the fragmented file (its moov is up front as well).
+            if fragmented and upload is None:
+                finalize_faststart(output_path)
+    except Exception:
+        # MoviePy leaves the writer's ffmpeg running when the frame loop raises.
+        kill_job_processes(job_id)
+        output_path.unlink(missing_ok=True)
+        if upload is not None:
+            upload.abort()
+        raise
+    finally:
+        clip_obj.close()
+        if fragmented:
+            marker.unlink(missing_ok=True)
+            JOB_RENDERING_OUTPUT.pop(job_id, None)
+    if storage is not None:
+        storage.store(output_dir, filename, upload)
+    if not remux_source and not resuming and duration:
+        record_encode_speed(style, preset, size, duration * fps, time.monotonic() - started)
+
+    size_bytes = output_path.stat().st_size
+    result = {
+        "label": f"{config['label']} • {STYLE_LABELS.get(style, style)}",
+        "filename": filename,
+        "aspect_key": aspect_key,
+        "ratio_label": tokens.get("ratio_token", config.get("short", aspect_key)),
+        "size_bytes": size_bytes,
+        "bitrate_kbps": round(size_bytes * 8 / 1000 / duration) if duration else None,
+        "preset": None if remux_source else preset,
+    }
+    return result
+
+
+def discard_outputs(output_dir: Path, outputs: list[dict]) -> None:
+    # Objects of stored outputs are left for the storage sweep of the cleanup worker.
+    for item in outputs:
+        (output_dir / item["filename"]).unlink(missing_ok=True)
+        stored_marker(output_dir / item["filename"]).unlink(missing_ok=True)
+
+
+def discard_checkpoint(output_dir: Path, checkpoint: dict) -> None:
+    discard_outputs(output_dir, checkpoint["outputs"])
+    discard_current(output_dir, checkpoint["current"])
+    Path(checkpoint["path"]).unlink(missing_ok=True)
+
+
+class FrameStore:
+    """Decoded source frames in a memory-mapped ring that ratio worker processes read in place.
+
+    A small header counts the frames written so far and where each reader is, so workers
+    start on the first frames while the decoder is still filling the rest. When the whole
+    source does not fit FRAME_STORE_MAX_MB the store holds ``slots`` frames and the decoder
+    stays at most that far ahead of the slowest worker, overwriting frames all have passed.
+    """
+
+    HEADER_BYTES = 512
+    # Header int64s: frames written, decode failed, then the newest frame index each reader asked for.
+    MAX_READERS = HEADER_BYTES // 8 - 2
+    # Frames a reader may still step back to behind the newest one it asked for.
+    LOOKBACK = 8
+    MIN_SLOTS = 4 * LOOKBACK
+
+    def __init__(self, path: Path, count: int, size: tuple[int, int], slots: Optional[int] = None,
+                 reader: Optional[int] = None):
+        self.path = Path(path)
+        self.count = count
+        self.slots = slots or count
+        self.size = size
+        self.reader = reader
+        width, height = size
+        self.header = np.memmap(self.path, dtype=np.int64, mode="r+", shape=(self.HEADER_BYTES // 8,))
+        self.frames = np.memmap(
+            self.path, dtype=np.uint8, mode="r+", offset=self.HEADER_BYTES, shape=(self.slots, height, width, 3)
+        )
+
+    @staticmethod
+    def frame_count(duration: float, fps: float) -> int:
+        # The frame times write_videofile asks for.
+        return len(np.arange(0, duration, 1.0 / fps))
+
+    @classmethod
+    def capacity(cls, count: int, size: tuple[int, int]) -> int:
+        """Frames of a ``count``-frame source the store can hold: all of them, a ring, or 0 if too few fit."""
+        frame_bytes = size[0] * size[1] * 3
+        FRAME_STORE_DIR.mkdir(parents=True, exist_ok=True)
+        budget = min(FRAME_STORE_MAX_MB * 1024 * 1024, shutil.disk_usage(FRAME_STORE_DIR).free) - cls.HEADER_BYTES
+        slots = min(count, int(budget // frame_bytes))
+        return slots if slots >= min(count, cls.MIN_SLOTS) else 0
+
+    @classmethod
+    def create(cls, path: Path, count: int, size: tuple[int, int], slots: Optional[int] = None) -> "FrameStore":
+        with open(path, "wb") as handle:
+            handle.truncate(cls.HEADER_BYTES + (slots or count) * size[0] * size[1] * 3)
+        return cls(path, count, size, slots)
+
+    def fill(self, clip, fps: float, stop: Event, readers: int = 0) -> None:
+        """Decode every output frame time of ``clip`` into the store (runs on its own thread)."""
+        try:
+            for index in range(self.count):
+                # The frame this one overwrites must be behind every reader's lookback.
+                while index >= self.slots and index - self.slots >= self.slowest(readers) - self.LOOKBACK:
+                    if stop.is_set():
+                        return
+                    time.sleep(0.005)
+                if stop.is_set():
+                    return
+                self.frames[index % self.slots] = clip.get_frame(index / fps)
+                self.header[0] = index + 1
+        except Exception:
+            logging.exception("Decoding into the frame store %s failed", self.path.name)
+            self.header[1] = 1
+
+    def slowest(self, readers: int) -> int:
+        return int(self.header[2:2 + readers].min()) if readers else self.count
+
+    def release(self, reader: int) -> None:
+        """Stop holding the decoder back for ``reader`` (it finished or died)."""
+        self.header[2 + reader] = self.count + self.slots
+
+    def frame(self, index: int) -> np.ndarray:
+        index = min(max(index, 0), self.count - 1)
+        if self.reader is not None and index > self.header[2 + self.reader]:
+            self.header[2 + self.reader] = index
+        waited_since = None
+        while self.header[0] <= index:
+            if self.header[1]:
+                raise IOError("The source could not be decoded")
+            waited_since = waited_since or time.monotonic()
+            if time.monotonic() - waited_since > RECEIVING_STALL_SECONDS:
+                raise IOError("The source decoder stopped producing frames")
+            time.sleep(0.005)
+        if index < self.header[0] - self.slots:
+            raise IOError(f"Frame {index} already left the frame store")
+        return self.frames[index % self.slots]
+
+    def to_clip(self, fps: float, duration: float, audio=None):
+        """A source-like clip whose frames are views into the store, for the style builders."""
+        clip = VideoClip(lambda t: self.frame(int(round(t * fps))), duration=duration)
+        clip.fps = fps
+        clip.audio = audio
+        return clip
+
+
+def ratio_worker() -> None:
+    """Entry point of a ratio worker process: reads its task as JSON on stdin and reports
+    progress and results as JSON lines on stdout (see ``render_in_workers``)."""
+    task = json.loads(sys.stdin.read())
+    channel = os.fdopen(os.dup(1), "w")
+    # Anything MoviePy or proglog prints must not end up in the message stream.
+    sys.stdout = sys.stderr
+
+    def emit(**message) -> None:
+        channel.write(json.dumps(message) + "\n")
+        channel.flush()
+
+    job_id, fps = task["job_id"], task["fps"]
+    output_dir, input_path = Path(task["output_dir"]), Path(task["input_path"])
+    store = FrameStore(Path(task["store"]), task["frames"], tuple(task["size"]), task["slots"], task["reader"])
+    audio = AudioFileClip(str(input_path)) if task["has_audio"] else None
+    source = store.to_clip(fps, task["duration"], audio)
+    builder = style_builder(task["style"])
+    storage = create_output_storage(task["output_storage"]) if task.get("output_storage") else None
+    try:
+        with job_context(job_id):
+            for item in task["ratios"]:
+                aspect_key = item["aspect_key"]
+                reported_at = [0.0]
+
+                def report(value: float, aspect_key=aspect_key) -> None:
+                    now = time.monotonic()
+                    if now - reported_at[0] >= 0.25:
+                        reported_at[0] = now
+                        emit(aspect_key=aspect_key, progress=value, rendering=JOB_RENDERING_OUTPUT.get(job_id))
+
+                logger = JobProgressLogger(job_id, 0, 1, output_dir, report=report)
+                target_clip = builder(source, tuple(item["size"]), task["rotation"], fps)
+                started = time.monotonic()
+                try:
+                    result = write_clip(
+                        target_clip,
+                        output_dir,
+                        fps,
+                        aspect_key,
+                        task["style"],
+                        job_id,
+                        {},
+                        item["seq_number"],
+                        logger,
+                        task["encode"],
+                        audio_source=input_path,
+                        output_name=(item["filename"], item["tokens"]),
+                        preset=item["preset"],
+                        storage=storage,
+                    )
+                except JobCancelled:
+                    emit(aspect_key=aspect_key, cancelled=True)
+                    return
+                except Exception as exc:
+                    logging.exception("Rendering %s of %s failed", aspect_key, input_path.name)
+                    emit(aspect_key=aspect_key, error=str(exc))
+                    return
+                emit(aspect_key=aspect_key, result=result, elapsed=time.monotonic() - started)
+    finally:
+        store.release(task["reader"])
+        if audio is not None:
+            audio.close()
+
+
+def relay_worker_messages(proc: subprocess.Popen, messages: queue.Queue) -> None:
+    for line in proc.stdout:
+        try:
+            messages.put(json.loads(line))
+        except json.JSONDecodeError:
+            logging.warning("Unexpected ratio worker output: %s", line.strip())
+    messages.put(None)
+
+
+def render_in_workers(
+    clip,
+    input_path: Path,
+    output_dir: Path,
+    style: str,
+    job_id: str,
+    items: list[dict],
+    naming_state: dict,
+    encode_settings: Optional[dict],
+    rotation: int,
+    fps: float,
+    frame_total: int,
+    store_frames: int,
+    worker_count: int,
+    checkpoint: dict,
+    outputs: list[dict],
+    ratio_total: int,
+    storage=None,
+) -> None:
+    """Render ``items`` (one per ratio) in parallel worker processes fed from a frame store.
+
+    The source is decoded once, on a thread of this process, into a memory-mapped file on
+    local scratch holding ``store_frames`` frames; every worker reads frames from it in place
+    while decoding continues. Finished ratios are appended to ``outputs`` and checkpointed as they arrive.
+    """
+    for item in items:
+        # Names are taken up front (and the file created) so workers never race for one.
+        item["filename"], item["tokens"] = generate_output_filename(
+            naming_state["base_info"],
+            item["aspect_key"],
+            style,
+            naming_state["config"],
+            item["seq_number"],
+            ext="mp4",
+            output_dir=output_dir,
+        )
+        (output_dir / item["filename"]).touch()
+
+    store = FrameStore.create(
+        FRAME_STORE_DIR / f"autoframe-{job_id}-{uuid.uuid4().hex[:8]}.frames",
+        frame_total,
+        (clip.w, clip.h),
+        store_frames,
+    )
+    stop = Event()
+    decoder = Thread(
+        target=store.fill, args=(clip, fps, stop, worker_count), daemon=True, name=f"FrameStore-{job_id}"
+    )
+    decoder.start()
+    engine_dir = str(Path(__file__).resolve().parent)
+    env = {
+        **os.environ,
+        "PYTHONPATH": os.pathsep.join(filter(None, [engine_dir, os.environ.get("PYTHONPATH")])),
+        "ENCODE_THREADS": str(max(1, ENCODE_THREADS // worker_count)),
+    }
+    messages: queue.Queue = queue.Queue()
+    procs: list[subprocess.Popen] = []
+    fractions = {item["aspect_key"]: 0.0 for item in items}
+    sizes = {item["aspect_key"]: item["size"] for item in items}
+    done: set[str] = set()
+    error = None
+    cancelled = False
+    try:
+        for slot in range(worker_count):
+            task = {
+                "job_id": job_id,
+                "store": str(store.path),
+                "frames": frame_total,
+                "slots": store_frames,
+                "reader": slot,
+                "size": [clip.w, clip.h],
+                "fps": fps,
+                "duration": clip.duration,
+                "has_audio": clip.audio is not None,
+                "input_path": str(Path(input_path).resolve()),
+                "output_dir": str(Path(output_dir).resolve()),
+                "style": style,
+                "rotation": rotation,
+                "encode": encode_settings,
+                "ratios": items[slot::worker_count],
+                "output_storage": storage.kind if storage is not None else None,
+            }
+            proc = subprocess.Popen(
+                [sys.executable, "-c", "from render_engine import ratio_worker; ratio_worker()"],
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                env=env,
+                text=True,
+            )
+            register_job_process(proc)
+            procs.append(proc)
+            proc.stdin.write(json.dumps(task))
+            proc.stdin.close()
+            Thread(target=relay_worker_messages, args=(proc, messages), daemon=True).start()
+
+        running = len(procs)
+        while running:
+            try:
+                message = messages.get(timeout=CANCEL_CHECK_SECONDS)
+            except queue.Empty:
+                message = {}
+            if message is None:
+                running -= 1
+                # A worker that died mid-ratio must not hold the decoder back for the others.
+                for slot, proc in enumerate(procs):
+                    if proc.poll() is not None:
+                        store.release(slot)
+                continue
+            aspect_key = message.get("aspect_key")
+            if "progress" in message:
+                fractions[aspect_key] = message["progress"]
+                if message.get("rendering"):
+                    JOB_RENDERING_OUTPUT[job_id] = message["rendering"]
+                overall = (ratio_total - len(items) + sum(fractions.values())) / ratio_total
+                update_job_progress(job_id, overall, "processing")
+            elif "result" in message:
+                result = message["result"]
+                fractions[aspect_key] = 1.0
+                done.add(aspect_key)
+                outputs.append(result)
+                checkpoint["outputs"] = outputs
+                save_checkpoint(checkpoint)
+                if result.get("preset") and clip.duration:
+                    record_encode_speed(
+                        style, result["preset"], tuple(sizes[aspect_key]), clip.duration * fps, message["elapsed"]
+                    )
+            elif message.get("cancelled"):
+                cancelled = True
+            elif "error" in message:
+                error = error or message["error"]
+            if (cancelled or error or is_cancelled(output_dir)) and any(proc.poll() is None for proc in procs):
+                for proc in procs:
+                    if proc.poll() is None:
+                        proc.kill()
+        for proc in procs:
+            if proc.wait() != 0 and error is None and not cancelled:
+                error = f"A ratio worker exited with code {proc.returncode}"
+    finally:
+        for proc in procs:
+            if proc.poll() is None:
+                proc.kill()
+                proc.wait()
+        stop.set()
+        decoder.join()
+        JOB_RENDERING_OUTPUT.pop(job_id, None)
+        store.path.unlink(missing_ok=True)
+    for item in items:
+        if item["aspect_key"] not in done:
+            path = output_dir / item["filename"]
+            path.unlink(missing_ok=True)
+            rendering_marker(path).unlink(missing_ok=True)
+    if cancelled or is_cancelled(output_dir):
+        discard_checkpoint(output_dir, checkpoint)
+        raise JobCancelled(job_id)
+    if error or len(done) < len(items):
+        raise RuntimeError(error or "A ratio worker stopped before finishing its outputs")
+
+
+def render_variants(
+    input_path: Path,
+    output_dir: Path,
+    style: str,
+    job_id: str,
+    ratios: list[str],
+    naming_state: dict,
+    encode_settings: Optional[dict] = None,
+    ratio_workers: Optional[int] = None,
+    storage=None,
+) -> list[dict]:
+    """Render every ratio of one source; ``ratio_workers`` caps the parallel ratio processes and
+    finished outputs are also put into ``storage`` (see output_storage.py) when one is given."""
+    output_dir.mkdir(exist_ok=True, parents=True)
+    fingerprint = {"style": style, "encode": encode_settings or build_encode_settings(None)}
+    checkpoint = load_checkpoint(output_dir, input_path, fingerprint)
+    outputs: list[dict] = list(checkpoint["outputs"])
+    finished = {item["aspect_key"] for item in outputs}
+
+    with VideoFileClip(str(input_path)) as clip:
+        rotation = orientation_angle(clip)
+        source_fps = getattr(clip, "fps", None) or getattr(clip.reader, "fps", 30)
+        max_fps = (encode_settings or {}).get("max_fps")
+        fps = min(source_fps, max_fps) if max_fps else source_fps
+        max_long_edge = (encode_settings or {}).get("max_long_edge")
+
+        builder = style_builder(style)
+
+        # Ratios that need frames composed or encoded go to worker processes when there
+        # are several, the frame store has room and no segmented resume is pending.
+        pending = [key for key in ratios if key in ASPECT_OPTIONS and key not in finished]
+        worker_limit = RATIO_WORKERS if ratio_workers is None else ratio_workers
+        worker_count = min(len(pending), worker_limit, FrameStore.MAX_READERS)
+        frame_total = FrameStore.frame_count(clip.duration or 0.0, fps)
+        use_workers = worker_count > 1 and checkpoint["current"] is None and frame_total > 0
+        store_frames = FrameStore.capacity(frame_total, (clip.w, clip.h)) if use_workers else 0
+        if use_workers and not store_frames:
+            logging.info(
+                "Rendering the ratios of %s one after another: not even %d decoded frames fit FRAME_STORE_MAX_MB",
+                input_path.name,
+                FrameStore.MIN_SLOTS,
+            )
+            use_workers = False
+        elif use_workers and store_frames < frame_total:
+            logging.info(
+                "Frame store for %s holds %d of %d frames; decoding stays that far ahead of the slowest worker",
+                input_path.name,
+                store_frames,
+                frame_total,
+            )
+        parallel: list[dict] = []
+
+        streams = None
+        ratio_total = max(1, len(ratios))
+        for idx, aspect_key in enumerate(ratios):
+            config = ASPECT_OPTIONS.get(aspect_key)
+            if not config:
+                continue
+            if aspect_key in finished:
+                continue
+            if is_cancelled(output_dir):
+                discard_checkpoint(output_dir, checkpoint)
+                raise JobCancelled(job_id)
+            size = capped_size(config["size"], max_long_edge)
+            trivial = is_trivial_geometry((clip.w, clip.h), size, rotation)
+            remux = False
+            if trivial and (clip.w, clip.h) == size and fps == source_fps:
+                if streams is None:
+                    streams = probe_streams(input_path)
+                remux = can_remux(streams) and source_fits_encode_settings(encode_settings, input_path, clip.duration)
+            seq_number = naming_state["sequence_start"] + len(outputs) + len(parallel) + 1
+            # A ring never goes back to the first frames, so each worker takes one ratio of it.
+            if use_workers and not remux and (store_frames == frame_total or len(parallel) < worker_count):
+                parallel.append({
+                    "aspect_key": aspect_key,
+                    "size": size,
+                    "seq_number": seq_number,
+                    "preset": choose_preset(encode_settings, style, size, fps, clip.duration or 0.0),
+                })
+                continue
+            if trivial:
+                target_clip = build_scaled_passthrough(clip, size)
+                if remux:
+                    target_clip.remux_source = input_path
+            else:
+                target_clip = builder(clip, size, rotation, fps)
+            logger = JobProgressLogger(job_id, idx, ratio_total, output_dir)
+            update_job_progress(job_id, idx / ratio_total, "processing")
+            try:
+                outputs.append(
+                    write_clip(
+                        target_clip,
+                        output_dir,
+                        fps,
+                        aspect_key,
+                        style,
+                        job_id,
+                        naming_state,
+                        seq_number,
+                        logger,
+                        encode_settings,
+                        audio_source=input_path,
+                        checkpoint=checkpoint,
+                        storage=storage,
+                    )
+                )
+            except Exception as exc:
+                if not is_cancelled(output_dir):
+                    raise
+                # Killed ffmpeg children surface as broken pipes; report them as the cancel they are.
+                discard_checkpoint(output_dir, checkpoint)
+                if isinstance(exc, JobCancelled):
+                    raise
+                raise JobCancelled(job_id) from exc
+            checkpoint["outputs"] = outputs
+            checkpoint["current"] = None
+            save_checkpoint(checkpoint)
+
+        if parallel:
+            render_in_workers(
+                clip,
+                input_path,
+                output_dir,
+                style,
+                job_id,
+                parallel,
+                naming_state,
+                encode_settings,
+                rotation,
+                fps,
+                frame_total,
+                store_frames,
+                min(len(parallel), worker_count),
+                checkpoint,
+                outputs,
+                ratio_total,
+                storage,
+            )
+
+    Path(checkpoint["path"]).unlink(missing_ok=True)
+    update_job_progress(job_id, 1.0, "done")
+    order = {aspect_key: index for index, aspect_key in enumerate(ratios)}
+    return sorted(outputs, key=lambda item: order.get(item["aspect_key"], len(order)))
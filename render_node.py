@@ -0,0 +1,312 @@
+"""
+Render farm node for Free AutoFrame (RENDER_MODE=farm).
+
+Leases render tasks from the web node, downloads the upload, renders it with the
+same engine as the web app in a local scratch directory and sends the outputs and
+result back. Progress is reported every few seconds; the report also extends the
+task's lease and tells the node when the job was cancelled. Add capacity by
+starting this on another process or host:
+
+    RENDER_FARM_TOKEN=... python render_node.py https://autoframe.example.com -j 2
+
+A node that stops reporting loses its tasks to the next node after
+RENDER_FARM_LEASE_SECONDS. Scratch directories of failed renders and of lost
+leases are kept (until clean_scratch drops them a day later), so a task leased
+back to the same host continues from the render checkpoint left there.
+"""
+
+import argparse
+import json
+import logging
+import os
+import shutil
+import socket
+import sys
+import time
+import urllib.error
+import urllib.request
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from threading import Lock, Thread
+from typing import Optional
+
+from render_engine import (
+    HOST_MEMORY_BUDGET_MB,
+    JOB_MEMORY,
+    JOB_PROGRESS,
+    JobCancelled,
+    clear_job_progress,
+    job_context,
+    memory_in_use_mb,
+    prepare_base_info,
+    release_memory,
+    render_variants,
+    request_cancel,
+    reserve_memory,
+    sample_job_memory,
+    start_memory_monitor,
+)
+
+HEARTBEAT_SECONDS = 2.0
+IDLE_POLL_SECONDS = 1.0
+SCRATCH_MAX_AGE_SECONDS = 24 * 3600
+HISTORY_WINDOW = 50
+
+
+class FarmClient:
+    """Minimal JSON/HTTP client for the web node's /farm API."""
+
+    def __init__(self, server: str, token: str, node: str):
+        self.server = server.rstrip("/")
+        self.headers = {"X-Farm-Token": token, "X-Farm-Node": node}
+
+    def request(self, method: str, path: str, payload=None, data=None, headers=None) -> tuple[int, Optional[dict]]:
+        headers = {**self.headers, **(headers or {})}
+        if payload is not None:
+            data = json.dumps(payload).encode()
+            headers["Content-Type"] = "application/json"
+        req = urllib.request.Request(self.server + path, data=data, method=method, headers=headers)
+        try:
+            with urllib.request.urlopen(req, timeout=600) as response:
+                body = response.read()
+                return response.status, json.loads(body) if body else None
+        except urllib.error.HTTPError as exc:
+            body = exc.read()
+            try:
+                return exc.code, json.loads(body) if body else None
+            except json.JSONDecodeError:
+                return exc.code, None
+
+    def download(self, path: str, target: Path) -> None:
+        req = urllib.request.Request(self.server + path, headers=self.headers)
+        with urllib.request.urlopen(req, timeout=600) as response, target.open("wb") as handle:
+            shutil.copyfileobj(response, handle, 1024 * 1024)
+
+    def upload(self, path: str, source: Path) -> tuple[int, Optional[dict]]:
+        with source.open("rb") as handle:
+            return self.request(
+                "PUT",
+                path,
+                data=handle,
+                headers={"Content-Type": "video/mp4", "Content-Length": str(source.stat().st_size)},
+            )
+
+
+class RenderNode:
+    def __init__(self, client: FarmClient, work_dir: Path, slots: int, ratio_workers: Optional[int] = None):
+        self.client = client
+        self.work_dir = work_dir
+        self.slots = max(1, slots)
+        # Every slot may start its own ratio worker processes; together they share the host's CPUs.
+        self.ratio_workers = ratio_workers or max(1, (os.cpu_count() or 1) // self.slots)
+        self.active: dict[str, dict] = {}
+        self.history: deque = deque(maxlen=HISTORY_WINDOW)
+        self.lock = Lock()
+
+    def scratch_dir(self, task: dict) -> Path:
+        # Stable per file, so a task leased back to this host finds its render checkpoint.
+        return self.work_dir / f"{task['job_id']}_{task['index']}"
+
+    def state(self) -> dict:
+        """This node's load, in the shape /capacity combines across render services and nodes."""
+        now = time.monotonic()
+        with self.lock:
+            active = [
+                {
+                    "style": task["style"],
+                    "duration": float(task.get("duration") or 0.0),
+                    "ratio_count": len(task["ratios"]),
+                    "elapsed": now - task["started_at"],
+                }
+                for task in self.active.values()
+            ]
+            history = list(self.history)
+        return {
+            "slots": self.slots,
+            "active": active,
+            "queued": [],
+            "history": history,
+            "memory": {"budget_mb": HOST_MEMORY_BUDGET_MB, "in_use_mb": memory_in_use_mb()},
+        }
+
+    def heartbeat(self) -> None:
+        while True:
+            time.sleep(HEARTBEAT_SECONDS)
+            with self.lock:
+                tasks = list(self.active.values())
+            for task in tasks:
+                try:
+                    status, reply = self.client.request(
+                        "POST",
+                        f"/farm/tasks/{task['task_id']}/progress",
+                        {"progress": JOB_PROGRESS.get(task["job_id"]), "state": self.state()},
+                    )
+                except OSError as exc:
+                    logging.warning("Progress report for %s failed: %s", task["task_id"], exc)
+                    continue
+                if status == 410 or (reply or {}).get("cancelled"):
+                    # Cancelled, or leased to another node after we went quiet: stop rendering it.
+                    task["lease_lost"] = status == 410
+                    request_cancel(task["output_dir"])
+
+    def run_task(self, task: dict) -> None:
+        task_id, job_id = task["task_id"], task["job_id"]
+        scratch = self.scratch_dir(task)
+        output_dir = scratch / "out"
+        output_dir.mkdir(parents=True, exist_ok=True)
+        (output_dir / ".cancel").unlink(missing_ok=True)
+        with self.lock:
+            self.active[task_id] = active = {**task, "output_dir": output_dir, "started_at": time.monotonic()}
+        # The checkpoint in scratch is kept for a re-lease unless the file is finished or cancelled by its user.
+        keep_scratch = True
+        try:
+            source = scratch / f"input{Path(task['original_name']).suffix.lower() or '.mp4'}"
+            self.client.download(task["input_url"], source)
+            naming_state = {
+                "config": task["naming"],
+                "base_info": prepare_base_info(task["name"], task.get("base_override"), task["naming"]),
+                "sequence_start": task["sequence_start"],
+            }
+            reserve_memory(job_id, task.get("memory_mb", 0.0))
+            started = time.monotonic()
+            try:
+                with job_context(job_id, output_dir):
+                    outputs = render_variants(
+                        source,
+                        output_dir,
+                        task["style"],
+                        job_id,
+                        task["ratios"],
+                        naming_state,
+                        task["encode"],
+                        ratio_workers=self.ratio_workers,
+                    )
+                sample_job_memory()
+                peak_rss_mb = JOB_MEMORY.get(job_id, {}).get("peak_mb")
+            finally:
+                release_memory(job_id)
+            elapsed = time.monotonic() - started
+
+            for item in outputs:
+                status, reply = self.client.upload(
+                    f"/farm/tasks/{task_id}/outputs/{item['filename']}", output_dir / item["filename"]
+                )
+                if status != 201:
+                    raise RuntimeError(f"Uploading {item['filename']} failed: {(reply or {}).get('error', status)}")
+                item["filename"] = reply["filename"]
+            status, reply = self.client.request(
+                "POST", f"/farm/tasks/{task_id}/complete", {"outputs": outputs, "peak_rss_mb": peak_rss_mb}
+            )
+            if status != 200:
+                raise RuntimeError(f"Completing {task_id} failed: {(reply or {}).get('error', status)}")
+            keep_scratch = False
+            if task.get("duration"):
+                with self.lock:
+                    self.history.append({
+                        "style": task["style"],
+                        "output_seconds": task["duration"] * len(task["ratios"]),
+                        "elapsed": elapsed,
+                    })
+            logging.info("Rendered %s/%s (%s) in %.1fs", job_id, task["index"], task["name"], elapsed)
+        except Exception as exc:
+            cancelled = isinstance(exc, JobCancelled)
+            if cancelled and not active.get("lease_lost"):
+                keep_scratch = False
+            if not cancelled:
+                logging.exception("Render of %s/%s failed", job_id, task["index"])
+            try:
+                self.client.request(
+                    "POST", f"/farm/tasks/{task_id}/fail", {"error": str(exc), "cancelled": cancelled}
+                )
+            except OSError:
+                logging.warning("Could not report the failure of %s; its lease will expire", task_id)
+        finally:
+            clear_job_progress(job_id)
+            with self.lock:
+                self.active.pop(task_id, None)
+            if not keep_scratch:
+                shutil.rmtree(scratch, ignore_errors=True)
+
+    def serve(self) -> None:
+        start_memory_monitor()
+        Thread(target=self.heartbeat, daemon=True, name="FarmHeartbeat").start()
+        logging.info(
+            "Render node %s serving %s with %d slot(s)",
+            self.client.headers["X-Farm-Node"],
+            self.client.server,
+            self.slots,
+        )
+        with ThreadPoolExecutor(max_workers=self.slots) as pool:
+            while True:
+                with self.lock:
+                    busy = len(self.active)
+                if busy >= self.slots:
+                    time.sleep(IDLE_POLL_SECONDS)
+                    continue
+                try:
+                    status, task = self.client.request("POST", "/farm/claim", {"state": self.state()})
+                except OSError as exc:
+                    logging.warning("Web node unreachable: %s", exc)
+                    time.sleep(IDLE_POLL_SECONDS * 5)
+                    continue
+                if status != 200 or not task:
+                    if status not in (200, 204):
+                        logging.warning("Claim refused with HTTP %s: %s", status, task)
+                    time.sleep(IDLE_POLL_SECONDS)
+                    continue
+                with self.lock:
+                    # Count it as busy before the thread starts so the loop does not over-claim.
+                    self.active[task["task_id"]] = {
+                        **task,
+                        "output_dir": self.scratch_dir(task) / "out",
+                        "started_at": time.monotonic(),
+                    }
+                pool.submit(self.run_task, task)
+
+
+def clean_scratch(work_dir: Path) -> None:
+    """Drop scratch folders of tasks nobody came back for."""
+    cutoff = time.time() - SCRATCH_MAX_AGE_SECONDS
+    for path in work_dir.iterdir():
+        if path.is_dir() and path.stat().st_mtime < cutoff:
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Render tasks for a Free AutoFrame web node running RENDER_MODE=farm.")
+    parser.add_argument("server", nargs="?", default=os.environ.get("RENDER_FARM_URL"), help="Base URL of the web node")
+    parser.add_argument("--token", default=os.environ.get("RENDER_FARM_TOKEN"), help="Shared RENDER_FARM_TOKEN")
+    parser.add_argument("--node-id", default=f"{socket.gethostname()}-{os.getpid()}")
+    parser.add_argument("-j", "--slots", type=int, default=int(os.environ.get("RENDER_NODE_SLOTS", "2")), help="Renders at a time")
+    parser.add_argument(
+        "--ratio-workers",
+        type=int,
+        default=int(os.environ.get("RENDER_NODE_RATIO_WORKERS", "0")),
+        help="Ratio worker processes per render (default: CPU count / --slots)",
+    )
+    parser.add_argument(
+        "--work-dir",
+        type=Path,
+        default=Path(os.environ.get("RENDER_NODE_WORK_DIR", "render_node")),
+        help="Scratch space for inputs, outputs and checkpoints",
+    )
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    if not args.server or not args.token:
+        parser.error("the web node URL and --token (or RENDER_FARM_URL / RENDER_FARM_TOKEN) are required")
+
+    args.work_dir.mkdir(parents=True, exist_ok=True)
+    clean_scratch(args.work_dir)
+    node = RenderNode(
+        FarmClient(args.server, args.token, args.node_id), args.work_dir, args.slots, args.ratio_workers
+    )
+    try:
+        node.serve()
+    except KeyboardInterrupt:
+        return 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -9,8 +9,19 @@
   let ffmpegReady = false;
   let ffmpegLoadingPromise = null;
   let ffmpegProgressCallback = null;
-  const FFMPEG_CORE_URL = "https://unpkg.com/@ffmpeg/core@0.11.0/dist/ffmpeg-core.js";
-  const CLIENT_DURATION_LIMIT_SECONDS = config.clientDurationLimit ?? 75;
+  const FFMPEG_CORE_VERSION = "0.11.0";
+  const FFMPEG_CORE_BASE_URL = `https://unpkg.com/@ffmpeg/core@${FFMPEG_CORE_VERSION}/dist`;
+  const FFMPEG_CORE_URL = `${FFMPEG_CORE_BASE_URL}/ffmpeg-core.js`;
+  // The core (~25 MB of WASM plus its scripts) is kept in Cache Storage across sessions.
+  // Bumping FFMPEG_CORE_VERSION switches to a fresh cache and deletes the old ones.
+  const FFMPEG_CACHE_PREFIX = "autoframe-ffmpeg-core-";
+  const FFMPEG_CACHE_NAME = `${FFMPEG_CACHE_PREFIX}${FFMPEG_CORE_VERSION}`;
+  const FFMPEG_CORE_FILES = {
+    corePath: ["ffmpeg-core.js", "application/javascript"],
+    wasmPath: ["ffmpeg-core.wasm", "application/wasm"],
+    workerPath: ["ffmpeg-core.worker.js", "application/javascript"],
+  };
+  const CLIENT_DURATION_LIMIT_SECONDS = config.clientDurationLimit ?? 120;
 
   // Tier management
   const TIER_LIMITS = {
@@ -144,21 +155,59 @@
     hostinger: config.hostingerApiUrl || '',
   };
 
-  // Smart backend selection based on video characteristics
-  function selectBackend(videoFile, duration) {
+  // Load-aware routing between the browser renderer and the server.
+  // Clips short/small enough for ffmpeg.wasm are "marginal": they stay in the
+  // browser while the server is saturated and go to the server when it is idle.
+  const capacityUrl = config.capacityUrl || "/capacity";
+  const BROWSER_RENDER_SPEED = config.browserRenderSpeed ?? 0.25; // output seconds per wall second
+
+  async function fetchServerCapacity(styleKey, duration, ratios) {
+    const params = new URLSearchParams({ style: styleKey, duration: String(duration || 0) });
+    ratios.forEach((ratio) => params.append("ratios", ratio));
+    try {
+      const response = await fetch(`${capacityUrl}?${params.toString()}`, {
+        headers: { Accept: "application/json" },
+      });
+      if (!response.ok) {
+        return null;
+      }
+      return await response.json();
+    } catch (error) {
+      console.warn("[Backend] Capacity check failed:", error);
+      return null;
+    }
+  }
+
+  function canRenderInBrowser(videoFile, duration) {
+    if (!createFFmpeg || !duration) {
+      return false;
+    }
     const fileSizeMB = videoFile.size / (1024 * 1024);
-    const isLargeFile = fileSizeMB > 50;
-    const isLongVideo = duration > CLIENT_DURATION_LIMIT_SECONDS;
+    return duration <= CLIENT_DURATION_LIMIT_SECONDS && fileSizeMB <= TIER_LIMITS.free.maxFileSizeMB;
+  }
+
+  async function selectBackend(videoFile, duration, styleKey, ratios) {
+    if (!canRenderInBrowser(videoFile, duration)) {
+      console.log(`[Backend] Using server for ${videoFile.name} (too large/long for the browser)`);
+      return "server";
+    }
 
-    // Use Hostinger for large files or when Hostinger URL is configured
-    if ((isLargeFile || isLongVideo) && BACKEND_CONFIG.hostinger) {
-      console.log(`[Backend] Using Hostinger for ${fileSizeMB.toFixed(1)}MB, ${duration.toFixed(1)}s video`);
-      return BACKEND_CONFIG.hostinger;
+    const capacity = await fetchServerCapacity(styleKey, duration, ratios);
+    if (!capacity) {
+      return "server";
     }
 
-    // Default to current origin (Vercel or local dev)
-    console.log(`[Backend] Using default backend (${window.location.origin})`);
-    return BACKEND_CONFIG.vercel;
+    const browserSeconds = (duration * Math.max(1, ratios.length)) / BROWSER_RENDER_SPEED;
+    if (capacity.saturated && capacity.predicted_total_seconds > browserSeconds) {
+      console.log(
+        `[Backend] Server saturated (${capacity.active_renders} active, ${capacity.queue_depth} queued, ` +
+        `~${Math.round(capacity.predicted_total_seconds)}s); rendering ${videoFile.name} in the browser`
+      );
+      return "browser";
+    }
+
+    console.log(`[Backend] Using server for ${videoFile.name} (~${Math.round(capacity.predicted_total_seconds)}s predicted)`);
+    return "server";
   }
 
   if (typeof window.launchRewardedAd !== "function") {
@@ -179,6 +228,7 @@
   }
 
   const apiProcessUrl = config.apiProcess || "/api/process";
+  const apiBatchUrl = config.apiBatch || "/api/batch";
 
   const form = document.getElementById("batch-form");
   const fileInput = document.getElementById("file-picker");
@@ -374,6 +424,66 @@
     labelMode: "short",
   };
 
+  async function cachedCoreUrls() {
+    if (typeof caches === "undefined") {
+      return null;
+    }
+    const stale = (await caches.keys()).filter(
+      (name) => name.startsWith(FFMPEG_CACHE_PREFIX) && name !== FFMPEG_CACHE_NAME
+    );
+    await Promise.all(stale.map((name) => caches.delete(name)));
+    if (navigator.storage && navigator.storage.persist) {
+      navigator.storage.persist().catch(() => {});
+    }
+    const cache = await caches.open(FFMPEG_CACHE_NAME);
+    const entries = await Promise.all(
+      Object.entries(FFMPEG_CORE_FILES).map(async ([option, [file, type]]) => {
+        const url = `${FFMPEG_CORE_BASE_URL}/${file}`;
+        let response = await cache.match(url);
+        if (!response) {
+          response = await fetch(url, { mode: "cors" });
+          if (!response.ok) {
+            throw new Error(`Fetching ${file} failed (HTTP ${response.status})`);
+          }
+          await cache.put(url, response.clone());
+        }
+        return [option, URL.createObjectURL(new Blob([await response.arrayBuffer()], { type }))];
+      })
+    );
+    return Object.fromEntries(entries);
+  }
+
+  async function createFfmpegInstance(paths) {
+    const instance = createFFmpeg({ log: true, ...paths });
+    await instance.load();
+    instance.setProgress(({ ratio }) => {
+      if (typeof ffmpegProgressCallback === "function") {
+        ffmpegProgressCallback(Math.max(0, Math.min(1, ratio || 0)));
+      }
+    });
+    return instance;
+  }
+
+  async function loadFfmpeg() {
+    let paths = null;
+    try {
+      paths = await cachedCoreUrls();
+    } catch (error) {
+      console.warn("[FFmpeg] Core cache unavailable:", error);
+    }
+    if (paths) {
+      try {
+        return await createFfmpegInstance(paths);
+      } catch (error) {
+        console.warn("[FFmpeg] Cached core failed to load; fetching it again:", error);
+        Object.values(paths).forEach((url) => URL.revokeObjectURL(url));
+        await caches.delete(FFMPEG_CACHE_NAME).catch(() => {});
+      }
+    }
+    return createFfmpegInstance({ corePath: FFMPEG_CORE_URL });
+  }
+
+  // One FFmpeg instance serves every file of every batch in this tab.
   async function ensureFfmpegLoaded() {
     if (ffmpegReady && ffmpegInstance) {
       return ffmpegInstance;
@@ -382,23 +492,44 @@
       throw new Error("FFmpeg WASM is unavailable in this browser.");
     }
     if (!ffmpegLoadingPromise) {
-      ffmpegInstance = createFFmpeg({
-        log: true,
-        corePath: FFMPEG_CORE_URL,
-      });
-      ffmpegLoadingPromise = ffmpegInstance.load().then(() => {
-        ffmpegInstance.setProgress(({ ratio }) => {
-          if (typeof ffmpegProgressCallback === "function") {
-            ffmpegProgressCallback(Math.max(0, Math.min(1, ratio || 0)));
-          }
-        });
-        ffmpegReady = true;
-        return ffmpegInstance;
-      });
+      ffmpegLoadingPromise = loadFfmpeg().then(
+        (instance) => {
+          ffmpegInstance = instance;
+          ffmpegReady = true;
+          return instance;
+        },
+        (error) => {
+          ffmpegLoadingPromise = null;
+          throw error;
+        }
+      );
     }
     return ffmpegLoadingPromise;
   }
 
+  function discardFfmpeg() {
+    // A run that aborted (out of memory, corrupt input) leaves the instance unusable;
+    // the next render loads a fresh one, from the cache.
+    if (ffmpegInstance) {
+      try {
+        ffmpegInstance.exit();
+      } catch (error) {
+        console.warn("[FFmpeg] Failed to shut down the instance:", error);
+      }
+    }
+    ffmpegInstance = null;
+    ffmpegReady = false;
+    ffmpegLoadingPromise = null;
+  }
+
+  function warmFfmpeg() {
+    // Load the core while the user is still choosing files, so the render starts right away.
+    if (!createFFmpeg || ffmpegLoadingPromise || typeof SharedArrayBuffer === "undefined") {
+      return;
+    }
+    ensureFfmpegLoaded().catch((error) => console.warn("[FFmpeg] Warm-up failed:", error));
+  }
+
   let namingOptions = loadNamingOptions();
   let baseOverrides = {};
   let baseOverrideFlags = {};
@@ -409,6 +540,14 @@
   let formDisabled = false;
   let progressPoll = null;
   let currentJobId = null;
+  // Server job still rendering for this tab; cancelled when the tab goes away.
+  let activeServerJobId = null;
+
+  window.addEventListener("pagehide", () => {
+    if (activeServerJobId && navigator.sendBeacon) {
+      navigator.sendBeacon(`/jobs/${encodeURIComponent(activeServerJobId)}/cancel`);
+    }
+  });
 
   if (namingOptions.mode === "custom") {
     customCache = { ...namingOptions };
@@ -1092,7 +1231,9 @@
       const link = document.createElement("a");
       link.className = "secondary-button";
       link.href = output.url;
-      link.textContent = output.label;
+      link.textContent = output.size_bytes
+        ? `${output.label} · ${formatFileSize(output.size_bytes)}`
+        : output.label;
       link.setAttribute("download", output.filename);
       item.appendChild(link);
       list.appendChild(item);
@@ -1156,7 +1297,10 @@
     processSelectedFiles(files);
   });
 
-  fileButton.addEventListener("click", () => fileInput.click());
+  fileButton.addEventListener("click", () => {
+    warmFfmpeg();
+    fileInput.click();
+  });
 
   if (fileInputWrapper) {
     const preventDefaults = (event) => {
@@ -1170,6 +1314,7 @@
         if (fileInput && fileInput.disabled) {
           return;
         }
+        warmFfmpeg();
         fileInputWrapper.classList.add("is-dragover");
       });
     });
@@ -1212,6 +1357,7 @@
       if (isButton) {
         return;
       }
+      warmFfmpeg();
       fileInput.click();
     });
   }
@@ -1289,17 +1435,39 @@
     updatePatternPreview();
   });
 
+  function namingFormFields(fileName) {
+    return {
+      naming_mode: namingOptions.mode === "custom" ? "custom" : "auto",
+      naming_preset: namingOptions.preset,
+      naming_custom_pattern: namingOptions.customPattern || "",
+      naming_auto_clean: namingOptions.autoClean ? "1" : "0",
+      naming_keep_tokens: namingOptions.keepTokens ? "1" : "0",
+      naming_add_sequence: namingOptions.addSequence ? "1" : "0",
+      naming_append_date: namingOptions.appendDate ? "1" : "0",
+      naming_label_mode: namingOptions.labelMode,
+      base_override: namingOptions.mode === "custom" ? (baseOverrides[fileName] || "") : "",
+    };
+  }
+
+  function encodeFormFields() {
+    const fields = {};
+    ["rate_control", "quality", "target_size_mb"].forEach((name) => {
+      const control = form.querySelector(`[name="${name}"]`);
+      if (control && control.value) {
+        fields[name] = control.value;
+      }
+    });
+    return fields;
+  }
+
+  function formatFileSize(bytes) {
+    return `${(bytes / (1024 * 1024)).toFixed(1)} MB`;
+  }
+
   function applyNamingToFormData(formData, fileName) {
-    formData.append("naming_mode", namingOptions.mode === "custom" ? "custom" : "auto");
-    formData.append("naming_preset", namingOptions.preset);
-    formData.append("naming_custom_pattern", namingOptions.customPattern || "");
-    formData.append("naming_auto_clean", namingOptions.autoClean ? "1" : "0");
-    formData.append("naming_keep_tokens", namingOptions.keepTokens ? "1" : "0");
-    formData.append("naming_add_sequence", namingOptions.addSequence ? "1" : "0");
-    formData.append("naming_append_date", namingOptions.appendDate ? "1" : "0");
-    formData.append("naming_label_mode", namingOptions.labelMode);
-    const overrideValue = namingOptions.mode === "custom" ? (baseOverrides[fileName] || "") : "";
-    formData.append("base_override", overrideValue);
+    Object.entries(namingFormFields(fileName)).forEach(([key, value]) => {
+      formData.append(key, value);
+    });
   }
 
   if (renderButton) {
@@ -1355,9 +1523,11 @@
     // Check video durations against tier limit
     let tooLong = false;
     const maxDuration = currentLimits.maxDurationSeconds;
+    const durations = new Map();
     for (const file of files) {
       try {
         const duration = await probeFileDuration(file);
+        durations.set(file, duration);
         if (duration && duration > maxDuration) {
           showFlash(
             `${file.name} is ${Math.ceil(duration)}s (max ${maxDuration}s for ${currentLimits.label} tier). ${currentTier === 'free' ? 'Upgrade to PAID for longer videos.' : 'Please use shorter videos.'}`,
@@ -1377,8 +1547,25 @@
 
     // Enforce rendering mode based on tier
     if (currentLimits.mode === 'server') {
-      // PAID tier: always use server rendering
-      await performFallbackRender(files, warnings, selectedRatios);
+      // PAID tier: server rendering, except marginal clips while the server is saturated
+      const styleKey = styleSelector();
+      const browserFiles = [];
+      const serverFiles = [];
+      for (const file of files) {
+        const backend = await selectBackend(file, durations.get(file), styleKey, selectedRatios);
+        (backend === "browser" ? browserFiles : serverFiles).push(file);
+      }
+      if (browserFiles.length) {
+        try {
+          await performClientSideRender(browserFiles, warnings, selectedRatios);
+        } catch (error) {
+          console.error(error);
+          serverFiles.push(...browserFiles);
+        }
+      }
+      if (serverFiles.length) {
+        await performFallbackRender(serverFiles, warnings, selectedRatios);
+      }
       return;
     }
 
@@ -1391,27 +1578,98 @@
     }
   }
 
-  function buildFfmpegFilters(styleKey, targetW, targetH) {
-    const filters = {};
+  // Browser renders decode each file once: one ffmpeg.run splits the decoded stream into
+  // every selected ratio. The input, the encoders' frame buffers and the finished outputs
+  // all sit in the WASM heap during a run, so ratios are grouped into as few runs as fit.
+  const WASM_MEMORY_BUDGET_BYTES = (config.wasmMemoryBudgetMB ?? 1536) * 1024 * 1024;
+  const BROWSER_VIDEO_BITRATE_BPS = 8_000_000; // CRF 20 at 1080p, with headroom
+  const BROWSER_AUDIO_BITRATE_BPS = 128_000;
+  const ENCODER_FRAMES_IN_FLIGHT = 24; // x264 lookahead/reference frames plus filter queues
+  const WASM_SCRATCH_PREFIXES = ["input_", "output_"];
+
+  function ratioBranch(styleKey, source, label, targetW, targetH) {
     if (styleKey === "fill") {
-      filters.videoArgs = [
-        "-vf",
-        `scale=${targetW}:${targetH}:force_original_aspect_ratio=increase,crop=${targetW}:${targetH},format=yuv420p`,
+      return [
+        `${source}scale=${targetW}:${targetH}:force_original_aspect_ratio=increase,crop=${targetW}:${targetH},format=yuv420p${label}`,
       ];
-    } else if (styleKey === "black") {
-      filters.videoArgs = [
-        "-vf",
-        `scale=${targetW}:${targetH}:force_original_aspect_ratio=decrease,pad=${targetW}:${targetH}:(ow-iw)/2:(oh-ih)/2:black,format=yuv420p`,
+    }
+    if (styleKey === "black") {
+      return [
+        `${source}scale=${targetW}:${targetH}:force_original_aspect_ratio=decrease,pad=${targetW}:${targetH}:(ow-iw)/2:(oh-ih)/2:black,format=yuv420p${label}`,
       ];
-    } else {
-      const filterComplex = [
-        `[0:v]scale=${targetW}:${targetH}:force_original_aspect_ratio=increase,crop=${targetW}:${targetH},boxblur=32:1[bg];`,
-        `[0:v]scale=${targetW}:${targetH}:force_original_aspect_ratio=decrease,pad=${targetW}:${targetH}:(ow-iw)/2:(oh-ih)/2[fg];`,
-        `[bg][fg]overlay=(main_w-overlay_w)/2:(main_h-overlay_h)/2:format=yuv420p[vout]`,
-      ].join("");
-      filters.videoArgs = ["-filter_complex", filterComplex, "-map", "[vout]"];
     }
-    return filters;
+    // Blur: the foreground is overlaid unpadded so the blurred fill shows around it.
+    const name = label.slice(1, -1);
+    return [
+      `${source}split=2[${name}bg][${name}fg]`,
+      `[${name}bg]scale=${targetW}:${targetH}:force_original_aspect_ratio=increase,crop=${targetW}:${targetH},boxblur=32:1[${name}blur]`,
+      `[${name}fg]scale=${targetW}:${targetH}:force_original_aspect_ratio=decrease[${name}front]`,
+      `[${name}blur][${name}front]overlay=(main_w-overlay_w)/2:(main_h-overlay_h)/2:format=auto,format=yuv420p${label}`,
+    ];
+  }
+
+  function buildRatioFilterGraph(styleKey, sizes) {
+    const sources = sizes.map((_, index) => `[src${index}]`);
+    const chains = [
+      sizes.length > 1 ? `[0:v]split=${sizes.length}${sources.join("")}` : `[0:v]null${sources[0]}`,
+    ];
+    sizes.forEach(([targetW, targetH], index) => {
+      chains.push(...ratioBranch(styleKey, sources[index], `[v${index}]`, targetW, targetH));
+    });
+    return chains.join(";");
+  }
+
+  function estimateOutputBytes(duration, targetW, targetH) {
+    const videoBps = BROWSER_VIDEO_BITRATE_BPS * ((targetW * targetH) / (1920 * 1080));
+    return (duration * (videoBps + BROWSER_AUDIO_BITRATE_BPS)) / 8;
+  }
+
+  function estimateRunBytes(duration, sizes) {
+    // Encoders hold YUV 4:2:0 frames (1.5 bytes per pixel); outputs grow to their full size.
+    return sizes.reduce(
+      (sum, [targetW, targetH]) =>
+        sum + estimateOutputBytes(duration, targetW, targetH) + targetW * targetH * 1.5 * ENCODER_FRAMES_IN_FLIGHT,
+      0
+    );
+  }
+
+  function planRatioRuns(inputBytes, duration, aspectKeys) {
+    // Greedy in selection order; a ratio that does not fit even on its own still gets a run.
+    const runs = [];
+    let current = [];
+    for (const aspectKey of aspectKeys) {
+      const candidate = [...current, aspectKey];
+      const sizes = candidate.map((key) => (aspectOptions[key] || defaultAspect).size || [1080, 1080]);
+      if (current.length && inputBytes + estimateRunBytes(duration, sizes) > WASM_MEMORY_BUDGET_BYTES) {
+        runs.push(current);
+        current = [aspectKey];
+      } else {
+        current = candidate;
+      }
+    }
+    if (current.length) {
+      runs.push(current);
+    }
+    return runs;
+  }
+
+  function clearWasmScratch(ffmpeg) {
+    // Drop inputs/outputs an aborted run left behind so they do not pin heap memory.
+    let entries = [];
+    try {
+      entries = ffmpeg.FS("readdir", "/");
+    } catch (error) {
+      return;
+    }
+    entries
+      .filter((name) => WASM_SCRATCH_PREFIXES.some((prefix) => name.startsWith(prefix)))
+      .forEach((name) => {
+        try {
+          ffmpeg.FS("unlink", name);
+        } catch (cleanupError) {
+          console.warn("Failed to remove ffmpeg scratch file:", cleanupError);
+        }
+      });
   }
 
   async function performClientSideRender(files, warnings, selectedRatios) {
@@ -1440,6 +1698,15 @@
       for (const [fileIndex, file] of files.entries()) {
         const override = namingOptions.mode === "custom" ? (baseOverrides[file.name] || "") : "";
         const baseInfo = prepareBaseInfo(file.name, override, namingConfig);
+        let duration = null;
+        try {
+          duration = await probeFileDuration(file);
+        } catch (error) {
+          console.warn("Failed to inspect duration for", file.name, error);
+        }
+        const runs = planRatioRuns(file.size, duration || CLIENT_DURATION_LIMIT_SECONDS, selectedRatios);
+
+        clearWasmScratch(ffmpeg);
         const inputName = `input_${Date.now()}_${Math.random().toString(16).slice(2)}.mp4`;
         ffmpeg.FS("writeFile", inputName, await fetchFile(file));
 
@@ -1447,83 +1714,98 @@
         const ratioLabels = new Set();
 
         try {
-          for (const [ratioIndex, aspectKey] of selectedRatios.entries()) {
+          for (const [runIndex, runRatios] of runs.entries()) {
             await yieldToBrowser();
-            const aspectMeta = aspectOptions[aspectKey] || defaultAspect;
-            const [targetW, targetH] = aspectMeta.size || [1080, 1080];
-            const filters = buildFfmpegFilters(styleKey, targetW, targetH);
-            const outputName = `output_${fileIndex}_${ratioIndex}_${Date.now()}.mp4`;
-            const seqNumber = processedTargets + 1;
-            const filename = generateOutputFilename(
-              baseInfo,
-              aspectKey,
-              styleKey,
-              namingConfig,
-              seqNumber,
-              "mp4",
-              uniqueNames,
-              dateStamp
-            );
-            const ratioLabel = namingConfig.label_mode === "friendly"
-              ? (aspectMeta.label || aspectKey)
-              : (aspectMeta.short || aspectKey);
-            ratioLabels.add(ratioLabel);
+            const targets = runRatios.map((aspectKey, ratioIndex) => {
+              const aspectMeta = aspectOptions[aspectKey] || defaultAspect;
+              const ratioLabel = namingConfig.label_mode === "friendly"
+                ? (aspectMeta.label || aspectKey)
+                : (aspectMeta.short || aspectKey);
+              ratioLabels.add(ratioLabel);
+              return {
+                aspectKey,
+                aspectMeta,
+                ratioLabel,
+                size: aspectMeta.size || [1080, 1080],
+                outputName: `output_${fileIndex}_${runIndex}_${ratioIndex}_${Date.now()}.mp4`,
+                filename: generateOutputFilename(
+                  baseInfo,
+                  aspectKey,
+                  styleKey,
+                  namingConfig,
+                  processedTargets + ratioIndex + 1,
+                  "mp4",
+                  uniqueNames,
+                  dateStamp
+                ),
+              };
+            });
 
+            const completedBefore = processedTargets;
             ffmpegProgressCallback = (fraction) => {
               updateOverallProgress(
-                processedTargets,
-                fraction,
+                completedBefore,
+                fraction * targets.length,
                 totalTargets,
                 `Rendering ${file.name}`,
-                `${fileIndex + 1} of ${files.length} clip(s) • ${aspectMeta.label || ratioLabel}`
+                `${fileIndex + 1} of ${files.length} clip(s) • ${targets.map((target) => target.ratioLabel).join(", ")}`
               );
             };
 
-            const args = [
-              "-i", inputName,
-              ...filters.videoArgs,
-              "-c:v", "libx264",
-              "-preset", "veryfast",
-              "-crf", "20",
-              "-pix_fmt", "yuv420p",
-              "-movflags", "faststart",
-              "-c:a", "aac",
-              "-b:a", "128k",
-              "-map", "0:a?",
-              outputName,
-            ];
-
-            await ffmpeg.run(...args);
-            ffmpegProgressCallback = null;
-            processedTargets += 1;
-            updateOverallProgress(
-              processedTargets,
-              0,
-              totalTargets,
-              `Rendering ${file.name}`,
-              `${processedTargets} of ${totalTargets} outputs ready`
-            );
+            const args = ["-i", inputName, "-filter_complex", buildRatioFilterGraph(styleKey, targets.map((t) => t.size))];
+            targets.forEach((target, index) => {
+              args.push(
+                "-map", `[v${index}]`,
+                "-map", "0:a?",
+                "-c:v", "libx264",
+                "-preset", "veryfast",
+                "-crf", "20",
+                "-pix_fmt", "yuv420p",
+                "-movflags", "faststart",
+                "-c:a", "aac",
+                "-b:a", "128k",
+                target.outputName
+              );
+            });
 
-            let blobUrl = null;
             try {
-              const data = ffmpeg.FS("readFile", outputName);
-              const blob = new Blob([data.buffer], { type: "video/mp4" });
-              blobUrl = URL.createObjectURL(blob);
+              await ffmpeg.run(...args);
+            } catch (error) {
+              discardFfmpeg();
+              throw error;
             } finally {
+              ffmpegProgressCallback = null;
+            }
+
+            // Move each output out of the heap (and free it) before reading the next one.
+            for (const target of targets) {
+              let blobUrl = null;
               try {
-                ffmpeg.FS("unlink", outputName);
-              } catch (cleanupError) {
-                console.warn("Failed to remove ffmpeg output:", cleanupError);
+                const data = ffmpeg.FS("readFile", target.outputName);
+                blobUrl = URL.createObjectURL(new Blob([data.buffer], { type: "video/mp4" }));
+              } finally {
+                try {
+                  ffmpeg.FS("unlink", target.outputName);
+                } catch (cleanupError) {
+                  console.warn("Failed to remove ffmpeg output:", cleanupError);
+                }
               }
+              outputs.push({
+                url: blobUrl,
+                label: `${target.aspectMeta.label || target.ratioLabel} • ${styleLabels[styleKey] || styleKey}`,
+                filename: target.filename,
+                ratio_label: target.ratioLabel,
+              });
             }
 
-            outputs.push({
-              url: blobUrl,
-              label: `${aspectMeta.label || ratioLabel} • ${styleLabels[styleKey] || styleKey}`,
-              filename,
-              ratio_label: ratioLabel,
-            });
-
+            processedTargets += targets.length;
+            updateOverallProgress(
+              processedTargets,
+              0,
+              totalTargets,
+              `Rendering ${file.name}`,
+              `${processedTargets} of ${totalTargets} outputs ready`
+            );
             await yieldToBrowser();
           }
         } finally {
@@ -1566,7 +1848,7 @@
     }
   }
 
-  async function performFallbackRender(files, warnings, selectedRatios) {
+  async function performSequentialServerRender(files, warnings, selectedRatios) {
     toggleForm(true);
     updateOverridesInput();
 
@@ -1576,6 +1858,7 @@
     let batchId = (typeof crypto !== "undefined" && crypto.randomUUID)
       ? crypto.randomUUID()
       : `batch_${Date.now()}_${Math.random().toString(16).slice(2)}`;
+    activeServerJobId = batchId;
 
     initializeProgress(total);
 
@@ -1596,6 +1879,7 @@
         formData.append("video", file);
         selectedRatios.forEach((ratio) => formData.append("ratios", ratio));
         applyNamingToFormData(formData, file.name);
+        Object.entries(encodeFormFields()).forEach(([key, value]) => formData.append(key, value));
 
         const xhr = new XMLHttpRequest();
         xhr.open("POST", apiProcessUrl);
@@ -1644,6 +1928,7 @@
           }
 
           batchId = payload.batch_id;
+          activeServerJobId = batchId;
           appendResultCard(payload.result);
           processed += 1;
           updateOverallProgress(
@@ -1667,6 +1952,7 @@
       });
     }
 
+    activeServerJobId = null;
     if (processed === total) {
       stopProcessingPolling();
       targetProgress = 100;
@@ -1707,6 +1993,199 @@
     toggleForm(false);
   }
 
+  class BatchUnavailableError extends Error {}
+
+  async function createServerBatch(files, selectedRatios) {
+    const namingFields = namingFormFields("");
+    delete namingFields.base_override;
+    const payload = {
+      ...namingFields,
+      ...encodeFormFields(),
+      style: styleSelector(),
+      ratios: selectedRatios,
+      files: files.map((file) => ({ name: file.name, size: file.size || 0 })),
+      base_overrides: namingOptions.mode === "custom" ? { ...baseOverrides } : {},
+    };
+    const response = await fetch(apiBatchUrl, {
+      method: "POST",
+      headers: { "Content-Type": "application/json", Accept: "application/json" },
+      body: JSON.stringify(payload),
+    });
+    if (response.status === 404 || response.status === 405) {
+      throw new BatchUnavailableError("Batch API unavailable");
+    }
+    const data = await response.json().catch(() => ({}));
+    if (!response.ok || data.error) {
+      throw new Error(data.error || `HTTP ${response.status}`);
+    }
+    return data;
+  }
+
+  // The file is sent as the raw request body so the server can write it straight to disk,
+  // probe its header early and start rendering faststart clips before the upload ends.
+  function uploadBatchFile(uploadUrl, file, onProgress) {
+    return new Promise((resolve) => {
+      const xhr = new XMLHttpRequest();
+      xhr.open("POST", uploadUrl);
+      xhr.responseType = "json";
+      xhr.upload.onprogress = (event) => {
+        if (event.lengthComputable && event.total) {
+          onProgress(Math.min(1, event.loaded / event.total));
+        }
+      };
+      xhr.onerror = () => resolve({ error: "network error" });
+      xhr.onload = () => {
+        const payload = xhr.response || {};
+        if (xhr.status < 200 || xhr.status >= 300 || payload.error) {
+          resolve({ error: payload.error || `HTTP ${xhr.status}` });
+          return;
+        }
+        resolve(payload);
+      };
+      xhr.setRequestHeader("Accept", "application/json");
+      xhr.setRequestHeader("Content-Type", file.type || "application/octet-stream");
+      xhr.setRequestHeader("X-Filename", encodeURIComponent(file.name));
+      xhr.send(file);
+    });
+  }
+
+  // Pipelined server render: files upload back-to-back while earlier files render,
+  // and each file's outputs appear as soon as the server finishes it.
+  async function performFallbackRender(files, warnings, selectedRatios) {
+    let batch;
+    try {
+      batch = await createServerBatch(files, selectedRatios);
+    } catch (error) {
+      if (error instanceof BatchUnavailableError) {
+        await performSequentialServerRender(files, warnings, selectedRatios);
+        return;
+      }
+      showFlash(`Server rendering failed: ${error.message}`, "error");
+      return;
+    }
+
+    toggleForm(true);
+    updateOverridesInput();
+    initializeProgress(files.length);
+    activeServerJobId = batch.batch_id;
+
+    const total = files.length;
+    const errors = [];
+    const settled = new Set();
+    let processed = 0;
+    let uploadStatus = "";
+    let lastPoll = null;
+
+    const refreshProgress = () => {
+      const renderFraction = lastPoll && lastPoll.progress ? Math.max(0, Math.min(1, lastPoll.progress.progress || 0)) : 0;
+      const rendering = settled.size < total ? renderFraction : 0;
+      const subtitle = [`${processed} of ${total} clip(s) rendered`, uploadStatus].filter(Boolean).join(" • ");
+      updateOverallProgress(settled.size, rendering, total, settled.size < total ? "Rendering on server" : "Finalising", subtitle);
+    };
+
+    const applyStatus = (status) => {
+      lastPoll = status;
+      (status.files || []).forEach((entry) => {
+        if (settled.has(entry.index)) {
+          return;
+        }
+        if (entry.status === "done" && entry.result) {
+          settled.add(entry.index);
+          processed += 1;
+          appendResultCard(entry.result);
+          resultsSection.classList.remove("hidden");
+          if (status.downloads && status.downloads.bundle) {
+            downloadAllLink.href = status.downloads.bundle;
+            downloadAllLink.setAttribute("aria-disabled", "false");
+            downloadAllLink.removeAttribute("title");
+          }
+        } else if (entry.status === "error") {
+          settled.add(entry.index);
+          errors.push(`${entry.name}: ${entry.error || "render failed"}`);
+        } else if (entry.status === "cancelled") {
+          settled.add(entry.index);
+          errors.push(`${entry.name}: cancelled`);
+        }
+      });
+      refreshProgress();
+    };
+
+    let batchMissing = false;
+    const poll = async () => {
+      try {
+        // watch=1 lets the server cancel the batch once this tab stops polling.
+        const response = await fetch(`${batch.status_url}?watch=1`, { headers: { Accept: "application/json" } });
+        if (response.status === 404) {
+          batchMissing = true;
+          return;
+        }
+        if (response.ok) {
+          applyStatus(await response.json());
+        }
+      } catch (error) {
+        // ignore polling errors, will retry
+      }
+    };
+
+    stopProcessingPolling();
+    progressPoll = setInterval(poll, 1000);
+
+    for (const [index, file] of files.entries()) {
+      const target = batch.files[index];
+      uploadStatus = `uploading ${file.name}`;
+      refreshProgress();
+      const response = await uploadBatchFile(target.upload_url, file, (fraction) => {
+        uploadStatus = `uploading ${file.name} (${Math.round(fraction * 100)}%)`;
+        refreshProgress();
+      });
+      if (response.error && !settled.has(index)) {
+        settled.add(index);
+        errors.push(`${file.name}: ${response.error}`);
+      }
+    }
+    uploadStatus = "";
+
+    while (settled.size < total && !batchMissing) {
+      await new Promise((resolve) => setTimeout(resolve, 1000));
+    }
+    await poll();
+    stopProcessingPolling();
+    activeServerJobId = null;
+
+    if (processed) {
+      targetProgress = 100;
+      updateProgressStatus(100, "Batch complete", `${processed} of ${total} clip(s) rendered`);
+      setTimeout(() => {
+        displayedProgress = 100;
+        renderProgress();
+        stopProgressAnimation();
+      }, 600);
+      fetchUsageStats();
+    } else {
+      resetProgress();
+    }
+
+    const messages = [];
+    if (processed) {
+      messages.push(`Rendered ${processed} clip(s).`);
+    }
+    if (warnings.length) {
+      messages.push(`Warnings: ${warnings.join(" • ")}`);
+    }
+    if (batchMissing) {
+      errors.push("The server lost track of this batch. Please try again.");
+    }
+    if (errors.length) {
+      messages.push(`Errors: ${errors.join(" • ")}`);
+    }
+    if (!processed && !errors.length) {
+      messages.push("Nothing was rendered.");
+    }
+    showFlash(messages.join(" • "), errors.length || !processed ? "error" : "success");
+
+    toggleForm(false);
+  }
+
   function buildNamingPayload() {
     const pattern = getPatternString();
     const dateStamp = new Date().toISOString().slice(0, 10);
@@ -1759,4 +2238,9 @@
 
   // Initialize tier UI
   initializeTierUI();
+
+  if (currentLimits.mode === "browser") {
+    // FREE renders always run in the browser: warm the core as soon as the page is idle.
+    (window.requestIdleCallback || ((callback) => setTimeout(callback, 2000)))(() => warmFfmpeg());
+  }
 })();
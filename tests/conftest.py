@@ -0,0 +1,14 @@
+"""Test setup: import the app modules from the repository root, with scratch folders under a temp dir."""
+
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+_scratch = Path(tempfile.mkdtemp(prefix="autoframe-tests-"))
+for _name in ("OUTPUT_DIR", "UPLOAD_DIR", "RENDER_QUEUE_DIR", "FRAME_STORE_DIR"):
+    os.environ.setdefault(_name, str(_scratch / _name.lower()))
+os.environ.setdefault("SECRET_KEY", "test-only-secret")
@@ -0,0 +1,119 @@
+import json
+
+import pytest
+from moviepy.editor import ColorClip
+from moviepy.video.io.ffmpeg_reader import ffmpeg_parse_infos
+
+import render_engine
+from render_engine import (
+    checkpoint_path,
+    encode_segments,
+    load_checkpoint,
+    save_checkpoint,
+    segment_bounds,
+    segment_part_path,
+)
+
+FPS = 10
+
+
+@pytest.fixture
+def short_segments(monkeypatch):
+    monkeypatch.setattr(render_engine, "CHECKPOINT_SEGMENT_SECONDS", 1.0)
+    monkeypatch.setattr(render_engine, "FRAGMENTED_OUTPUT", False)
+
+
+def color_clip(duration: float):
+    clip = ColorClip((32, 24), color=(200, 40, 40), duration=duration)
+    clip.fps = FPS
+    return clip
+
+
+def new_checkpoint(output_dir, input_path, filename: str) -> dict:
+    return {
+        "path": str(checkpoint_path(output_dir, input_path)),
+        "fingerprint": {"style": "blur"},
+        "outputs": [],
+        "current": {"aspect_key": "portrait", "filename": filename, "tokens": {}, "parts": []},
+    }
+
+
+def test_segment_bounds_are_frame_aligned_and_cover_the_clip(short_segments):
+    bounds = segment_bounds(2.55, 30)
+    assert bounds[0][0] == 0.0 and bounds[-1][1] == 2.55
+    assert all(end == next_start for (_, end), (next_start, _) in zip(bounds, bounds[1:]))
+    for start, _ in bounds:
+        assert abs(start * 30 - round(start * 30)) < 1e-6
+    # A trailing sliver shorter than half a frame is not a segment of its own.
+    assert len(segment_bounds(2.0 + 0.4 / 30, 30)) == 2
+
+
+def test_interrupted_segments_resume_at_the_next_boundary(tmp_path, short_segments, monkeypatch):
+    input_path = tmp_path / "source.mp4"
+    output_path = tmp_path / "clip_9x16.mp4"
+    checkpoint = new_checkpoint(tmp_path, input_path, output_path.name)
+    real_encode = render_engine.encode_video
+    encoded = []
+
+    def interrupted(clip_obj, path, *args, **kwargs):
+        if path == segment_part_path(output_path, 1):
+            raise RuntimeError("worker recycled")
+        encoded.append(path.name)
+        real_encode(clip_obj, path, *args, **kwargs)
+
+    monkeypatch.setattr(render_engine, "encode_video", interrupted)
+    with pytest.raises(RuntimeError):
+        encode_segments(color_clip(2.5), output_path, FPS, None, [], None, "job", checkpoint)
+    assert [part["index"] for part in checkpoint["current"]["parts"]] == [0]
+    assert not segment_part_path(output_path, 1).exists()
+
+    resumed = load_checkpoint(tmp_path, input_path, {"style": "blur"})
+    assert [part["index"] for part in resumed["current"]["parts"]] == [0]
+
+    encoded.clear()
+
+    def recording(clip_obj, path, *args, **kwargs):
+        encoded.append(path.name)
+        real_encode(clip_obj, path, *args, **kwargs)
+
+    monkeypatch.setattr(render_engine, "encode_video", recording)
+    encode_segments(color_clip(2.5), output_path, FPS, None, [], None, "job", resumed)
+    assert encoded == [segment_part_path(output_path, 1).name, segment_part_path(output_path, 2).name]
+    assert ffmpeg_parse_infos(str(output_path))["duration"] == pytest.approx(2.5, abs=0.15)
+    assert not any(segment_part_path(output_path, index).exists() for index in range(3))
+
+
+def test_load_checkpoint_keeps_only_the_leading_intact_segments(tmp_path, short_segments):
+    input_path = tmp_path / "source.mp4"
+    output_path = tmp_path / "clip_1x1.mp4"
+    checkpoint = new_checkpoint(tmp_path, input_path, output_path.name)
+    for index in range(3):
+        part = segment_part_path(output_path, index)
+        render_engine.encode_video(color_clip(1.0), part, FPS, None, [], None)
+        checkpoint["current"]["parts"].append({"index": index, "file": part.name, "size_bytes": part.stat().st_size})
+    with segment_part_path(output_path, 1).open("ab") as handle:
+        handle.write(b"torn write")
+    output_path.write_bytes(b"half-joined")
+    save_checkpoint(checkpoint)
+
+    loaded = load_checkpoint(tmp_path, input_path, {"style": "blur"})
+    assert [part["index"] for part in loaded["current"]["parts"]] == [0]
+    assert segment_part_path(output_path, 0).exists()
+    assert not segment_part_path(output_path, 1).exists()
+    assert not segment_part_path(output_path, 2).exists()
+    assert not output_path.exists()
+
+
+def test_changed_settings_discard_the_checkpoint(tmp_path):
+    input_path = tmp_path / "source.mp4"
+    finished = tmp_path / "clip_16x9.mp4"
+    finished.write_bytes(b"old render")
+    path = checkpoint_path(tmp_path, input_path)
+    path.write_text(json.dumps({
+        "fingerprint": {"style": "fill"},
+        "outputs": [{"filename": finished.name, "size_bytes": 10}],
+        "current": None,
+    }))
+    loaded = load_checkpoint(tmp_path, input_path, {"style": "blur"})
+    assert loaded["outputs"] == [] and loaded["current"] is None
+    assert not finished.exists()
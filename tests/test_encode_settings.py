@@ -0,0 +1,80 @@
+import pytest
+
+from render_engine import (
+    AUDIO_BITRATE_KBPS,
+    CRF_LEVELS,
+    DEFAULT_MAX_BITRATE_KBPS,
+    MIN_VIDEO_BITRATE_KBPS,
+    build_encode_settings,
+    rate_control_params,
+)
+
+# The tier profiles config.py ships with.
+FREE = {"max_fps": 30, "max_long_edge": 1280, "preset": "veryfast", "rate_control": "crf", "quality": "compact"}
+PAID = {
+    "max_fps": 60,
+    "max_long_edge": 1920,
+    "preset": "adaptive",
+    "deadline_factor": 1.5,
+    "rate_control": "crf",
+    "quality": "standard",
+}
+
+
+def test_free_tier_defaults():
+    settings = build_encode_settings({}, FREE)
+    assert settings == {
+        "rate_control": "crf",
+        "quality": "compact",
+        "crf": CRF_LEVELS["compact"],
+        "preset": "veryfast",
+        "max_fps": 30,
+        "max_long_edge": 1280,
+    }
+    assert rate_control_params(settings, 60.0) == ["-crf", str(CRF_LEVELS["compact"])]
+
+
+def test_paid_tier_is_adaptive_with_its_deadline():
+    settings = build_encode_settings({}, PAID)
+    assert settings["preset"] == "adaptive"
+    assert settings["deadline_factor"] == 1.5
+    assert settings["crf"] == CRF_LEVELS["standard"]
+    assert (settings["max_fps"], settings["max_long_edge"]) == (60, 1920)
+
+
+def test_form_picks_quality_but_not_the_tier_caps():
+    settings = build_encode_settings({"quality": "high", "max_long_edge": "4096"}, FREE)
+    assert settings["crf"] == CRF_LEVELS["high"]
+    assert settings["max_long_edge"] == 1280
+
+
+def test_unknown_choices_fall_back_to_safe_defaults():
+    settings = build_encode_settings({"rate_control": "lossless", "quality": "ultra"}, {"preset": "placebo-ish"})
+    assert (settings["rate_control"], settings["quality"], settings["preset"]) == ("crf", "standard", "veryfast")
+
+
+def test_target_size_without_a_size_is_crf():
+    settings = build_encode_settings({"rate_control": "target_size"}, PAID)
+    assert settings["rate_control"] == "crf"
+    assert "target_size_mb" not in settings
+
+
+def test_target_size_bitrate_leaves_room_for_audio_and_container():
+    settings = build_encode_settings({"rate_control": "target_size", "target_size_mb": "10"}, PAID)
+    params = rate_control_params(settings, 60.0)
+    video_kbps = int(10 * 1024 * 1024 * 8 / 1000 * 0.97 / 60) - AUDIO_BITRATE_KBPS
+    assert params == ["-b:v", f"{video_kbps}k", "-maxrate", f"{video_kbps}k", "-bufsize", f"{video_kbps * 2}k"]
+    assert (video_kbps + AUDIO_BITRATE_KBPS) * 60 * 1000 / 8 <= 10 * 1024 * 1024
+
+
+def test_target_size_never_starves_the_video():
+    settings = build_encode_settings({"rate_control": "target_size", "target_size_mb": "0.1"}, PAID)
+    assert rate_control_params(settings, 180.0)[1] == f"{MIN_VIDEO_BITRATE_KBPS}k"
+
+
+@pytest.mark.parametrize("form, expected_kbps", [({}, DEFAULT_MAX_BITRATE_KBPS), ({"max_bitrate_kbps": "2500"}, 2500)])
+def test_capped_crf(form, expected_kbps):
+    settings = build_encode_settings({"rate_control": "capped", **form}, PAID)
+    assert rate_control_params(settings, 30.0) == [
+        "-crf", str(CRF_LEVELS["standard"]), "-maxrate", f"{expected_kbps}k", "-bufsize", f"{expected_kbps * 2}k",
+    ]
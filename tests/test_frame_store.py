@@ -0,0 +1,109 @@
+import time
+from threading import Event, Thread
+
+import numpy as np
+import pytest
+
+import render_engine
+from render_engine import FrameStore
+
+FPS = 10.0
+SIZE = (4, 2)
+
+
+class NumberedClip:
+    """Stand-in source whose frame ``i`` is filled with ``i``, so reads show which frame they got."""
+
+    def get_frame(self, t: float) -> np.ndarray:
+        return np.full((SIZE[1], SIZE[0], 3), round(t * FPS) % 256, dtype=np.uint8)
+
+
+def wait_until(condition, timeout: float = 5.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def start_fill(store: FrameStore, readers: int):
+    stop = Event()
+    thread = Thread(target=store.fill, args=(NumberedClip(), FPS, stop, readers), daemon=True)
+    thread.start()
+    return stop, thread
+
+
+def test_full_store_keeps_every_frame(tmp_path):
+    store = FrameStore.create(tmp_path / "full.frames", 50, SIZE)
+    stop, thread = start_fill(store, readers=0)
+    thread.join(5)
+    assert store.header[0] == 50
+    for index in (0, 17, 49):
+        assert store.frame(index)[0, 0, 0] == index
+
+
+def test_ring_wraps_around_for_a_sequential_reader(tmp_path):
+    path = tmp_path / "ring.frames"
+    FrameStore.create(path, 100, SIZE, slots=12)
+    decoder = FrameStore(path, 100, SIZE, slots=12)
+    reader = FrameStore(path, 100, SIZE, slots=12, reader=0)
+    stop, thread = start_fill(decoder, readers=1)
+    try:
+        seen = [int(reader.frame(index)[0, 0, 0]) for index in range(100)]
+    finally:
+        stop.set()
+        thread.join(5)
+    assert seen == list(range(100))
+    with pytest.raises(IOError, match="already left"):
+        reader.frame(50)
+
+
+def test_decoder_waits_for_the_slowest_reader(tmp_path):
+    path = tmp_path / "pressure.frames"
+    FrameStore.create(path, 200, SIZE, slots=16)
+    decoder = FrameStore(path, 200, SIZE, slots=16)
+    fast = FrameStore(path, 200, SIZE, slots=16, reader=0)
+    slow = FrameStore(path, 200, SIZE, slots=16, reader=1)
+    stop, thread = start_fill(decoder, readers=2)
+    try:
+        wait_until(lambda: decoder.header[0] == 16)
+        time.sleep(0.1)
+        assert decoder.header[0] == 16  # both readers still at frame 0
+
+        fast.frame(15)
+        time.sleep(0.1)
+        assert decoder.header[0] == 16  # the slow reader holds the ring
+
+        slow.frame(20)
+        # Frames up to 20 - LOOKBACK may be overwritten; the reader at 15 keeps them from going further.
+        wait_until(lambda: decoder.header[0] == 16 + 15 - FrameStore.LOOKBACK)
+        assert slow.frame(20 - FrameStore.LOOKBACK)[0, 0, 0] == 20 - FrameStore.LOOKBACK
+
+        fast.release(0)
+        slow.release(1)
+        wait_until(lambda: decoder.header[0] == 200)
+    finally:
+        stop.set()
+        thread.join(5)
+
+
+def test_decode_failure_reaches_readers(tmp_path):
+    class BrokenClip:
+        def get_frame(self, t):
+            raise IOError("corrupt source")
+
+    store = FrameStore.create(tmp_path / "broken.frames", 10, SIZE)
+    store.fill(BrokenClip(), FPS, Event())
+    with pytest.raises(IOError, match="could not be decoded"):
+        store.frame(0)
+
+
+def test_capacity_picks_full_store_ring_or_nothing(tmp_path, monkeypatch):
+    monkeypatch.setattr(render_engine, "FRAME_STORE_DIR", tmp_path)
+    frame_mb = 1920 * 1080 * 3 / 1024 / 1024
+    monkeypatch.setattr(render_engine, "FRAME_STORE_MAX_MB", frame_mb * 100 + 1)
+    assert FrameStore.capacity(60, (1920, 1080)) == 60
+    assert FrameStore.capacity(5000, (1920, 1080)) == 100
+    monkeypatch.setattr(render_engine, "FRAME_STORE_MAX_MB", frame_mb * (FrameStore.MIN_SLOTS - 1) + 1)
+    assert FrameStore.capacity(5000, (1920, 1080)) == 0
+    # A clip shorter than the minimum ring only needs room for itself.
+    assert FrameStore.capacity(10, (1920, 1080)) == 10
@@ -0,0 +1,66 @@
+import pytest
+
+from render_engine import capped_size, is_trivial_geometry, plan_geometry
+
+
+@pytest.mark.parametrize("source", [(641, 361), (1919, 1081), (1080, 1920), (333, 777)])
+@pytest.mark.parametrize("target", [(1080, 1920), (1080, 1080), (1920, 1080), (1080, 1350)])
+def test_fill_box_is_the_centered_target_shaped_region_of_the_source(source, target):
+    plan = plan_geometry(source, target)
+    left, top, right, bottom = plan["fill_box"]
+    assert 0 <= left and 0 <= top
+    assert right <= source[0] + 1e-6 and bottom <= source[1] + 1e-6
+    assert (right - left) / (bottom - top) == pytest.approx(target[0] / target[1])
+    assert left == pytest.approx(source[0] - right) and top == pytest.approx(source[1] - bottom)
+    # One side of the crop always spans the whole source.
+    assert right - left == pytest.approx(source[0]) or bottom - top == pytest.approx(source[1])
+
+
+@pytest.mark.parametrize("source", [(641, 361), (1080, 1920)])
+@pytest.mark.parametrize("target", [(1080, 1920), (1920, 1080), (1080, 1350)])
+def test_fit_layer_is_centered_inside_the_target(source, target):
+    plan = plan_geometry(source, target)
+    placed_w, placed_h = plan["placed_size"]
+    offset_x, offset_y = plan["fit_offset"]
+    assert placed_w <= target[0] and placed_h <= target[1]
+    assert abs(offset_x - (target[0] - placed_w - offset_x)) <= 1
+    assert abs(offset_y - (target[1] - placed_h - offset_y)) <= 1
+
+
+@pytest.mark.parametrize("rotation", [90, 270])
+def test_quarter_turns_plan_in_decoded_source_orientation(rotation):
+    # A portrait phone video stored as 1920x1080 with a rotation flag.
+    plan = plan_geometry((1920, 1080), (1080, 1920), rotation)
+    assert plan["fill_size"] == (1920, 1080)
+    assert plan["fill_box"] == pytest.approx((0, 0, 1920, 1080))
+    assert plan["fit_size"] == (1920, 1080)
+    assert plan["placed_size"] == (1080, 1920)
+    assert plan["fit_offset"] == (0, 0)
+
+
+def test_half_turn_keeps_the_target_orientation():
+    plan = plan_geometry((1920, 1080), (1080, 1920), 180)
+    assert plan["fill_size"] == (1080, 1920)
+    assert plan["placed_size"] == plan["fit_size"]
+
+
+@pytest.mark.parametrize(
+    "source, target, rotation, expected",
+    [
+        ((1920, 1080), (1280, 720), 0, True),
+        ((1921, 1081), (1920, 1080), 0, True),  # off by a pixel: just scale
+        ((1080, 1920), (1080, 1920), 0, True),
+        ((1920, 1080), (1080, 1920), 0, False),
+        ((1920, 1080), (1920, 1080), 90, False),
+        ((1920, 1000), (1920, 1080), 0, False),
+    ],
+)
+def test_trivial_geometry(source, target, rotation, expected):
+    assert is_trivial_geometry(source, target, rotation) is expected
+
+
+def test_capped_size_keeps_even_dimensions():
+    assert capped_size((1080, 1920), 1280) == (720, 1280)
+    assert capped_size((1080, 1350), 1001) == (800, 1000)
+    assert capped_size((1080, 1920), None) == (1080, 1920)
+    assert capped_size((720, 1280), 1920) == (720, 1280)
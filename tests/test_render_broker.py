@@ -0,0 +1,88 @@
+import time
+
+import pytest
+
+from render_broker import RenderBroker
+
+LEASE = 0.2
+
+
+@pytest.fixture
+def broker(tmp_path):
+    return RenderBroker(tmp_path / "farm.sqlite3", lease_seconds=LEASE)
+
+
+def enqueue(broker, job_id: str, index: int) -> str:
+    return broker.enqueue(job_id, index, {"upload_target": f"/nonexistent/{job_id}_{index}.mp4", "style": "blur"})
+
+
+def test_claims_are_fifo_and_one_file_per_job(broker):
+    first = enqueue(broker, "job-a", 0)
+    enqueue(broker, "job-a", 1)
+    other = enqueue(broker, "job-b", 0)
+    assert broker.claim("node-1")["task_id"] == first
+    # job-a already has a file out, so the next node gets job-b.
+    assert broker.claim("node-2")["task_id"] == other
+    assert broker.claim("node-3") is None
+    assert broker.finish(first, "node-1")
+    assert broker.claim("node-3")["index"] == 1
+
+
+def test_renew_extends_the_lease(broker):
+    task_id = enqueue(broker, "job", 0)
+    broker.claim("node-1")
+    for _ in range(3):
+        time.sleep(LEASE * 0.6)
+        assert broker.renew(task_id, "node-1") is not None
+    assert broker.claim("node-2") is None
+
+
+def test_expired_lease_is_reclaimed_and_the_first_node_is_locked_out(broker):
+    task_id = enqueue(broker, "job", 0)
+    assert broker.claim("node-1")["attempts"] == 1
+    time.sleep(LEASE * 1.5)
+
+    second = broker.claim("node-2")
+    assert second["task_id"] == task_id and second["attempts"] == 2
+    assert broker.renew(task_id, "node-1") is None
+    assert broker.get(task_id, "node-1") is None
+    assert not broker.finish(task_id, "node-1")
+
+    assert broker.renew(task_id, "node-2") is not None
+    assert broker.finish(task_id, "node-2")
+    assert broker.get(task_id) is None
+
+
+def test_drop_job_leaves_claimed_tasks_alone(broker):
+    claimed = enqueue(broker, "job", 0)
+    enqueue(broker, "job", 1)
+    broker.claim("node-1")
+    assert broker.drop_job("job") == 1
+    assert broker.get(claimed, "node-1") is not None
+    assert broker.pending() == []
+
+
+def test_farm_routes_answer_gone_to_a_node_that_lost_its_lease(broker, monkeypatch):
+    import app as autoframe
+
+    monkeypatch.setattr(autoframe, "RENDER_MODE", "farm")
+    monkeypatch.setattr(autoframe, "RENDER_FARM_TOKEN", "farm-secret")
+    monkeypatch.setattr(autoframe, "farm_broker", broker)
+    client = autoframe.app.test_client()
+
+    def post(node: str, path: str, payload: dict):
+        return client.post(path, json=payload, headers={"X-Farm-Token": "farm-secret", "X-Farm-Node": node})
+
+    task_id = enqueue(broker, "job", 0)
+    broker.claim("node-1")
+    assert post("node-1", f"/farm/tasks/{task_id}/progress", {}).status_code == 200
+    time.sleep(LEASE * 1.5)
+    broker.claim("node-2")
+
+    progress = post("node-1", f"/farm/tasks/{task_id}/progress", {})
+    assert progress.status_code == 410 and progress.get_json()["cancelled"] is True
+    assert post("node-1", f"/farm/tasks/{task_id}/complete", {"outputs": []}).status_code == 410
+    assert post("node-1", f"/farm/tasks/{task_id}/fail", {"error": "late"}).status_code == 410
+    # The task is still node-2's to finish.
+    assert broker.get(task_id, "node-2") is not None
+    assert post("node-2", f"/farm/tasks/{task_id}/progress", {}).status_code == 200